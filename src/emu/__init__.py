@@ -0,0 +1,20 @@
+'''!
+    @file       __init__.py
+
+    @brief      Emulation of the Nucleo and turret hardware, to run the pyb firmware on a PC
+
+    @details    The firmware in src/pyb is run unchanged on CPython. pyb, micropython and
+                utime are replaced by emulated modules, SPI goes to emulated TMC4210s with
+                limit switches, the Nerf gun fires through an emulated breakbeam and the
+                uart is an in-memory pipe. Time is virtual and skips ahead while the
+                firmware sleeps. From the src folder:
+                python -m emu f:draw.hpgl
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+from .board import Board
+from .clock import Clock, Halt
+from .emulator import Emulator
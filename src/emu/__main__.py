@@ -0,0 +1,79 @@
+'''!
+    @file       __main__.py
+
+    @brief      Runs the firmware on the emulated board from the command line
+
+    @details    Each command is sent over the uart after the one before it, then the
+                run goes on until the turret has been idle for a while. A summary of
+                the job and scheduler timing is printed at the end. With --serve the
+                uart is served to the PC programs instead, until the time limit:
+                python -m emu --serve tcp:5000
+                python pc/main.py tcp://localhost:5000
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import argparse
+import os
+import sys
+
+from .emulator import Emulator
+from .board import MAGAZINE, DART_TIME
+from .bridge import TcpBridge, PtyBridge
+
+
+def main():
+    '''!@brief      This function runs the commands given on the command line
+    '''
+    parser = argparse.ArgumentParser(prog='python -m emu', description='run the firmware on an emulated board')
+    parser.add_argument('commands', nargs='*', help='commands to send, such as f:draw.hpgl')
+    parser.add_argument('--start', type=float, default=0.5, help='time of the first command in s')
+    parser.add_argument('--gap', type=float, default=1.0, help='time between commands in s')
+    parser.add_argument('--time', type=float, default=3600, help='longest virtual time to run for in s')
+    parser.add_argument('--idle', type=float, default=10, help='stop after being idle this long in s')
+    parser.add_argument('--cpu-scale', type=float, default=1.0,
+                        help='virtual us per us of CPU time, 0 for repeatable runs')
+    parser.add_argument('--flash', help='folder to use as the flash, a new one if not given')
+    parser.add_argument('--magazine', type=int, default=MAGAZINE, help='darts in the gun')
+    parser.add_argument('--dart-time', type=float, default=DART_TIME, help='time for a dart to leave in ms')
+    parser.add_argument('--reload', type=float, help='reload the gun this many s after it runs empty')
+    parser.add_argument('--quiet', action='store_true', help='hide what the firmware prints')
+    parser.add_argument('--serve', help='serve the uart in real time on tcp:PORT or pty')
+    args = parser.parse_args()
+
+    bridge = None
+    idle = args.idle
+    if args.serve == 'pty':
+        bridge = PtyBridge()
+    elif args.serve:
+        bridge = TcpBridge(port=int(args.serve.split(':')[-1]))
+    if bridge is not None:
+        # commands come from the PC, so being idle doesn't end the run
+        idle = None
+        print('serving on ' + bridge.target, file=sys.stderr)
+
+    emulator = Emulator(args.flash, args.cpu_scale, args.magazine, args.dart_time, args.reload,
+                        bridge=bridge)
+    for i, command in enumerate(args.commands):
+        emulator.send(command + '\n', args.start + i * args.gap)
+    try:
+        if args.quiet:
+            with open(os.devnull, 'w') as log:
+                emulator.run(args.time, idle, log)
+        else:
+            emulator.run(args.time, idle)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if bridge is not None:
+            bridge.close()
+    replies = emulator.recv()
+    if replies:
+        print('replies: ' + replies.decode(errors='replace'))
+    print(emulator.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+'''!
+    @file       board.py
+
+    @brief      The emulated Nucleo and the turret hardware wired to it
+
+    @details    The board holds the pin levels, the external interrupts, the SPI bus
+                with both TMC4210s on it, the UART to the PC and the Nerf gun, wired up
+                the same way as Positioning.py and main.py expect. The devices are
+                stepped along with the virtual clock in steps of at most STEP_TIME, and
+                interrupts are run between the firmware's own calls into pyb, unless
+                they are disabled.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import collections
+import math
+
+from .clock import Clock, Halt
+from .tmc4210 import TMC4210
+
+# longest time the devices are stepped at once, in us
+STEP_TIME = 250
+# the system tick wakes wfi every ms
+TICK_TIME = 1000
+# clock of the timers, in Hz
+TIMER_CLOCK = 80000000
+
+# chip select: nINT, TMC2208 enable, left and right switch in steps from power up
+#   the switches are at the angles homed to by Positioning.py, -83/83 and -28/20 degrees
+AXES = {'C6': ('C8', 'C7', -369, 369),
+        'B6': ('B9', 'B7', -124, 89)}
+# the TMC4210 clock is made by Timer 1 on this pin
+CLOCK_PIN = 'B0'
+# Nerf gun pins
+SPOOL_PIN = 'C2'
+TRIGGER_PIN = 'C3'
+BEAM_PIN = 'C0'
+# uart the PC is connected to
+UART = 2
+
+# time from pulling the trigger until the dart breaks the beam, in ms
+DART_TIME = 60
+# how long a dart blocks the beam, in ms
+BEAM_TIME = 2
+MAGAZINE = 15
+
+
+class Blaster:
+    '''!@brief      The Nerf gun, firing a dart through the breakbeam on every trigger pull.
+        @details    Nothing comes out if the spool motor is off or the magazine is empty.
+    '''
+    def __init__(self, board, magazine=MAGAZINE, dart_time=DART_TIME):
+        '''!@brief      Initializes the gun with a full magazine
+            @param      board is the Board the gun is wired to
+            @param      magazine is the number of darts it holds
+            @param      dart_time is the time from the trigger to the beam, in ms
+        '''
+        self.board = board
+        self.capacity = magazine
+        self.darts = magazine
+        self.dart_time = dart_time
+        # times the beam was broken, in us
+        self.shots = []
+        self.jams = 0
+        # called once the magazine is empty
+        self.on_empty = None
+
+    def trigger(self, level):
+        '''!@brief      Fires a dart as the trigger is pulled
+            @param      level is the new level of the trigger pin
+        '''
+        if not level:
+            return
+        if not self.board.level(SPOOL_PIN) or not self.darts:
+            self.jams += 1
+            return
+        self.darts -= 1
+        t = self.board.time + self.dart_time * 1000
+        self.board.clock.call_at(t, self.beam, 0)
+        self.board.clock.call_at(t + BEAM_TIME * 1000, self.beam, 1)
+        if not self.darts and self.on_empty is not None:
+            self.on_empty(self)
+
+    def beam(self, level):
+        '''!@brief      Breaks or clears the beam
+            @param      level is the new level of the beam pin, low while broken
+        '''
+        if not level:
+            self.shots.append(self.board.time)
+        self.board.drive(BEAM_PIN, level)
+
+    def reload(self):
+        '''!@brief      Fills the magazine
+        '''
+        self.darts = self.capacity
+
+
+class Port:
+    '''!@brief      One side of the UART, with bytes taking the time of the baud rate.
+    '''
+    def __init__(self, board, baudrate=115200):
+        '''!@brief      Initializes an empty port
+            @param      board is the Board the port is on
+            @param      baudrate sets how long each byte takes, 10 bits a byte
+        '''
+        self.board = board
+        self.set_baudrate(baudrate)
+        # bytes on the wire as (time the first arrives, data)
+        self.wire = collections.deque()
+        self.free = 0.0
+        self.buffer = bytearray()
+        # largest number of bytes buffered, the rest are dropped
+        self.size = None
+        self.dropped = 0
+        self.received = 0
+        # called once the line goes idle after bytes arrive
+        self.on_idle = None
+
+    def set_baudrate(self, baudrate):
+        '''!@brief      Changes the baud rate
+            @param      baudrate in bits per second
+        '''
+        self.byte_time = 10e6 / baudrate
+
+    def send(self, data):
+        '''!@brief      Puts bytes on the wire, after those already on it
+            @param      data is the bytes to send
+        '''
+        if not data:
+            return
+        start = max(self.free, self.board.time) + self.byte_time
+        self.wire.append((start, bytes(data)))
+        self.free = start + (len(data) - 1) * self.byte_time
+        self.board.clock.call_at(self.free + self.byte_time, self.idle)
+
+    def idle(self, arg=None):
+        '''!@brief      Calls on_idle once the wire has gone quiet
+        '''
+        if self.board.time >= self.free + self.byte_time and self.on_idle is not None:
+            self.on_idle(self)
+
+    def receive(self):
+        '''!@brief      Moves the bytes that have arrived off the wire into the buffer
+        '''
+        t = self.board.time
+        while self.wire and self.wire[0][0] <= t:
+            start, data = self.wire[0]
+            n = min(len(data), int((t - start) / self.byte_time) + 1)
+            for c in data[:n]:
+                if self.size is not None and len(self.buffer) >= self.size:
+                    self.dropped += 1
+                else:
+                    self.buffer.append(c)
+            self.received += n
+            if n < len(data):
+                self.wire[0] = (start + n * self.byte_time, data[n:])
+                break
+            self.wire.popleft()
+
+    def any(self):
+        '''!@brief      Gets the number of bytes that can be read
+            @return     number of bytes
+        '''
+        self.receive()
+        return len(self.buffer)
+
+    def read(self, n=None):
+        '''!@brief      Reads bytes that have arrived
+            @param      n is the most bytes to read, all if not given
+            @return     the bytes, empty if none
+        '''
+        self.receive()
+        n = len(self.buffer) if n is None else min(n, len(self.buffer))
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def pending(self):
+        '''!@brief      Gets the number of bytes still on the wire
+            @return     number of bytes
+        '''
+        self.receive()
+        return sum(len(data) for _, data in self.wire)
+
+
+class Board:
+    '''!@brief      The emulated board, its pins and the devices wired to them.
+    '''
+    def __init__(self, cpu_scale=1.0, magazine=MAGAZINE, dart_time=DART_TIME, positions=None,
+                 realtime=False):
+        '''!@brief      Initializes the board as at power up
+            @param      cpu_scale is how many virtual us pass for every us of CPU time
+            @param      magazine is the number of darts in the gun
+            @param      dart_time is the time from the trigger to the beam, in ms
+            @param      positions maps a chip select to where its axis is at power up
+            @param      realtime is whether to keep to the wall clock
+        '''
+        self.clock = Clock(cpu_scale, realtime)
+        # time the devices have been stepped to, in us
+        self.time = 0.0
+        self.pins = {}
+        self.ext_ints = {}
+        # the ExtInt on each line number
+        self.ext_lines = {}
+        # interrupts waiting to run as (callback, line)
+        self.pending = collections.deque()
+        self.irq_enabled = True
+        self.in_irq = False
+        self.interrupts = 0
+        # stops the run once the virtual time gets here
+        self.deadline = None
+        # called every step with the board, may raise Halt
+        self.watch = None
+
+        self.positions = positions or {}
+        self.chips = {}
+        for cs, (nint, en, left, right) in AXES.items():
+            chip = TMC4210(left, right, self.positions.get(cs, 0),
+                           lambda level, pin=nint: self.drive(pin, level))
+            self.chips[cs] = chip
+            self.pins[nint] = 1
+        self.enables = {en: cs for cs, (nint, en, left, right) in AXES.items()}
+
+        self.blaster = Blaster(self, magazine, dart_time)
+        self.pins[BEAM_PIN] = 1
+        # MCU side and PC side of the uart
+        self.rx = Port(self)
+        self.tx = Port(self)
+        self.spi_baudrate = {}
+
+    def now(self):
+        '''!@brief      Brings the devices up to the virtual time
+            @return     virtual time in us
+        '''
+        self.advance(self.clock.now())
+        return self.time
+
+    def advance(self, t, wake=False):
+        '''!@brief      Steps the devices and timers up to a time
+            @param      t is the virtual time to get to, in us
+            @param      wake is whether to stop early once an interrupt is waiting
+            @return     boolean of whether it stopped for an interrupt
+        '''
+        while self.time < t:
+            end = min(t, self.time + STEP_TIME)
+            timer = self.clock.next_timer()
+            if timer is not None and timer < end:
+                end = max(timer, self.time)
+            # don't get ahead of the wall clock, bytes may still come over a bridge
+            if self.clock.realtime:
+                self.clock.skip_to(end)
+            dt = (end - self.time) / 1e6
+            self.time = end
+            for chip in self.chips.values():
+                chip.step(dt)
+            self.clock.run_due(end)
+            if self.watch is not None:
+                self.watch(self)
+            if self.deadline is not None and self.time >= self.deadline:
+                raise Halt
+            if wake and self.pending:
+                self.clock.skip_to(self.time)
+                break
+        self.run_interrupts()
+        return bool(wake and self.time < t)
+
+    def sleep(self, us):
+        '''!@brief      Sleeps, running interrupts as they come
+            @param      us is the time to sleep for
+        '''
+        self.now()
+        t = self.time + us
+        self.advance(t)
+        self.clock.skip_to(t)
+
+    def wait(self):
+        '''!@brief      Sleeps until an interrupt, or the next system tick
+        '''
+        self.now()
+        if self.pending:
+            self.run_interrupts()
+            return
+        t = (math.floor(self.time / TICK_TIME) + 1) * TICK_TIME
+        if not self.advance(t, True):
+            self.clock.skip_to(t)
+
+    def run_interrupts(self):
+        '''!@brief      Runs the interrupts that are waiting, if they are enabled
+        '''
+        if not self.irq_enabled or self.in_irq:
+            return
+        self.in_irq = True
+        try:
+            while self.pending:
+                callback, line = self.pending.popleft()
+                self.interrupts += 1
+                callback(line)
+        finally:
+            self.in_irq = False
+
+    def interrupt(self, callback, line):
+        '''!@brief      Queues an interrupt
+            @param      callback is the handler
+            @param      line is passed to the handler
+        '''
+        self.pending.append((callback, line))
+
+    def level(self, name):
+        '''!@brief      Gets the level of a pin
+            @param      name is the pin name
+            @return     0 or 1
+        '''
+        return self.pins.get(name, 0)
+
+    def set_pin(self, name, level):
+        '''!@brief      Sets the level of a pin from the firmware
+            @param      name is the pin name
+            @param      level is 0 or 1
+        '''
+        level = 1 if level else 0
+        self.now()
+        if self.pins.get(name) == level:
+            return
+        self.pins[name] = level
+        if name in self.enables:
+            # TMC2208 enable is active low
+            self.chips[self.enables[name]].enabled = not level
+        elif name == TRIGGER_PIN:
+            self.blaster.trigger(level)
+        self.edge(name, level)
+        self.run_interrupts()
+
+    def drive(self, name, level):
+        '''!@brief      Sets the level of an input pin from a device
+            @param      name is the pin name
+            @param      level is 0 or 1
+        '''
+        if self.pins.get(name) == level:
+            return
+        self.pins[name] = level
+        self.edge(name, level)
+
+    def edge(self, name, level):
+        '''!@brief      Queues the external interrupts of a pin change
+            @param      name is the pin name
+            @param      level is the new level
+        '''
+        for ext_int in self.ext_ints.get(name, ()):
+            if ext_int.enabled and ext_int.trigger & (ext_int.IRQ_RISING if level else ext_int.IRQ_FALLING):
+                self.interrupt(ext_int.callback, ext_int.line())
+
+    def spi_transfer(self, bus, buff):
+        '''!@brief      Sends a datagram to the chip selected on a bus
+            @param      bus is the SPI bus number
+            @param      buff is the datagram, replaced by the answer
+        '''
+        self.now()
+        for cs, chip in self.chips.items():
+            if self.pins.get(cs, 1) == 0:
+                chip.transfer(buff)
+                break
+        else:
+            # nothing selected, MISO floats high
+            for i in range(len(buff)):
+                buff[i] = 0xFF
+        # time on the bus
+        baudrate = self.spi_baudrate.get(bus)
+        if baudrate:
+            self.clock.skip_to(self.clock.now() + len(buff) * 8e6 / baudrate)
+
+    def start_clock(self, pin, freq):
+        '''!@brief      Starts a timer output, clocking the chips if it is their clock pin
+            @param      pin is the pin name
+            @param      freq is the frequency in Hz
+        '''
+        if pin == CLOCK_PIN:
+            self.now()
+            for chip in self.chips.values():
+                chip.set_clock(freq)
+
+    def is_idle(self):
+        '''!@brief      Checks that no axis is moving and no dart is in flight
+            @return     boolean of whether the turret is at rest
+        '''
+        return all(chip.is_idle() for chip in self.chips.values()) and self.clock.next_timer() is None
@@ -0,0 +1,177 @@
+'''!
+    @file       bridge.py
+
+    @brief      Connects the emulated uart to a TCP socket or a pseudo-terminal
+
+    @details    A bridge lets the PC programs talk to the emulated firmware the same
+                way they talk to the board, through transport.py in src/pc. It is
+                polled from the virtual clock every POLL_TIME. Bytes from the PC are
+                put on the emulated wire, where they take the time of the baud rate,
+                and bytes from the firmware are passed on as they come off the wire.
+                The board has to run in real time for this, see Clock.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import os
+import socket
+
+# time between polls, in us
+POLL_TIME = 1000
+# most bytes taken from the PC at once
+CHUNK = 4096
+
+
+class Bridge:
+    '''!@brief      Moves bytes between the emulated uart and the PC.
+    '''
+    def __init__(self):
+        '''!@brief      Initializes a bridge that isn't attached to a board
+        '''
+        self.board = None
+
+    def attach(self, board):
+        '''!@brief      Starts polling on a board's clock
+            @param      board is the emulated board
+        '''
+        self.board = board
+        board.clock.call_at(board.time, self.poll)
+
+    def poll(self, arg=None):
+        '''!@brief      Passes on the bytes waiting on either side
+        '''
+        board = self.board
+        data = self.receive()
+        if data:
+            board.rx.send(data)
+        data = board.tx.read()
+        if data:
+            self.transmit(data)
+        board.clock.call_at(board.time + POLL_TIME, self.poll)
+
+    def receive(self):
+        '''!@brief      Takes the bytes the PC has sent, without waiting
+            @return     the bytes, empty if none
+        '''
+        raise NotImplementedError
+
+    def transmit(self, data):
+        '''!@brief      Sends bytes to the PC, dropping them if it isn't connected
+            @param      data is the bytes
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''!@brief      Closes the bridge
+        '''
+
+
+class TcpBridge(Bridge):
+    '''!@brief      Serves the uart to one TCP client at a time.
+    '''
+    def __init__(self, host='localhost', port=0):
+        '''!@brief      Starts listening
+            @param      host is the address to listen on
+            @param      port is the port to listen on, any free one if 0
+        '''
+        super().__init__()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.server.setblocking(False)
+        self.client = None
+
+    @property
+    def target(self):
+        '''!@brief      Gets the address to give transport.open_link
+        '''
+        host, port = self.server.getsockname()[:2]
+        return 'tcp://' + host + ':' + str(port)
+
+    def receive(self):
+        '''!@brief      Takes the bytes the client has sent, accepting a new client if there is none
+            @return     the bytes, empty if none
+        '''
+        if self.client is None:
+            try:
+                self.client, _ = self.server.accept()
+            except BlockingIOError:
+                return b''
+            self.client.setblocking(False)
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            data = self.client.recv(CHUNK)
+        except BlockingIOError:
+            return b''
+        except OSError:
+            data = b''
+        if not data:
+            # disconnected, wait for the next client
+            self.client.close()
+            self.client = None
+        return data
+
+    def transmit(self, data):
+        '''!@brief      Sends bytes to the client
+            @param      data is the bytes
+        '''
+        if self.client is not None:
+            try:
+                self.client.sendall(data)
+            except OSError:
+                self.client.close()
+                self.client = None
+
+    def close(self):
+        '''!@brief      Stops listening and drops the client
+        '''
+        if self.client is not None:
+            self.client.close()
+        self.server.close()
+
+
+class PtyBridge(Bridge):
+    '''!@brief      Serves the uart on a Linux pseudo-terminal, opened like a serial port.
+    '''
+    def __init__(self):
+        '''!@brief      Opens a raw pseudo-terminal
+        '''
+        import tty
+        super().__init__()
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.name = os.ttyname(self.slave)
+
+    @property
+    def target(self):
+        '''!@brief      Gets the address to give transport.open_link
+        '''
+        return 'pty:' + self.name
+
+    def receive(self):
+        '''!@brief      Takes the bytes written to the terminal
+            @return     the bytes, empty if none
+        '''
+        try:
+            return os.read(self.master, CHUNK)
+        except (BlockingIOError, OSError):
+            return b''
+
+    def transmit(self, data):
+        '''!@brief      Writes bytes to the terminal, dropping them if its buffer is full
+            @param      data is the bytes
+        '''
+        try:
+            os.write(self.master, data)
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        '''!@brief      Closes the terminal
+        '''
+        os.close(self.master)
+        os.close(self.slave)
@@ -0,0 +1,89 @@
+'''!
+    @file       clock.py
+
+    @brief      Virtual time of the emulated board
+
+    @details    Time on the emulated board is counted in microseconds. It passes with
+                the CPU time the firmware takes on the PC, times cpu_scale, and jumps
+                ahead whenever the firmware sleeps in wfi or delay. A cpu_scale of 0
+                only lets time pass while sleeping, which makes runs repeatable. In real
+                time mode the virtual time is the wall clock, and sleeping really waits,
+                so the firmware can be driven from outside, such as over a bridge.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import heapq
+import time
+
+
+class Halt(BaseException):
+    '''!@brief      Raised from inside the firmware to end an emulation run
+        @details    It is a BaseException so the firmware can't catch it by accident.
+    '''
+
+
+class Clock:
+    '''!@brief      A virtual clock with timed callbacks.
+        @details    Callbacks are only called from run_due, so the board decides when
+                    they happen relative to the firmware.
+    '''
+    def __init__(self, cpu_scale=1.0, realtime=False):
+        '''!@brief      Initializes the clock at 0
+            @param      cpu_scale is how many virtual us pass for every us of CPU time
+            @param      realtime is whether to keep to the wall clock, ignoring cpu_scale
+        '''
+        self.cpu_scale = cpu_scale
+        self.realtime = realtime
+        # virtual time skipped while sleeping, in us
+        self.skipped = 0.0
+        self.start = time.perf_counter()
+        # (time, sequence, callback, argument)
+        self.timers = []
+        self.sequence = 0
+
+    def now(self):
+        '''!@brief      Gets the virtual time
+            @return     virtual time in us
+        '''
+        if self.realtime:
+            return (time.perf_counter() - self.start) * 1e6
+        if self.cpu_scale:
+            return self.skipped + (time.perf_counter() - self.start) * 1e6 * self.cpu_scale
+        return self.skipped
+
+    def skip_to(self, t):
+        '''!@brief      Jumps the virtual time ahead, as if sleeping
+            @param      t is the virtual time to jump to, in us
+        '''
+        now = self.now()
+        if t > now:
+            if self.realtime:
+                time.sleep((t - now) / 1e6)
+            else:
+                self.skipped += t - now
+
+    def call_at(self, t, callback, arg=None):
+        '''!@brief      Calls callback(arg) once the virtual time gets to t
+            @param      t is the virtual time, in us
+            @param      callback is the function to call
+            @param      arg is passed to callback
+        '''
+        self.sequence += 1
+        heapq.heappush(self.timers, (t, self.sequence, callback, arg))
+
+    def next_timer(self):
+        '''!@brief      Gets when the next callback is due
+            @return     virtual time in us, None if there are no callbacks
+        '''
+        return self.timers[0][0] if self.timers else None
+
+    def run_due(self, t):
+        '''!@brief      Calls every callback due by t, in order
+            @param      t is the virtual time, in us
+        '''
+        while self.timers and self.timers[0][0] <= t:
+            _, _, callback, arg = heapq.heappop(self.timers)
+            callback(arg)
@@ -0,0 +1,267 @@
+'''!
+    @file       emulator.py
+
+    @brief      Runs the pyb firmware on the PC against the emulated board
+
+    @details    The emulated pyb, micropython and utime modules are put in place of
+                the real ones and main.py is run as it is, with the flash folder as
+                the working directory. Commands are sent over the uart at set virtual
+                times, and the run ends at a time limit or once the turret has been
+                idle for a while after the last command. Every time a task is woken
+                with go, the time until the scheduler runs it is kept, so scheduler
+                latency can be reported along with the job times. With a bridge, the
+                board runs in real time and the uart is served to the PC programs.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import contextlib
+import gc
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+
+from . import micropython, pyb, utime
+from .board import Board, MAGAZINE, DART_TIME
+from .clock import Halt
+
+# firmware folder and the program run on it
+FIRMWARE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pyb')
+MAIN = os.path.join(FIRMWARE, 'main.py')
+# files copied onto a new flash folder
+FLASH_FILES = ('hpgl', 'ik.tbl', 'calibration.json')
+# modules the emulation replaces
+MODULES = {'pyb': pyb, 'micropython': micropython, 'utime': utime}
+# time between resume commands until a reloaded gun fires again, in s
+RESUME_TIME = 1
+
+
+class Emulator:
+    '''!@brief      Runs the firmware on an emulated board.
+    '''
+    def __init__(self, flash=None, cpu_scale=1.0, magazine=MAGAZINE, dart_time=DART_TIME,
+                 reload_time=None, positions=None, bridge=None):
+        '''!@brief      Initializes the emulator with a board at power up
+            @param      flash is the folder used as the flash, a new one is made if not given
+            @param      cpu_scale is how many virtual us pass for every us of CPU time
+            @param      magazine is the number of darts in the gun
+            @param      dart_time is the time from the trigger to the beam, in ms
+            @param      reload_time is how long reloading takes in s, None to never reload
+            @param      positions maps a chip select to where its axis is at power up
+            @param      bridge serves the uart to the PC in real time, see bridge.py
+        '''
+        self.board = Board(cpu_scale, magazine, dart_time, positions, bridge is not None)
+        self.bridge = bridge
+        if bridge is not None:
+            bridge.attach(self.board)
+        self.flash = flash
+        self.reload_time = reload_time
+        if reload_time is not None:
+            self.board.blaster.on_empty = self.empty
+        self.resume_from = None
+
+        # virtual times commands were sent
+        self.sent = []
+        self.unsent = 0
+        # stop once idle for this long after the last command, in us
+        self.idle_time = None
+        self.active = 0.0
+        # us from go to the run of each task, by name
+        self.latencies = {}
+        self.cotask = None
+        self.real_time = 0.0
+
+    def send(self, data, at=None):
+        '''!@brief      Sends bytes to the firmware uart
+            @param      data is the bytes or string to send
+            @param      at is the virtual time to send them at in s, straight away if not given
+        '''
+        if isinstance(data, str):
+            data = data.encode()
+        self.unsent += 1
+        self.board.clock.call_at(self.board.time if at is None else at * 1e6, self.transmit, data)
+
+    def transmit(self, data):
+        '''!@brief      Puts bytes on the wire once it is time to send them
+            @param      data is the bytes
+        '''
+        self.unsent -= 1
+        self.sent.append(self.board.time)
+        self.board.rx.send(data)
+
+    def recv(self):
+        '''!@brief      Receives the bytes the firmware had sent by the end of the run
+            @return     the bytes
+        '''
+        return self.board.tx.read()
+
+    def empty(self, blaster):
+        '''!@brief      Reloads the gun once it is empty, after reload_time
+            @param      blaster is the emulated gun
+        '''
+        self.board.clock.call_at(self.board.time + self.reload_time * 1e6, self.reloaded, blaster)
+
+    def reloaded(self, blaster):
+        '''!@brief      Fills the magazine and resumes the firmware
+            @param      blaster is the emulated gun
+        '''
+        blaster.reload()
+        self.resume_from = len(blaster.shots)
+        self.resume(blaster)
+
+    def resume(self, blaster):
+        '''!@brief      Sends resume until the gun fires again
+            @param      blaster is the emulated gun
+        '''
+        if len(blaster.shots) == self.resume_from and blaster.darts == blaster.capacity:
+            self.board.rx.send(b'r\n')
+            self.board.clock.call_at(self.board.time + RESUME_TIME * 1e6, self.resume, blaster)
+
+    def stop(self):
+        '''!@brief      Ends the run from another thread, at the next step of the board
+        '''
+        self.board.deadline = 0
+
+    def check_idle(self, board):
+        '''!@brief      Ends the run once nothing has happened for idle_time
+            @param      board is the emulated board
+        '''
+        shots = board.blaster.shots
+        if self.unsent or board.rx.wire or not all(chip.is_idle() for chip in board.chips.values()):
+            self.active = board.time
+        elif shots and shots[-1] > self.active:
+            self.active = shots[-1]
+        elif board.time - self.active > self.idle_time:
+            raise Halt
+
+    def run(self, until=None, idle=None, log=None, main=MAIN):
+        '''!@brief      Runs the firmware until a time limit or until idle
+            @param      until is the virtual time to stop at in s, None for no limit
+            @param      idle is how long to be idle after the last command before stopping in s
+            @param      log is a file the firmware prints to, stdout if not given
+            @param      main is the program to run
+        '''
+        board = self.board
+        board.deadline = None if until is None else until * 1e6
+        self.idle_time = None if idle is None else idle * 1e6
+        board.watch = None if idle is None else self.check_idle
+        if self.flash is None:
+            self.flash = make_flash()
+
+        saved = {name: sys.modules.get(name) for name in MODULES}
+        cwd = os.getcwd()
+        real = time.perf_counter()
+        unload_firmware()
+        try:
+            sys.modules.update(MODULES)
+            pyb.install(board)
+            micropython.install()
+            if not hasattr(gc, 'mem_free'):
+                gc.mem_free = lambda: 0
+            sys.path.insert(0, FIRMWARE)
+            os.chdir(self.flash)
+            self.instrument()
+            with contextlib.redirect_stdout(log or sys.stdout):
+                runpy.run_path(main, run_name='__main__')
+        except Halt:
+            pass
+        finally:
+            self.real_time += time.perf_counter() - real
+            os.chdir(cwd)
+            sys.path.remove(FIRMWARE)
+            unload_firmware()
+            for name, module in saved.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+
+    def instrument(self):
+        '''!@brief      Times how long tasks take to run once woken with go
+        '''
+        from task import cotask
+        self.cotask = cotask
+        board = self.board
+        latencies = self.latencies
+        woken = {}
+        go = cotask.Task.go
+        schedule = cotask.Task.schedule
+
+        def traced_go(task, source=None):
+            if task not in woken:
+                woken[task] = board.time
+            go(task, source)
+
+        def traced_schedule(task):
+            start = board.now()
+            ran = schedule(task)
+            # woken while it was running counts towards its next run
+            if ran and woken.get(task, start) < start:
+                latencies.setdefault(task.name, []).append(start - woken.pop(task))
+            return ran
+
+        cotask.Task.go = traced_go
+        cotask.Task.schedule = traced_schedule
+
+    def report(self):
+        '''!@brief      Describes the run
+            @return     the description
+        '''
+        board = self.board
+        virtual = board.time / 1e6
+        lines = ['virtual time: ' + '{:.2f}'.format(virtual) + ' s real time: '
+                 + '{:.2f}'.format(self.real_time) + ' s ('
+                 + '{:.1f}'.format(virtual / self.real_time if self.real_time else 0) + 'x)']
+
+        shots = board.blaster.shots
+        line = 'shots: ' + str(len(shots)) + ' jams: ' + str(board.blaster.jams)
+        if len(shots) > 1:
+            line += ' rate: ' + '{:.1f}'.format((len(shots) - 1) * 60e6 / (shots[-1] - shots[0])) + '/min'
+        if shots and self.sent:
+            line += ' job time: ' + '{:.2f}'.format((shots[-1] - self.sent[0]) / 1e6) + ' s'
+        lines.append(line)
+
+        for cs, chip in board.chips.items():
+            lines.append('axis ' + cs + ': ' + str(chip.transfers) + ' transfers ' + str(chip.steps)
+                         + ' steps, at ' + str(chip.position()) + ' drift '
+                         + '{:.0f}'.format(chip.offset - board.positions.get(cs, 0)))
+        lines.append('interrupts: ' + str(board.interrupts) + ' uart received: ' + str(board.rx.received)
+                     + ' dropped: ' + str(board.rx.dropped))
+
+        for name, times in sorted(self.latencies.items()):
+            times = sorted(times)
+            lines.append(name + ' latency: ' + str(len(times)) + ' wakes, mean '
+                         + '{:.0f}'.format(sum(times) / len(times)) + ' us, 99% '
+                         + '{:.0f}'.format(times[int(0.99 * (len(times) - 1))]) + ' us, max '
+                         + '{:.0f}'.format(times[-1]) + ' us')
+        if self.cotask is not None:
+            lines.append(str(self.cotask.task_list).rstrip())
+        return '\n'.join(lines)
+
+
+def make_flash():
+    '''!@brief      Makes a new flash folder with the files from the firmware folder
+        @return     path of the folder
+    '''
+    flash = tempfile.mkdtemp(prefix='flash-')
+    for name in FLASH_FILES:
+        path = os.path.join(FIRMWARE, name)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(flash, name))
+        elif os.path.isfile(path):
+            shutil.copy(path, flash)
+    return flash
+
+
+def unload_firmware():
+    '''!@brief      Forgets the firmware modules, so the next run imports them again
+    '''
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None) or ''
+        if name == 'task' or path.startswith(FIRMWARE + os.sep):
+            del sys.modules[name]
@@ -0,0 +1,74 @@
+'''!
+    @file       micropython.py
+
+    @brief      Emulated micropython module
+
+    @details    The code emitters run the functions as plain python. Viper type hints
+                such as ptr8 have to exist as names, so install puts them in builtins.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import builtins
+
+# viper types, only used as annotations
+VIPER_TYPES = {'ptr': bytearray, 'ptr8': bytearray, 'ptr16': bytearray, 'ptr32': bytearray,
+               'uint': int}
+
+
+def install():
+    '''!@brief      Puts the viper types into builtins
+    '''
+    for name, kind in VIPER_TYPES.items():
+        if not hasattr(builtins, name):
+            setattr(builtins, name, kind)
+
+
+def native(f):
+    '''!@brief      Runs f as it is
+    '''
+    return f
+
+
+viper = native
+asm_thumb = native
+
+
+def const(x):
+    '''!@brief      Gets x
+    '''
+    return x
+
+
+def alloc_emergency_exception_buf(size):
+    '''!@brief      Ignored
+    '''
+
+
+def opt_level(level=None):
+    '''!@brief      Ignored
+        @return     0
+    '''
+    return 0
+
+
+def schedule(func, arg):
+    '''!@brief      Calls func(arg) once interrupts allow
+    '''
+    from . import pyb
+    pyb.board.interrupt(func, arg)
+    return True
+
+
+def heap_lock():
+    '''!@brief      Ignored
+    '''
+
+
+def heap_unlock():
+    '''!@brief      Ignored
+        @return     0
+    '''
+    return 0
@@ -0,0 +1,423 @@
+'''!
+    @file       pyb.py
+
+    @brief      Emulated pyb module
+
+    @details    Only the parts of pyb the firmware uses are here. Everything goes to
+                the Board set by install, and time is the board's virtual time.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+from .board import TIMER_CLOCK
+
+# the board everything is wired to
+board = None
+
+
+def install(new_board):
+    '''!@brief      Connects the module to a board
+        @param      new_board is the Board
+    '''
+    global board
+    board = new_board
+
+
+def millis():
+    '''!@brief      Gets the virtual time
+        @return     ms since power up
+    '''
+    return int(board.now() // 1000)
+
+
+def micros():
+    '''!@brief      Gets the virtual time
+        @return     us since power up
+    '''
+    return int(board.now())
+
+
+def elapsed_millis(start):
+    '''!@brief      Gets the time since start
+        @param      start is a time from millis
+        @return     ms since start
+    '''
+    return millis() - start
+
+
+def elapsed_micros(start):
+    '''!@brief      Gets the time since start
+        @param      start is a time from micros
+        @return     us since start
+    '''
+    return micros() - start
+
+
+def delay(ms):
+    '''!@brief      Waits, running interrupts meanwhile
+        @param      ms is the time to wait
+    '''
+    board.sleep(ms * 1000)
+
+
+def udelay(us):
+    '''!@brief      Waits, running interrupts meanwhile
+        @param      us is the time to wait
+    '''
+    board.sleep(us)
+
+
+def wfi():
+    '''!@brief      Sleeps until the next interrupt
+    '''
+    board.wait()
+
+
+def disable_irq():
+    '''!@brief      Holds back interrupts
+        @return     whether they were enabled
+    '''
+    state = board.irq_enabled
+    board.irq_enabled = False
+    return state
+
+
+def enable_irq(state=True):
+    '''!@brief      Lets interrupts run again, running those that came meanwhile
+        @param      state is the value from disable_irq
+    '''
+    board.irq_enabled = state
+    if state:
+        board.run_interrupts()
+
+
+def freq():
+    '''!@brief      Gets the clocks
+        @return     sysclk, hclk, pclk1 and pclk2 in Hz
+    '''
+    return TIMER_CLOCK, TIMER_CLOCK, TIMER_CLOCK, TIMER_CLOCK
+
+
+def repl_uart(uart=None):
+    '''!@brief      Ignored, the REPL stays on stdout
+    '''
+
+
+def country(code=None):
+    '''!@brief      Ignored
+    '''
+
+
+def usb_mode(mode=None, **kwargs):
+    '''!@brief      Ignored
+    '''
+
+
+def main(path):
+    '''!@brief      Ignored
+    '''
+
+
+class Pin:
+    '''!@brief      A pin of the board, by name.
+    '''
+    IN = 0
+    OUT_PP = 1
+    OUT_OD = 0x11
+    AF_PP = 2
+    AF_OD = 0x12
+    ANALOG = 3
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, name, mode=IN, pull=PULL_NONE, value=None, **kwargs):
+        '''!@brief      Sets up a pin
+            @param      name is the pin name, such as 'C6'
+            @param      mode is the pin mode
+            @param      pull is the pull resistor
+            @param      value is the starting level of an output
+        '''
+        self._name = name.name() if isinstance(name, Pin) else name
+        self.mode = mode
+        if pull == Pin.PULL_UP and self._name not in board.pins:
+            board.pins[self._name] = 1
+        if value is not None:
+            board.set_pin(self._name, value)
+
+    def name(self):
+        '''!@brief      Gets the pin name
+            @return     the name
+        '''
+        return self._name
+
+    def value(self, level=None):
+        '''!@brief      Gets or sets the level
+            @param      level is the level to set, or None to get it
+            @return     the level if getting it
+        '''
+        if level is None:
+            board.now()
+            return board.level(self._name)
+        board.set_pin(self._name, level)
+
+    __call__ = value
+
+    def high(self):
+        '''!@brief      Sets the pin high
+        '''
+        board.set_pin(self._name, 1)
+
+    def low(self):
+        '''!@brief      Sets the pin low
+        '''
+        board.set_pin(self._name, 0)
+
+    on = high
+    off = low
+
+
+class ExtInt:
+    '''!@brief      An interrupt on the edges of a pin.
+    '''
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+    IRQ_RISING_FALLING = 3
+
+    def __init__(self, pin, mode, pull, callback):
+        '''!@brief      Sets up and enables the interrupt
+            @details    Like the board, each line number can only have one ExtInt, pins on
+                        the same number in different ports share a line.
+            @param      pin is the pin name or Pin
+            @param      mode is IRQ_RISING, IRQ_FALLING or IRQ_RISING_FALLING
+            @param      pull is the pull resistor
+            @param      callback is called with the line number, None frees the line
+        '''
+        self.pin = Pin(pin, Pin.IN, pull)
+        self.trigger = mode
+        self.callback = callback
+        self.enabled = callback is not None
+        line = self.line()
+        taken = board.ext_lines.get(line)
+        if callback is None:
+            if taken is not None:
+                board.ext_ints[taken.pin.name()].remove(taken)
+                del board.ext_lines[line]
+            return
+        if taken is not None:
+            raise OSError('ExtInt vector ' + str(line) + ' is already in use by Pin(' + taken.pin.name() + ')')
+        board.ext_lines[line] = self
+        board.ext_ints.setdefault(self.pin.name(), []).append(self)
+
+    def line(self):
+        '''!@brief      Gets the interrupt line
+            @return     the pin number
+        '''
+        return int(self.pin.name()[1:])
+
+    def enable(self):
+        '''!@brief      Enables the interrupt
+        '''
+        self.enabled = True
+
+    def disable(self):
+        '''!@brief      Disables the interrupt
+        '''
+        self.enabled = False
+
+    def swint(self):
+        '''!@brief      Triggers the interrupt from software
+        '''
+        board.interrupt(self.callback, self.line())
+        board.run_interrupts()
+
+
+class SPI:
+    '''!@brief      An SPI bus, talking to the chip whose chip select is low.
+    '''
+    CONTROLLER = MASTER = 1
+    PERIPHERAL = SLAVE = 0
+    MSB = 0
+    LSB = 0x80
+
+    def __init__(self, bus, mode=CONTROLLER, baudrate=328125, **kwargs):
+        '''!@brief      Sets up the bus
+            @param      bus is the bus number
+            @param      mode is CONTROLLER or PERIPHERAL
+            @param      baudrate sets how long each transfer takes
+        '''
+        self.bus = bus
+        board.spi_baudrate[bus] = baudrate
+
+    def send_recv(self, send, recv=None, timeout=5000):
+        '''!@brief      Sends a datagram and receives the answer
+            @param      send is the bytes to send
+            @param      recv is the buffer to receive into, may be send
+            @return     the received bytes
+        '''
+        if recv is None:
+            recv = bytearray(send)
+        elif recv is not send:
+            recv[:] = send
+        board.spi_transfer(self.bus, recv)
+        return recv
+
+
+class UART:
+    '''!@brief      The uart to the PC.
+    '''
+    IRQ_RXIDLE = 0x10
+
+    def __init__(self, bus, baudrate=9600, bits=8, parity=None, stop=1, timeout=0,
+                 timeout_char=0, read_buf_len=64, **kwargs):
+        '''!@brief      Sets up the uart
+            @param      bus is the uart number
+            @param      baudrate sets how long each byte takes
+            @param      timeout is how long reads wait for the first byte, in ms
+            @param      timeout_char is how long reads wait between bytes, in ms
+            @param      read_buf_len is the size of the receive buffer
+        '''
+        self.rx = board.rx
+        self.tx = board.tx
+        self.rx.set_baudrate(baudrate)
+        self.tx.set_baudrate(baudrate)
+        self.rx.size = read_buf_len
+        self.timeout = timeout
+        self.timeout_char = timeout_char
+
+    def irq(self, handler=None, trigger=IRQ_RXIDLE, hard=False):
+        '''!@brief      Calls handler once the line goes idle after receiving
+            @param      handler is called with the UART
+            @param      trigger must be IRQ_RXIDLE
+        '''
+        if handler is None:
+            self.rx.on_idle = None
+        else:
+            self.rx.on_idle = lambda port: board.interrupt(handler, self)
+
+    def any(self):
+        '''!@brief      Gets the number of bytes waiting
+            @return     number of bytes
+        '''
+        board.now()
+        return self.rx.any()
+
+    def wait(self, timeout):
+        '''!@brief      Waits for a byte to arrive
+            @param      timeout is the longest wait, in ms
+            @return     boolean of whether a byte arrived
+        '''
+        end = board.now() + timeout * 1000
+        while not self.rx.any() and board.time < end:
+            board.wait()
+        return self.rx.any() > 0
+
+    def readchar(self):
+        '''!@brief      Reads a byte
+            @return     the byte, -1 if none came before the timeout
+        '''
+        if not self.wait(self.timeout):
+            return -1
+        return self.rx.read(1)[0]
+
+    def read(self, n=None):
+        '''!@brief      Reads bytes
+            @param      n is the most bytes to read
+            @return     the bytes, None if none came before the timeout
+        '''
+        if not self.wait(self.timeout):
+            return None
+        data = bytearray(self.rx.read(n))
+        while (n is None or len(data) < n) and self.wait(self.timeout_char):
+            data += self.rx.read(None if n is None else n - len(data))
+        return bytes(data)
+
+    def readline(self):
+        '''!@brief      Reads up to and including a newline
+            @return     the bytes, None if none came before the timeout
+        '''
+        if not self.wait(self.timeout):
+            return None
+        data = bytearray()
+        while True:
+            c = self.rx.read(1)
+            data += c
+            if c == b'\n' or not self.rx.any() and not self.wait(self.timeout_char):
+                return bytes(data)
+
+    def readinto(self, buf, n=None):
+        '''!@brief      Reads bytes into a buffer
+            @param      buf is the buffer
+            @param      n is the most bytes to read
+            @return     number of bytes read, None if none came before the timeout
+        '''
+        data = self.read(len(buf) if n is None else min(n, len(buf)))
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        '''!@brief      Sends bytes to the PC
+            @param      data is the bytes
+            @return     number of bytes sent
+        '''
+        board.now()
+        self.tx.send(data)
+        return len(data)
+
+    def writechar(self, c):
+        '''!@brief      Sends a byte to the PC
+            @param      c is the byte
+        '''
+        self.write(bytes((c,)))
+
+
+class Timer:
+    '''!@brief      A timer, only its PWM outputs are emulated.
+    '''
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    OC_TOGGLE = 3
+
+    def __init__(self, n, freq=None, prescaler=0, period=0xFFFF, **kwargs):
+        '''!@brief      Sets up the timer
+            @param      n is the timer number
+            @param      freq is the frequency in Hz, instead of prescaler and period
+            @param      prescaler divides the timer clock
+            @param      period is the counter period less 1
+        '''
+        self.n = n
+        self.frequency = freq if freq is not None else TIMER_CLOCK / (prescaler + 1) / (period + 1)
+
+    def freq(self):
+        '''!@brief      Gets the frequency
+            @return     frequency in Hz
+        '''
+        return self.frequency
+
+    def channel(self, channel, mode=PWM, pin=None, **kwargs):
+        '''!@brief      Starts an output of the timer
+            @param      channel is the channel number
+            @param      mode is the channel mode
+            @param      pin is the Pin the output is on
+            @return     the channel
+        '''
+        if pin is not None:
+            board.start_clock(pin.name(), self.frequency)
+        return TimerChannel(self, channel)
+
+
+class TimerChannel:
+    '''!@brief      An output channel of a Timer.
+    '''
+    def __init__(self, timer, channel):
+        '''!@brief      Initializes the channel
+            @param      timer is the Timer
+            @param      channel is the channel number
+        '''
+        self.timer = timer
+        self.channel = channel
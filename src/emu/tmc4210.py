@@ -0,0 +1,363 @@
+'''!
+    @file       tmc4210.py
+
+    @brief      Emulated TMC4210 motion controller and the axis it drives
+
+    @details    The register file answers the same 32 bit datagrams as the chip, with
+                the status byte in front. The ramp generator is stepped in time by the
+                board: ramp and soft mode drive X_ACTUAL to X_TARGET within V_MIN, V_MAX
+                and A_MAX, braking at the PMUL_PDIV fraction of A_MAX, and velocity mode
+                drives V_ACTUAL to V_TARGET. The limit switches stop the axis and latch
+                X_ACTUAL into X_LATCHED, and the target reached and position compare
+                interrupts pull nINT low.
+
+                The axis only follows the steps while its TMC2208 is enabled, so steps
+                made while it is disabled show up as drift against the switches.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import math
+
+# registers, as in StepperDriver.py
+X_TARGET = 0x00
+X_ACTUAL = 0x01
+V_MIN = 0x02
+V_MAX = 0x03
+V_TARGET = 0x04
+V_ACTUAL = 0x05
+A_MAX = 0x06
+A_ACTUAL = 0x07
+PMUL_PDIV = 0x09
+REFCONF_RAMPMODE = 0x0A
+INTERRUPT_MASK_FLAGS = 0x0B
+PULSE_RAMP_DIV = 0x0C
+X_LATCHED = 0x0E
+POS_COMP_4210 = 0x35
+POS_COMP_INT_4210 = 0x36
+TYPE_VERSION = 0x39
+REFERENCE_SWITCHES = 0x3E
+
+# ramp modes
+RAMP_MODE = 0b00
+SOFT_MODE = 0b01
+VELOCITY_MODE = 0b10
+HOLD_MODE = 0b11
+
+# REF_CONF bits of REFCONF_RAMPMODE
+DISABLE_STOP_L = 0x100
+DISABLE_STOP_R = 0x200
+REF_RNL = 0x800
+# set while waiting for the reference switch to latch
+LATCH_ARMED = 0x10000
+
+INT_POS_END = 0x01
+POS_COMP_FLAG = 0x01
+POS_COMP_MASK = 0x100
+
+STATUS_XEQT = 0x01
+STATUS_RS = 0x02
+STATUS_INT = 0x80
+
+VERSION = 0x429101
+
+
+def sign_extend(val, width):
+    '''!@brief      Sign extends a register value
+        @param      val the value
+        @param      width the number of bits of the value
+        @return     the signed value
+    '''
+    val &= (1 << width) - 1
+    if val & (1 << (width - 1)):
+        val -= 1 << width
+    return val
+
+
+class TMC4210:
+    '''!@brief      An emulated TMC4210 with one axis.
+    '''
+    def __init__(self, left, right, position=0, on_nint=None):
+        '''!@brief      Initializes the chip as after power up
+            @param      left is where the left switch is, in steps from power up
+            @param      right is where the right switch is, in steps from power up
+            @param      position is where the axis is at power up, in steps
+            @param      on_nint is called with the level whenever nINT changes
+        '''
+        self.regs = [0] * 64
+        self.regs[TYPE_VERSION] = VERSION
+        self.left = left
+        self.right = right
+        self.on_nint = on_nint
+
+        # X_ACTUAL, and the velocity in steps/s
+        self.x = 0.0
+        self.v = 0.0
+        # where the axis really is, less X_ACTUAL
+        self.offset = float(position)
+        # the TMC2208 passes the steps on
+        self.enabled = False
+        # clock of the chip, nothing moves without it
+        self.f_clk = 0
+
+        self.target = 0
+        self.flags = 0
+        self.compare = 0
+        self.compare_flag = 0
+        self.nint = 1
+        # the target was reached since X_TARGET was written
+        self.arrived = True
+        self.transfers = 0
+        self.steps = 0
+        self.units()
+
+    def units(self):
+        '''!@brief      Works out the step rates of the limits from the registers
+        '''
+        pulse_div = self.regs[PULSE_RAMP_DIV] >> 12 & 0x0F
+        ramp_div = self.regs[PULSE_RAMP_DIV] >> 8 & 0x0F
+        self.v_unit = self.f_clk / (pow(2, pulse_div) * 2048 * 32)
+        self.a_unit = self.f_clk * self.f_clk / pow(2, pulse_div + ramp_div + 29)
+        self.v_min = (self.regs[V_MIN] & 0x7FF) * self.v_unit
+        self.v_max = (self.regs[V_MAX] & 0x7FF) * self.v_unit
+        self.v_target = sign_extend(self.regs[V_TARGET], 12) * self.v_unit
+        self.a_max = (self.regs[A_MAX] & 0x7FF) * self.a_unit
+
+        # braking uses PMUL/PDIV instead of A_MAX
+        self.brake = self.a_max
+        pmul = self.regs[PMUL_PDIV] >> 8 & 0xFF
+        a_max = self.regs[A_MAX] & 0x7FF
+        if pmul and a_max:
+            p = a_max / (128 * pow(2, ramp_div - pulse_div))
+            self.brake = self.a_max * pmul / pow(2, 3 + (self.regs[PMUL_PDIV] & 0x0F)) / p
+
+    def mode(self):
+        '''!@brief      Gets the ramp mode
+            @return     the RAMP_MODE bits
+        '''
+        return self.regs[REFCONF_RAMPMODE] & 0b11
+
+    def position(self):
+        '''!@brief      Gets X_ACTUAL
+            @return     the actual position in steps
+        '''
+        return int(math.floor(self.x + 0.5))
+
+    def switches(self):
+        '''!@brief      Gets which switches the axis is on
+            @return     whether the left and the right switch are pressed
+        '''
+        p = self.x + self.offset
+        return p <= self.left, p >= self.right
+
+    def status(self):
+        '''!@brief      Gets the status byte sent with every datagram
+            @return     the status byte
+        '''
+        left, right = self.switches()
+        status = STATUS_XEQT if self.position() == self.target else 0
+        if right if self.regs[REFCONF_RAMPMODE] & REF_RNL else left:
+            status |= STATUS_RS
+        if not self.nint:
+            status |= STATUS_INT
+        return status
+
+    def transfer(self, buff):
+        '''!@brief      Answers a datagram in place
+            @param      buff is the 4 byte datagram, replaced by the answer
+        '''
+        self.transfers += 1
+        status = self.status()
+        reg = buff[0] >> 1 & 0x3F
+        if buff[0] & 0x01:
+            data = self.read(reg)
+        else:
+            self.write(reg, buff[1] << 16 | buff[2] << 8 | buff[3])
+            data = 0
+        buff[0] = status
+        buff[1] = data >> 16 & 0xFF
+        buff[2] = data >> 8 & 0xFF
+        buff[3] = data & 0xFF
+
+    def read(self, reg):
+        '''!@brief      Reads a register
+            @param      reg is the register address
+            @return     the 24 bit value
+        '''
+        if reg == X_ACTUAL:
+            d = self.position()
+        elif reg == V_ACTUAL:
+            d = round(self.v / self.v_unit) if self.v_unit else 0
+        elif reg == A_ACTUAL:
+            d = round(self.a_max / self.a_unit) if self.v and self.a_unit else 0
+        elif reg == INTERRUPT_MASK_FLAGS:
+            d = self.regs[reg] & 0xFF00 | self.flags
+        elif reg == POS_COMP_INT_4210:
+            d = self.regs[reg] & POS_COMP_MASK | self.compare_flag
+        elif reg == REFERENCE_SWITCHES:
+            left, right = self.switches()
+            d = (1 if left else 0) | (2 if right else 0)
+        else:
+            d = self.regs[reg]
+        return d & 0xFFFFFF
+
+    def write(self, reg, d):
+        '''!@brief      Writes a register
+            @param      reg is the register address
+            @param      d is the 24 bit value
+        '''
+        if reg == X_ACTUAL:
+            # the axis stays where it is
+            x = sign_extend(d, 24)
+            self.offset += self.x - x
+            self.x = float(x)
+        elif reg == X_LATCHED:
+            self.regs[REFCONF_RAMPMODE] |= LATCH_ARMED
+        elif reg == REFCONF_RAMPMODE:
+            self.regs[reg] = self.regs[reg] & LATCH_ARMED | d & 0xFFFF
+        elif reg == INTERRUPT_MASK_FLAGS:
+            self.regs[reg] = d & 0xFF00
+            # flags are cleared by writing 1
+            self.flags &= ~d & 0xFF
+        elif reg == POS_COMP_INT_4210:
+            self.regs[reg] = d & POS_COMP_MASK
+            if d & POS_COMP_FLAG:
+                self.compare_flag = 0
+        else:
+            self.regs[reg] = d
+        if reg == X_TARGET:
+            self.target = sign_extend(d, 24)
+            self.arrived = False
+        elif reg == POS_COMP_4210:
+            self.compare = sign_extend(d, 24)
+            if self.position() == self.compare:
+                self.compare_flag = 1
+        elif reg in (V_MIN, V_MAX, V_TARGET, A_MAX, PMUL_PDIV, PULSE_RAMP_DIV):
+            self.units()
+        self.check_target()
+        self.update_nint()
+
+    def set_clock(self, f_clk):
+        '''!@brief      Starts or changes the clock of the chip
+            @param      f_clk is the clock in Hz
+        '''
+        self.f_clk = f_clk
+        self.units()
+
+    def is_idle(self):
+        '''!@brief      Checks if stepping would change anything
+            @return     boolean of whether the axis is at rest
+        '''
+        if not self.f_clk or self.v:
+            return not self.f_clk
+        mode = self.mode()
+        if mode == VELOCITY_MODE:
+            return self.v_target == 0 or self.blocked(self.v_target)
+        if mode == HOLD_MODE:
+            return True
+        return self.position() == self.target and self.x == self.target
+
+    def blocked(self, direction):
+        '''!@brief      Checks if a switch stops the axis going a way
+            @param      direction is the sign of the velocity
+            @return     boolean of whether the axis is stopped
+        '''
+        left, right = self.switches()
+        conf = self.regs[REFCONF_RAMPMODE]
+        if direction > 0:
+            return right and not conf & DISABLE_STOP_R
+        return direction < 0 and left and not conf & DISABLE_STOP_L
+
+    def step(self, dt):
+        '''!@brief      Runs the ramp generator
+            @param      dt is the time to run it for, in s
+        '''
+        if self.is_idle():
+            return
+        mode = self.mode()
+        v = self.v
+        if mode == VELOCITY_MODE:
+            target = max(-self.v_max, min(self.v_max, self.v_target))
+            dv = self.a_max * dt
+            v = min(target, v + dv) if v < target else max(target, v - dv)
+            dx = (self.v + v) / 2 * dt
+        elif mode == HOLD_MODE:
+            dx = v * dt
+        else:
+            r = self.target - self.x
+            direction = 1 if r > 0 else -1
+            speed = v * direction
+            if speed < 0:
+                # turn around first
+                speed = min(0.0, speed + self.a_max * dt)
+            else:
+                # speed up, but no faster than it can still stop from
+                if self.mode() == SOFT_MODE:
+                    limit = abs(r) * self.brake / self.v_max if self.v_max else 0
+                else:
+                    limit = math.sqrt(2 * self.brake * abs(r))
+                speed = max(self.v_min, min(speed + self.a_max * dt, self.v_max, limit))
+            dx = speed * direction * dt
+            if speed > 0 and abs(dx) >= abs(r):
+                dx = r
+                speed = 0.0
+            v = speed * direction
+
+        # switches stop the axis dead
+        if self.blocked(dx):
+            v = 0.0
+            dx = 0.0
+        self.v = v
+        if dx:
+            self.move(dx)
+        self.check_target()
+        self.update_nint()
+
+    def move(self, dx):
+        '''!@brief      Moves X_ACTUAL, following it with the axis, switches and compare
+            @param      dx is the distance in steps
+        '''
+        before = self.position()
+        self.x += dx
+        if not self.enabled:
+            self.offset -= dx
+        after = self.position()
+        self.steps += abs(after - before)
+
+        # stop at the switch once it is pressed
+        left, right = self.switches()
+        if dx > 0 and right and not self.regs[REFCONF_RAMPMODE] & DISABLE_STOP_R:
+            self.v = 0.0
+        elif dx < 0 and left and not self.regs[REFCONF_RAMPMODE] & DISABLE_STOP_L:
+            self.v = 0.0
+
+        # latch the position as the armed switch is pressed
+        conf = self.regs[REFCONF_RAMPMODE]
+        if conf & LATCH_ARMED and (right if conf & REF_RNL else left):
+            self.regs[X_LATCHED] = after & 0xFFFFFF
+            self.regs[REFCONF_RAMPMODE] &= ~LATCH_ARMED
+
+        # compare when the position gets to it
+        if before != after and min(before, after) <= self.compare <= max(before, after) \
+                and before != self.compare:
+            self.compare_flag = 1
+
+    def check_target(self):
+        '''!@brief      Flags the target as reached once X_ACTUAL gets there
+        '''
+        if not self.arrived and self.mode() in (RAMP_MODE, SOFT_MODE) and self.position() == self.target:
+            self.arrived = True
+            self.flags |= INT_POS_END
+
+    def update_nint(self):
+        '''!@brief      Sets nINT from the unmasked interrupts
+        '''
+        mask = self.regs[INTERRUPT_MASK_FLAGS] >> 8
+        active = self.flags & mask or self.compare_flag and self.regs[POS_COMP_INT_4210] & POS_COMP_MASK
+        nint = 0 if active else 1
+        if nint != self.nint:
+            self.nint = nint
+            if self.on_nint is not None:
+                self.on_nint(nint)
@@ -0,0 +1,67 @@
+'''!
+    @file       utime.py
+
+    @brief      Emulated utime module, on the board's virtual time
+
+    @details    Ticks don't wrap, so ticks_diff and ticks_add are plain arithmetic.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+from . import pyb
+
+
+def ticks_us():
+    '''!@brief      Gets the virtual time in us
+    '''
+    return pyb.micros()
+
+
+def ticks_ms():
+    '''!@brief      Gets the virtual time in ms
+    '''
+    return pyb.millis()
+
+
+def ticks_cpu():
+    '''!@brief      Gets the virtual time in us
+    '''
+    return pyb.micros()
+
+
+def ticks_diff(end, start):
+    '''!@brief      Gets end less start
+    '''
+    return end - start
+
+
+def ticks_add(ticks, delta):
+    '''!@brief      Gets ticks plus delta
+    '''
+    return ticks + delta
+
+
+def sleep(s):
+    '''!@brief      Waits s seconds
+    '''
+    pyb.board.sleep(s * 1e6)
+
+
+def sleep_ms(ms):
+    '''!@brief      Waits ms milliseconds
+    '''
+    pyb.delay(ms)
+
+
+def sleep_us(us):
+    '''!@brief      Waits us microseconds
+    '''
+    pyb.udelay(us)
+
+
+def time():
+    '''!@brief      Gets the virtual time in s
+    '''
+    return pyb.millis() // 1000
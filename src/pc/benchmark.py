@@ -0,0 +1,204 @@
+'''!
+    @file       benchmark.py
+
+    @brief      Times the link to the MCU end to end
+
+    @details    Measures the round trip of a command, the speed of uploading an HPGL
+                file with the u command and, against the emulated firmware, the time
+                from the camera deciding to fire until the dart breaks the beam.
+                An unknown command is used as a ping, as the firmware answers it
+                straight away. With --emulator the firmware is run here, served over
+                a TCP socket or a pseudo-terminal, otherwise the target is opened with
+                transport.py as main.py would:
+                python benchmark.py --emulator tcp --upload ../pyb/hpgl/smiley.hpgl
+                python benchmark.py COM3 --upload ../pyb/hpgl/smiley.hpgl
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import argparse
+import os
+import sys
+import threading
+import time
+
+from transport import open_link, BAUDRATE
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+PING = b'x\n'
+PING_REPLY = b'x: unknown command'
+# what camera.py sends once it is on target
+FIRE = 'd:0.0,0.0,1'
+# s to wait after the upload command, the firmware waits 100 ms before reading it
+UPLOAD_DELAY = 0.2
+# s to wait for the emulated firmware to answer after starting, it homes first
+BOOT_TIME = 60
+# s to wait for a dart
+SHOT_TIMEOUT = 20
+
+
+def ping(link, timeout=None):
+    '''!@brief      Times one command round trip
+        @param      link is the Link to the MCU
+        @param      timeout is the longest wait in s, the link timeout if not given
+        @return     the round trip in s, None if there was no answer
+    '''
+    start = time.perf_counter()
+    link.write(PING)
+    if not link.read_until(PING_REPLY, timeout).endswith(PING_REPLY):
+        return None
+    return time.perf_counter() - start
+
+
+def wait_ready(link, timeout=BOOT_TIME):
+    '''!@brief      Pings until the firmware answers
+        @param      link is the Link to the MCU
+        @param      timeout is the longest wait in s
+        @return     boolean of whether it answered
+    '''
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        if ping(link) is not None:
+            return True
+    return False
+
+
+def upload(link, name, data):
+    '''!@brief      Uploads a file with the u command and waits until it is written
+        @details    HPGL ends commands with ; so newlines are left out, the firmware
+                    stops at the first one. A ping after the data shows the firmware
+                    has finished writing, so the time includes one round trip.
+        @param      link is the Link to the MCU
+        @param      name is the name to save the file as
+        @param      data is the contents
+        @return     the time from the first byte of data until written in s, None on no answer
+    '''
+    data = data.replace(b'\r', b'').replace(b'\n', b'')
+    link.write(('u:' + name + '\n').encode())
+    time.sleep(UPLOAD_DELAY)
+    start = time.perf_counter()
+    link.write(data + b'\n')
+    if ping(link, 10 + len(data) * 10 / BAUDRATE) is None:
+        return None
+    return time.perf_counter() - start
+
+
+def shoot(link, board, n):
+    '''!@brief      Times from sending a fire command until the dart breaks the beam
+        @param      link is the Link to the emulated firmware
+        @param      board is the emulated board, running in real time
+        @param      n is the number of shots
+        @return     list of the times in s, shorter if a dart didn't come
+    '''
+    shots = board.blaster.shots
+    times = []
+    # the first shot waits for homing and the spool motor, so it isn't counted
+    for i in range(n + 1):
+        count = len(shots)
+        start = time.perf_counter()
+        link.write(FIRE.encode())
+        while len(shots) == count and time.perf_counter() - start < SHOT_TIMEOUT:
+            time.sleep(0.001)
+        if len(shots) == count:
+            break
+        # virtual time is the wall clock since the board's clock started
+        times.append(board.clock.start + shots[count] / 1e6 - start)
+    return times[1:]
+
+
+def describe(name, times):
+    '''!@brief      Summarizes a list of times
+        @param      name is what was timed
+        @param      times is the list in s
+        @return     the summary
+    '''
+    if not times:
+        return name + ': no answer'
+    times = sorted(times)
+    return (name + ': ' + str(len(times)) + ' runs, mean ' + '{:.1f}'.format(sum(times) / len(times) * 1e3)
+            + ' ms, min ' + '{:.1f}'.format(times[0] * 1e3) + ' ms, max ' + '{:.1f}'.format(times[-1] * 1e3) + ' ms')
+
+
+def run(link, args, board=None, flash=None):
+    '''!@brief      Runs the benchmarks
+        @param      link is the Link to the MCU
+        @param      args are the command line arguments
+        @param      board is the emulated board, None for real hardware
+        @param      flash is the emulated flash folder
+        @return     list of result lines
+    '''
+    lines = []
+    if not wait_ready(link, BOOT_TIME if board is not None else link.timeout):
+        return ['no answer from ' + args.target]
+    lines.append(describe('round trip', [t for t in (ping(link) for i in range(args.pings)) if t is not None]))
+
+    if args.upload:
+        with open(args.upload, 'rb') as file:
+            data = file.read()
+        name = os.path.basename(args.upload)
+        if board is not None:
+            name = 'bench-' + name
+        t = upload(link, name, data)
+        size = len(data.replace(b'\r', b'').replace(b'\n', b''))
+        if t is None:
+            lines.append('upload: no answer')
+        else:
+            line = ('upload: ' + str(size) + ' bytes in ' + '{:.1f}'.format(t * 1e3) + ' ms, '
+                    + '{:.0f}'.format(size / t) + ' bytes/s')
+            if flash is not None:
+                with open(os.path.join(flash, 'hpgl', name), 'rb') as file:
+                    line += ', intact' if file.read() == data.replace(b'\r', b'').replace(b'\n', b'') else ', corrupted'
+            lines.append(line)
+
+    if board is not None and args.shots:
+        lines.append(describe('camera to shot', shoot(link, board, args.shots)))
+    return lines
+
+
+def main():
+    '''!@brief      This function runs the benchmarks given on the command line
+    '''
+    parser = argparse.ArgumentParser(description='time the link to the MCU')
+    parser.add_argument('target', nargs='?', help='serial port, pty:path or tcp://host:port')
+    parser.add_argument('--emulator', choices=('tcp', 'pty'), help='run the emulated firmware, served over this')
+    parser.add_argument('--emulate-baudrate', action='store_true', help='pace the link to the baud rate')
+    parser.add_argument('--pings', type=int, default=20, help='round trips to time')
+    parser.add_argument('--upload', help='HPGL file to upload')
+    parser.add_argument('--shots', type=int, default=5, help='shots to time, emulator only')
+    args = parser.parse_args()
+    if args.target is None and args.emulator is None:
+        parser.error('give a target or --emulator')
+    if args.upload:
+        args.upload = os.path.abspath(args.upload)
+
+    if args.emulator is None:
+        with open_link(args.target, emulate_baudrate=args.emulate_baudrate) as link:
+            print('\n'.join(run(link, args)))
+        return
+
+    from emu import Emulator
+    from emu.bridge import TcpBridge, PtyBridge
+    from emu.emulator import make_flash
+    bridge = TcpBridge() if args.emulator == 'tcp' else PtyBridge()
+    args.target = bridge.target
+    emulator = Emulator(make_flash(), bridge=bridge)
+    # the firmware prints to stdout, so the results are printed once it has stopped
+    with open(os.devnull, 'w') as log:
+        thread = threading.Thread(target=emulator.run, kwargs={'log': log})
+        thread.start()
+        try:
+            with open_link(args.target, emulate_baudrate=args.emulate_baudrate) as link:
+                lines = run(link, args, emulator.board, emulator.flash)
+        finally:
+            emulator.stop()
+            thread.join()
+            bridge.close()
+    print('target: ' + args.target)
+    print('\n'.join(lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+'''!
+    @file       build_ik_table.py
+
+    @brief      Program runs on the PC and builds the inverse kinematics table for the MCU
+
+    @details    This program runs build_ik_table from ProcessesHPGL.py ahead of time on the
+                PC, where numpy makes it quick. Copy the table to the root of the board's
+                flash as ik.tbl, and ProcessesHPGL.py looks points up in it instead of
+                solving them. The table is only used if it was built for the same d, l
+                and h as the firmware.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pyb'))
+
+from ProcessesHPGL import build_ik_table, IK_TABLE
+
+
+def main():
+    '''!@brief      This function builds the table with the grid given on the command line
+    '''
+    parser = argparse.ArgumentParser(description='build the inverse kinematics table')
+    parser.add_argument('table', nargs='?', default=IK_TABLE, help='table file to write (default: ' + IK_TABLE + ')')
+    parser.add_argument('--x-range', type=float, nargs=2, metavar=('MIN', 'MAX'),
+                        default=(-150, 150), help='x coordinates covered by the grid')
+    parser.add_argument('--y-range', type=float, nargs=2, metavar=('MIN', 'MAX'),
+                        default=(-55, 35), help='y coordinates covered by the grid')
+    parser.add_argument('--step', type=float, default=2.5, help='spacing between grid points')
+    args = parser.parse_args()
+
+    max_error = build_ik_table(args.table, args.x_range, args.y_range, args.step)
+    print('wrote ' + args.table + ' (' + str(os.path.getsize(args.table)) + ' bytes), '
+          + 'estimated max error ' + str(round(max_error, 3)) + ' deg')
+
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,25 @@
                 field of view of the camera, a direct polar and azimuthal coordinate can be sent over. 
                 The program will only begin scanning for the red object when it detects that there is no motion. 
                 This allows for it to recalculate a new angle once the stepper motors have moved to a new point.
-                The instruction are sent through serial to the MCU. 
+                The instruction are sent through serial to the MCU, see transport.py. 
                 
     @author     Alex Radovan
     @author     Daniel Xu
     @date       02/23/2022
 '''
+import argparse
 import cv2
 import imutils
 import numpy as np
-import serial
-import sys
+
+from transport import open_link
+
+# Link to the MCU, kept open between instructions
+parser = argparse.ArgumentParser(description='shoot at red targets seen by the camera')
+parser.add_argument('target', help='serial port, pty:path or tcp://host:port')
+parser.add_argument('--emulate-baudrate', action='store_true', help='pace the link to the baud rate')
+args = parser.parse_args()
+ser = open_link(args.target, emulate_baudrate=args.emulate_baudrate)
 
 # Create Window
 cv2.namedWindow("scope")
@@ -167,8 +175,7 @@ while rval:
             # Create instructions to send to MCU
             instr = 'd:' + str(polar*-1) + ',' + str(azimuth*-1) + ',' + str(fire)
             print(instr)
-            with serial.Serial(sys.argv[1], 115200, 8, 'N', 1) as ser:
-                ser.write(instr.encode())
+            ser.write(instr.encode())
 
             # Clear INSTR
             polar = 0
@@ -195,3 +202,4 @@ while rval:
 
 vc.release()
 cv2.destroyWindow("scope")
+ser.close()
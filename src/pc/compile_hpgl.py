@@ -0,0 +1,116 @@
+'''!
+    @file       compile_hpgl.py
+
+    @brief      Program runs on the PC and compiles an HPGL file into a shot plan for the MCU
+
+    @details    This program runs the same parsing, filtering, interpolation and inverse
+                kinematics as ProcessesHPGL.py, but ahead of time on the PC. The result is
+                a packed binary plan holding the step target of each axis and the fire flags
+                for every shot, so the MCU only has to stream it from flash. Copy the plan
+                into the hpgl folder on the board and draw it with f:name.plan.
+
+                Steps are computed for the step range given for each axis. The defaults
+                assume the nominal 1600 steps per revolution; the ranges found by
+                calibration (printed as found left/right) can be passed instead, and the MCU
+                adjusts the plan if its own calibration is different.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import argparse
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pyb'))
+
+import ProcessesHPGL
+from ProcessesHPGL import read_points, filter_hpgl, interpolate, solve_segment, \
+    sweep_flags, PLAN_HEADER, PLAN_MAGIC, PLAN_RECORD, FIRE
+from Motion import steps_per_degree
+
+# steps in a single revolution of either axis
+STEPS_PER_ROTATION = 360 * steps_per_degree()
+
+# angles of the limit switches, as calibrated by Positioning.py
+POLAR_RANGE = (-83, 83)
+AZIMUTHAL_RANGE = (-28, 20)
+
+
+def map_range(v, x1, x2, y1, y2):
+    '''!@brief      maps the range, the same way as StepperDriver.map_range
+        @return     returns the mapped range
+    '''
+    return int(y1 + ((v - x1) * (y2 - y1)) / (x2 - x1))
+
+
+def nominal_steps(angles):
+    '''!@brief      finds the step range of an axis from its angle range
+        @param      angles minimum and maximum angle of the axis
+        @return     minimum and maximum step of the axis
+    '''
+    return tuple(round(a * STEPS_PER_ROTATION / 360) for a in angles)
+
+
+def compile_hpgl(path, polar_steps, azimuthal_steps, sweep=False):
+    '''!@brief      This function runs the hpgl pipeline and collects the shots.
+        @param      path is the path to the hpgl file
+        @param      polar_steps minimum and maximum step of the polar axis
+        @param      azimuthal_steps minimum and maximum step of the azimuthal axis
+        @param      sweep whether lines are fired on the fly where possible
+        @return     list of (polar step, azimuthal step, flags) records
+    '''
+    records = []
+    for xy_des in interpolate(filter_hpgl(read_points(path))):
+        if xy_des is None:
+            continue
+        polar, azimuthal, converged = solve_segment(xy_des)
+        flags = sweep_flags(polar, azimuthal, converged) if sweep else [FIRE] * len(xy_des)
+        for i in range(len(xy_des)):
+            if not converged[i]:
+                print('no solution for: ' + str(xy_des[i]))
+                continue
+            records.append((map_range(polar[i], *POLAR_RANGE, *polar_steps),
+                            map_range(azimuthal[i], *AZIMUTHAL_RANGE, *azimuthal_steps),
+                            flags[i]))
+    return records
+
+
+def write_plan(path, records, polar_steps, azimuthal_steps):
+    '''!@brief      This function writes the records to a plan file.
+        @param      path is the path to the plan file
+        @param      records list of (polar step, azimuthal step, flags) records
+        @param      polar_steps minimum and maximum step of the polar axis
+        @param      azimuthal_steps minimum and maximum step of the azimuthal axis
+    '''
+    with open(path, 'wb') as file:
+        file.write(struct.pack(PLAN_HEADER, PLAN_MAGIC, len(records),
+                               ProcessesHPGL.d, ProcessesHPGL.l, ProcessesHPGL.h,
+                               *POLAR_RANGE, *polar_steps, *AZIMUTHAL_RANGE, *azimuthal_steps))
+        for record in records:
+            file.write(struct.pack(PLAN_RECORD, *record))
+
+
+def main():
+    '''!@brief      This function compiles the hpgl file given on the command line
+    '''
+    parser = argparse.ArgumentParser(description='compile an hpgl file into a shot plan')
+    parser.add_argument('hpgl', help='hpgl file to compile')
+    parser.add_argument('plan', nargs='?', help='plan file to write (default: hpgl file with .plan)')
+    parser.add_argument('--polar-steps', type=int, nargs=2, metavar=('LEFT', 'RIGHT'),
+                        default=nominal_steps(POLAR_RANGE), help='calibrated polar step range')
+    parser.add_argument('--azimuthal-steps', type=int, nargs=2, metavar=('LEFT', 'RIGHT'),
+                        default=nominal_steps(AZIMUTHAL_RANGE), help='calibrated azimuthal step range')
+    parser.add_argument('--sweep', action='store_true', help='fire along lines without stopping')
+    args = parser.parse_args()
+
+    plan = args.plan or os.path.splitext(args.hpgl)[0] + '.plan'
+    records = compile_hpgl(args.hpgl, args.polar_steps, args.azimuthal_steps, args.sweep)
+    write_plan(plan, records, args.polar_steps, args.azimuthal_steps)
+    print('wrote ' + str(len(records)) + ' shots to ' + plan + ' (' + str(os.path.getsize(plan)) + ' bytes)')
+
+
+if __name__ == "__main__":
+    main()
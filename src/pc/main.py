@@ -3,21 +3,27 @@
     
     @brief      Program runs on the PC and sends user input instructions to the MCU
     
-    @details    This program sends commands from the PC to the MCU through serial
+    @details    This program sends commands from the PC to the MCU through serial,
+                or to the emulated firmware, see transport.py
                 
     @author     Alex Radovan
     @author     Daniel Xu
     @date       6/10/2022
     
 '''
-import serial
-import sys
+import argparse
+
+from transport import open_link
 
 
 def main():
     '''!@brief      This function writes commands to serial
     '''
-    with serial.Serial(sys.argv[1], 115200, 8, 'N', 1) as ser:
+    parser = argparse.ArgumentParser(description='send commands to the MCU')
+    parser.add_argument('target', help='serial port, pty:path or tcp://host:port')
+    parser.add_argument('--emulate-baudrate', action='store_true', help='pace the link to the baud rate')
+    args = parser.parse_args()
+    with open_link(args.target, emulate_baudrate=args.emulate_baudrate) as ser:
         while 1:
             s = input("enter command to send: ")
             ser.write(s.encode())
@@ -0,0 +1,331 @@
+'''!
+    @file       simulate_plan.py
+
+    @brief      Program runs on the PC and estimates how long a shot plan takes to draw
+
+    @details    This program models the ramp generator of the TMC4210 so jobs can be timed
+                without the turret. Each move ramps from V_MIN up to at most V_MAX at A_MAX,
+                in the step rates set by PULSE_RAMP_DIV. PMUL_PDIV is reduced by 1% so the
+                ramp doesn't overshoot, so braking is modelled at that much less than A_MAX.
+                Soft mode brakes exponentially instead, and velocity mode never brakes. Both
+                axes are planned the same way as move_all on the MCU, and the settle time,
+                spool time, recover time and sweeps of Positioning.py and NerfDriver.py are
+                added on top.
+
+                Plans from compile_hpgl.py are timed as they are, hpgl files are compiled
+                first. The ramps are worked out with numpy, and the limits of each move
+                with Motion.plan_move as on the MCU, so spacing, ordering and speed
+                settings can be compared quickly:
+                python simulate_plan.py name.plan --rpm 20 --accel 120
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import argparse
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pyb'))
+
+from ProcessesHPGL import PLAN_HEADER, PLAN_MAGIC, FIRE, SWEEP, SWEEP_AZIMUTHAL
+from Motion import derive, report, plan_move, pmul_pdiv, F_CLK, RPM, ACCEL
+from Motion import RAMP_MODE, SOFT_MODE, VELOCITY_MODE, PIPELINED, SETTLE_TIME, SWEEP_MARGIN
+from compile_hpgl import compile_hpgl, nominal_steps, POLAR_RANGE, AZIMUTHAL_RANGE
+
+MODES = {'ramp': RAMP_MODE, 'soft': SOFT_MODE, 'velocity': VELOCITY_MODE}
+
+# V_MIN written by TMC4210.__init__
+V_MIN = 1
+
+# the Nerf defaults, in ms
+SPOOL_TIME = 5000
+RECOVER_TIME = 200
+# time from pulling the trigger until the dart breaks the beam, in ms
+#   an assumed value, the turret hasn't been timed, set it with --dart
+DART_TIME = 60
+
+# polar step, azimuthal step, flags, packed the same as PLAN_RECORD
+PLAN_DTYPE = np.dtype([('polar', '<i4'), ('azimuthal', '<i4'), ('flags', 'u1')])
+
+
+def read_plan(path):
+    '''!@brief      This function reads the records of a plan file.
+        @param      path is the path to the plan file
+        @return     array of (polar step, azimuthal step, flags) records
+    '''
+    size = struct.calcsize(PLAN_HEADER)
+    with open(path, 'rb') as file:
+        header = file.read(size)
+        if len(header) != size or struct.unpack_from('<4s', header)[0] != PLAN_MAGIC:
+            raise ValueError('not a plan: ' + path)
+        return np.fromfile(file, dtype=PLAN_DTYPE)
+
+
+def step_rates(pulse_div, ramp_div, f_clk=F_CLK):
+    '''!@brief      Finds the step rates of one unit of the velocity and acceleration registers
+        @param      pulse_div is the PULSE_DIV clock pre-divider
+        @param      ramp_div is the RAMP_DIV clock pre-divider
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @return     steps per second of a velocity of 1
+        @return     steps per second squared of an acceleration of 1
+    '''
+    return f_clk / (pow(2, pulse_div) * 2048 * 32), f_clk * f_clk / pow(2, pulse_div + ramp_div + 29)
+
+
+def brake_factor(a_max, pulse_div, ramp_div):
+    '''!@brief      Finds how much of A_MAX the ramp brakes at
+        @details    Motion.pmul_pdiv for arrays of A_MAX. The ramp generator brakes as if
+                    the acceleration was PMUL/PDIV over its exact proportionality factor.
+        @param      a_max is the acceleration register value of each move
+        @param      pulse_div is the PULSE_DIV clock pre-divider
+        @param      ramp_div is the RAMP_DIV clock pre-divider
+        @return     ratio of the braking to A_MAX for each move
+    '''
+    a_max = np.asarray(a_max)
+    values, index = np.unique(a_max, return_inverse=True)
+    factors = []
+    for a in values.tolist():
+        pmul, pdiv = pmul_pdiv(a, pulse_div, ramp_div)
+        p = a / (128 * pow(2.0, ramp_div - pulse_div))
+        factors.append(pmul / (p * pow(2.0, 3 + pdiv)))
+    return np.array(factors)[index].reshape(a_max.shape)
+
+
+def ramp_time(x, distance, v_min, v_max, a_max, k=1.0, mode=RAMP_MODE):
+    '''!@brief      Finds when a move passes a point
+        @details    All arguments may be arrays. Units only need to match each other, for
+                    steps and steps per second the result is in seconds. The time of the
+                    whole move is ramp_time(distance, distance, ...).
+        @param      x is how far along the move the point is
+        @param      distance is how far the axis moves
+        @param      v_min is the velocity the ramp starts and ends at
+        @param      v_max is the maximum velocity
+        @param      a_max is the maximum acceleration
+        @param      k is the ratio of the braking to a_max, from brake_factor
+        @param      mode is RAMP_MODE, SOFT_MODE or VELOCITY_MODE
+        @return     time from the start of the move until it passes x
+    '''
+    d = np.abs(distance)
+    x = np.minimum(np.abs(x), d)
+    v0 = np.asarray(v_min, dtype=float)
+    a = np.asarray(a_max, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if mode == VELOCITY_MODE:
+            vp = np.asarray(v_max, dtype=float)
+            x_brake = 0.0
+        else:
+            # brakes at a * k, peaks where the ramps meet if v_max isn't reached
+            a_brake = a * k
+            vp = np.sqrt(np.minimum(np.square(v_max), v0 * v0 + 2 * d / (1 / a + 1 / a_brake)))
+            x_brake = (vp * vp - v0 * v0) / (2 * a_brake)
+        x_accel = (vp * vp - v0 * v0) / (2 * a)
+        t_accel = (vp - v0) / a
+        accel = (np.sqrt(v0 * v0 + 2 * a * x) - v0) / a
+        cruise = t_accel + (x - x_accel) / vp
+        if mode == VELOCITY_MODE:
+            t = np.where(x <= x_accel, accel, cruise)
+        else:
+            t_cruise = t_accel + (d - x_brake - x_accel) / vp
+            r = d - x
+            if mode == SOFT_MODE:
+                # velocity falls with the distance left until it gets to v_min
+                tau = x_brake / vp
+                r_min = x_brake * v0 / vp
+                left = np.where(r >= r_min, tau * np.log(r / r_min) + tau, r / v0)
+                brake = tau * (np.log(vp / v0) + 1)
+            else:
+                left = (np.sqrt(v0 * v0 + 2 * a_brake * r) - v0) / a_brake
+                brake = (vp - v0) / a_brake
+            t = np.where(x <= x_accel, accel, np.where(x <= d - x_brake, cruise, t_cruise + brake - left))
+    return np.where(d > 0, t, 0.0)
+
+
+def plan_moves(distances, v_max, a_max, v_caps=None):
+    '''!@brief      Scales the limits of each axis so all arrive together
+        @details    Motion.plan_move for each row of moves, as move_all on the MCU. The 
+                    axis that takes the longest keeps its limits. This is a loop in 
+                    python, about 10 us a move. 
+        @param      distances is how far each axis moves in each move, in steps
+        @param      v_max is the velocity register value
+        @param      a_max is the acceleration register value
+        @param      v_caps is the highest velocity register value of each axis in each
+                    move, such as for a sweep, None for v_max on all
+        @return     velocity register value of each axis in each move
+        @return     acceleration register value of each axis in each move
+    '''
+    distances = np.asarray(distances)
+    v_limits = np.full(distances.shape, v_max)
+    if v_caps is not None:
+        v_limits = np.minimum(v_limits, v_caps).astype(int)
+    plan = np.array([plan_move(d, [(v, a_max) for v in v_row])
+                     for d, v_row in zip(distances.tolist(), v_limits.tolist())], dtype=float)
+    plan = plan.reshape(distances.shape + (2,))
+    return plan[..., 0], plan[..., 1]
+
+
+def simulate(records, config, mode=RAMP_MODE, sweep=True, pipelined=PIPELINED,
+             settle_time=SETTLE_TIME, spool_time=SPOOL_TIME, recover_time=RECOVER_TIME,
+             dart_time=DART_TIME, f_clk=F_CLK, start=(0, 0)):
+    '''!@brief      This function times the moves and shots of a plan.
+        @details    Shots are fired standing still after the settle time. The next move
+                    starts once the dart has left if pipelined, otherwise once the gun has
+                    recovered. A run of SWEEP records is one move from the shot before
+                    it, firing as the axes cross each shot. As Positioning.sweep_limit
+                    does, the axis compared on is slowed so its smallest gap takes the
+                    dart time and recover time, with SWEEP_MARGIN to spare. Shots closer
+                    together than the recover time are counted as missed. The spool is
+                    started with the first move and never idles.
+        @param      records array of (polar step, azimuthal step, flags) records
+        @param      config is the PULSE_DIV, RAMP_DIV, V_MAX and A_MAX of both axes
+        @param      mode is RAMP_MODE, SOFT_MODE or VELOCITY_MODE
+        @param      sweep whether SWEEP records are fired on the fly, as with nINT pins
+        @param      pipelined whether the next move starts before the gun has recovered
+        @param      settle_time is the time at a target before firing, in ms
+        @param      spool_time is the time the spool motor takes to get up to speed, in ms
+        @param      recover_time is the time after a dart has left before the next, in ms
+        @param      dart_time is the time from the trigger to the dart leaving, in ms
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @param      start is the polar and azimuthal step the axes start at
+        @return     time of the motion each record adds, in s
+        @return     total motion time, in s
+        @return     total firing time, the time spent not moving, in s
+        @return     number of shots fired
+        @return     number of shots missed
+    '''
+    n = len(records)
+    if n == 0:
+        return np.zeros(0), 0.0, 0.0, 0, 0
+    pos = np.stack((records['polar'], records['azimuthal']), axis=1).astype(float)
+    flags = records['flags'].astype(int)
+    settle, spool, recover, dart = (t / 1000 for t in (settle_time, spool_time, recover_time, dart_time))
+
+    # a sweep goes on to the next record of the same kind of line
+    line = flags & (SWEEP | SWEEP_AZIMUTHAL)
+    swept = (flags & SWEEP != 0) & sweep
+    cont = np.r_[False, swept[1:] & swept[:-1] & (line[1:] == line[:-1])]
+    first = np.flatnonzero(~cont)
+    last = np.r_[first[1:] - 1, n - 1]
+    group = np.cumsum(~cont) - 1
+    sweeps = swept[first]
+    fires = (flags[first] & FIRE != 0) | sweeps
+
+    # each group moves from the end of the last one to its last record
+    prev = np.vstack((np.asarray(start, dtype=float), pos[:-1]))
+    origin = prev[first]
+    distance = pos[last] - origin
+    v_rate, a_rate = step_rates(config[0], config[1], f_clk)
+
+    # the axis compared on only crosses the shots as fast as the gun fires them
+    compare = np.where(flags & SWEEP_AZIMUTHAL, 1, 0)
+    v_caps = None
+    if sweeps.any():
+        rows = np.arange(n)
+        gap = np.minimum.reduceat(np.abs(pos[rows, compare] - prev[rows, compare]), first)
+        rate = gap / ((dart + recover) * SWEEP_MARGIN)
+        v_caps = np.full(distance.shape, np.inf)
+        v_caps[sweeps, compare[first][sweeps]] = np.maximum(1, np.round(rate[sweeps] / v_rate))
+    v_reg, a_reg = plan_moves(distance, config[2], config[3], v_caps)
+    k = brake_factor(a_reg, config[0], config[1])
+    v_min, v_max, a_max = V_MIN * v_rate, v_reg * v_rate, a_reg * a_rate
+    duration = ramp_time(distance, distance, v_min, v_max, a_max, k, mode).max(axis=1)
+
+    # crossing of each record, along the axis leading its group
+    lead = np.argmax(np.abs(distance), axis=1)
+    rows = np.arange(len(first))
+    span = np.abs(distance[group, compare])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(span > 0, np.abs(pos[np.arange(n), compare] - origin[group, compare]) / span, 1.0)
+    lead_distance = distance[rows, lead][group]
+    cross = ramp_time(fraction * lead_distance, lead_distance, v_min, v_max[rows, lead][group],
+                      a_max[rows, lead][group], k[rows, lead][group], mode)
+    cross = np.where(sweeps[group], cross, duration[group])
+    durations = cross - np.where(cont, np.r_[0.0, cross[:-1]], 0.0)
+
+    # the gun can fire again recover after the last shot, which left slack before the group ended
+    stops = fires & ~sweeps
+    slack = np.where(stops, 0.0 if pipelined else -recover, -np.inf)
+    spooled = np.full(len(first), -np.inf)
+    if fires.any():
+        spooled[np.argmax(fires)] = spool
+    gap = duration.copy()
+
+    # fire on the fly, skipping crossings the gun isn't ready for
+    hit = np.zeros(n, dtype=bool)
+    if sweeps.any():
+        ready = recover + np.r_[-np.inf, slack[:-1]]
+        hit = swept & np.where(cont, durations >= recover,
+                               (cross >= ready[group]) & (cross >= spooled[group]))
+        last_hit = np.full(len(first), -np.inf)
+        np.maximum.at(last_hit, group[hit], cross[hit])
+        gap = np.where(sweeps, np.maximum(duration, last_hit + dart), gap)
+        slack = np.where(sweeps, last_hit - gap, slack)
+
+    # stop and fire
+    ready = recover + np.r_[-np.inf, slack[:-1]]
+    stop = np.maximum.reduce([duration + settle, ready, spooled]) + dart
+    if not pipelined:
+        stop += recover
+    gap = np.where(stops, stop, gap)
+    shots = int(np.count_nonzero(stops)) + int(np.count_nonzero(hit))
+    missed = int(np.count_nonzero(swept & ~hit))
+
+    motion = float(duration.sum())
+    return durations, motion, float(gap.sum()) - motion, shots, missed
+
+
+def main():
+    '''!@brief      This function times the plan or hpgl file given on the command line
+    '''
+    parser = argparse.ArgumentParser(description='estimate how long a shot plan takes to draw')
+    parser.add_argument('plan', help='plan file, or hpgl file to compile first')
+    parser.add_argument('--rpm', type=float, default=RPM, help='speed of both axes')
+    parser.add_argument('--accel', type=float, default=ACCEL, help='acceleration of both axes in deg/s^2')
+    parser.add_argument('--mode', choices=MODES, default='ramp', help='ramp generator mode')
+    parser.add_argument('--no-sweep', action='store_true', help='fire every shot standing still, as without nINT')
+    parser.add_argument('--sequential', action='store_true', help='wait for the gun to recover before moving')
+    parser.add_argument('--settle', type=float, default=SETTLE_TIME, help='settle time in ms')
+    parser.add_argument('--recover', type=float, default=RECOVER_TIME, help='recover time in ms')
+    parser.add_argument('--dart', type=float, default=DART_TIME, help='time for a dart to leave in ms')
+    parser.add_argument('--moves', action='store_true', help='print the time of every move')
+    args = parser.parse_args()
+
+    config = derive(args.rpm, args.accel)
+    if config is None:
+        sys.exit('no configuration for ' + str(args.rpm) + ' rpm, ' + str(args.accel) + ' deg/s^2')
+    print(report(config, args.rpm, args.accel))
+
+    if args.plan.endswith('.plan'):
+        records = read_plan(args.plan)
+    else:
+        records = np.array(compile_hpgl(args.plan, nominal_steps(POLAR_RANGE),
+                                        nominal_steps(AZIMUTHAL_RANGE), not args.no_sweep), dtype=PLAN_DTYPE)
+
+    m = time.perf_counter()
+    durations, motion, firing, shots, missed = simulate(
+        records, config, MODES[args.mode], not args.no_sweep, not args.sequential,
+        args.settle, SPOOL_TIME, args.recover, args.dart)
+    elapsed = time.perf_counter() - m
+
+    if args.moves:
+        for i in range(len(records)):
+            print(str(tuple(records[i])) + ' ' + '{:.3f}'.format(durations[i]) + ' s')
+    total = motion + firing
+    print('records: ' + str(len(records)) + ' shots: ' + str(shots) + ' missed: ' + str(missed))
+    if len(records):
+        print('longest move: ' + '{:.3f}'.format(durations.max()) + ' s'
+              + ' mean move: ' + '{:.3f}'.format(durations.mean()) + ' s')
+    print('motion: ' + '{:.1f}'.format(motion) + ' s firing: ' + '{:.1f}'.format(firing) + ' s'
+          + ' total: ' + '{:.1f}'.format(total) + ' s')
+    if total > 0 and shots > 1:
+        print('rate: ' + '{:.1f}'.format(shots * 60 / total) + '/min')
+    print('simulated in ' + '{:.1f}'.format(elapsed * 1000) + ' ms')
+
+
+if __name__ == "__main__":
+    main()
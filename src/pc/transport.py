@@ -0,0 +1,277 @@
+'''!
+    @file       transport.py
+
+    @brief      The link from the PC programs to the MCU
+
+    @details    main.py and camera.py send their commands through a link opened here.
+                The target picks what is on the other end:
+                tcp://host:port for the emulated firmware served with python -m emu --serve,
+                pty:/dev/pts/N for a pseudo-terminal, such as from python -m emu --serve pty,
+                anything else is a serial port opened with pyserial, such as COM3 or /dev/ttyACM0.
+                A link can pace the bytes it sends and receives to the baud rate, so
+                TCP and pseudo-terminal links have the throughput of the real uart.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import os
+import select
+import socket
+import time
+
+BAUDRATE = 115200
+# s to wait for bytes in read
+TIMEOUT = 1.0
+# most bytes read at once
+CHUNK = 4096
+
+
+def open_link(target, baudrate=BAUDRATE, emulate_baudrate=False, timeout=TIMEOUT):
+    '''!@brief      Opens a link to the MCU
+        @param      target is tcp://host:port, pty:path or a serial port
+        @param      baudrate is the baud rate of the uart
+        @param      emulate_baudrate is whether to pace the bytes to the baud rate
+        @param      timeout is how long reads wait for bytes, in s
+        @return     the Link
+    '''
+    if target.startswith('tcp://'):
+        host, port = target[len('tcp://'):].rsplit(':', 1)
+        link = SocketLink(host, int(port), timeout)
+    elif target.startswith('pty:'):
+        link = PtyLink(target[len('pty:'):], timeout)
+    else:
+        link = SerialLink(target, baudrate, timeout)
+    if emulate_baudrate:
+        link.set_pace(baudrate)
+    return link
+
+
+class Link:
+    '''!@brief      A byte stream to the MCU, optionally paced to a baud rate.
+    '''
+    def __init__(self, timeout=TIMEOUT):
+        '''!@brief      Initializes the link
+            @param      timeout is how long reads wait for bytes, in s
+        '''
+        self.timeout = timeout
+        # s per byte when paced, 10 bits a byte
+        self.byte_time = 0.0
+        # times the wire is free in each direction
+        self.tx_free = 0.0
+        self.rx_free = 0.0
+        self.buffer = bytearray()
+
+    def set_pace(self, baudrate):
+        '''!@brief      Paces the bytes to a baud rate
+            @param      baudrate in bits per second, None to stop pacing
+        '''
+        self.byte_time = 10.0 / baudrate if baudrate else 0.0
+
+    def pace(self, free, n):
+        '''!@brief      Waits for n bytes to cross the wire after it is free
+            @param      free is when the wire is free
+            @param      n is the number of bytes
+            @return     when the wire is free again
+        '''
+        if not self.byte_time:
+            return free
+        free = max(free, time.perf_counter()) + n * self.byte_time
+        delay = free - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return free
+
+    def write(self, data):
+        '''!@brief      Sends bytes, returning once they are on the wire if paced
+            @param      data is the bytes
+            @return     number of bytes sent
+        '''
+        self.send(data)
+        self.tx_free = self.pace(self.tx_free, len(data))
+        return len(data)
+
+    def fill(self, timeout):
+        '''!@brief      Waits for bytes and adds them to the buffer
+            @param      timeout is the longest wait in s
+            @return     boolean of whether any came
+        '''
+        data = self.recv(timeout)
+        if not data:
+            return False
+        self.rx_free = self.pace(self.rx_free, len(data))
+        self.buffer += data
+        return True
+
+    @property
+    def in_waiting(self):
+        '''!@brief      Gets the number of bytes that can be read without waiting
+        '''
+        self.fill(0)
+        return len(self.buffer)
+
+    def read(self, n=1):
+        '''!@brief      Reads bytes, waiting up to the timeout for the first
+            @param      n is the most bytes to read
+            @return     the bytes, empty if none came
+        '''
+        if not self.buffer:
+            self.fill(self.timeout)
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def read_until(self, expected=b'\n', timeout=None):
+        '''!@brief      Reads up to and including the expected bytes
+            @param      expected is the bytes to stop after
+            @param      timeout is the longest wait in s, the link timeout if not given
+            @return     the bytes, which don't end with expected if it didn't come in time
+        '''
+        end = time.perf_counter() + (self.timeout if timeout is None else timeout)
+        while expected not in self.buffer:
+            left = end - time.perf_counter()
+            if left <= 0:
+                break
+            self.fill(left)
+        i = self.buffer.find(expected)
+        n = len(self.buffer) if i < 0 else i + len(expected)
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def readline(self):
+        '''!@brief      Reads a line
+            @return     the bytes, without a newline if none came in time
+        '''
+        return self.read_until(b'\n')
+
+    def send(self, data):
+        '''!@brief      Sends bytes on the underlying stream
+            @param      data is the bytes
+        '''
+        raise NotImplementedError
+
+    def recv(self, timeout):
+        '''!@brief      Receives bytes from the underlying stream
+            @param      timeout is the longest wait in s
+            @return     the bytes, empty if none
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''!@brief      Closes the link
+        '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SocketLink(Link):
+    '''!@brief      A link over TCP, such as to the emulated firmware.
+    '''
+    def __init__(self, host, port, timeout=TIMEOUT):
+        '''!@brief      Connects to a server
+            @param      host is the address of the server
+            @param      port is its port
+            @param      timeout is how long reads wait for bytes, in s
+        '''
+        super().__init__(timeout)
+        self.sock = socket.create_connection((host, port))
+        # commands are short, send them straight away
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, data):
+        '''!@brief      Sends bytes on the socket
+            @param      data is the bytes
+        '''
+        self.sock.sendall(data)
+
+    def recv(self, timeout):
+        '''!@brief      Receives bytes from the socket
+            @param      timeout is the longest wait in s
+            @return     the bytes, empty if none
+        '''
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return b''
+        data = self.sock.recv(CHUNK)
+        if not data:
+            raise ConnectionError('link closed')
+        return data
+
+    def close(self):
+        '''!@brief      Closes the socket
+        '''
+        self.sock.close()
+
+
+class PtyLink(Link):
+    '''!@brief      A link over a pseudo-terminal.
+    '''
+    def __init__(self, path, timeout=TIMEOUT):
+        '''!@brief      Opens the terminal in raw mode
+            @param      path is the terminal, such as /dev/pts/3
+            @param      timeout is how long reads wait for bytes, in s
+        '''
+        import tty
+        super().__init__(timeout)
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.fd)
+
+    def send(self, data):
+        '''!@brief      Sends bytes on the terminal
+            @param      data is the bytes
+        '''
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def recv(self, timeout):
+        '''!@brief      Receives bytes from the terminal
+            @param      timeout is the longest wait in s
+            @return     the bytes, empty if none
+        '''
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return b''
+        return os.read(self.fd, CHUNK)
+
+    def close(self):
+        '''!@brief      Closes the terminal
+        '''
+        os.close(self.fd)
+
+
+class SerialLink(Link):
+    '''!@brief      A link over a serial port, where the port itself keeps to the baud rate.
+    '''
+    def __init__(self, port, baudrate=BAUDRATE, timeout=TIMEOUT):
+        '''!@brief      Opens the port
+            @param      port is the name of the port
+            @param      baudrate is the baud rate
+            @param      timeout is how long reads wait for bytes, in s
+        '''
+        import serial
+        super().__init__(timeout)
+        self.serial = serial.Serial(port, baudrate, 8, 'N', 1)
+
+    def send(self, data):
+        '''!@brief      Sends bytes on the port
+            @param      data is the bytes
+        '''
+        self.serial.write(data)
+
+    def recv(self, timeout):
+        '''!@brief      Receives bytes from the port
+            @param      timeout is the longest wait in s
+            @return     the bytes, empty if none
+        '''
+        self.serial.timeout = timeout
+        return self.serial.read(max(1, self.serial.in_waiting))
+
+    def close(self):
+        '''!@brief      Closes the port
+        '''
+        self.serial.close()
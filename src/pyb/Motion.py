@@ -0,0 +1,231 @@
+'''!
+    @file       Motion.py
+
+    @brief      This program holds the motion math of the TMC4210.
+
+    @details    This program works out the register values the TMC4210 needs for a move,
+                such as the proportionality factor for an acceleration and the velocity
+                and acceleration of each axis so that both arrive at the same time. It
+                only uses plain python, so it can be imported on the PC as well.
+
+    @author     Alex Radovan
+    @author     Daniel Xu
+    @date       6/10/2022
+
+'''
+import math
+
+# largest value of the V_MAX and A_MAX registers
+V_LIMIT = 2047
+A_LIMIT = 2047
+# largest clock pre-divider
+DIV_LIMIT = 13
+
+# clock of the TMC4210s, made by Timer(1) on PB0
+F_CLK = 20000000
+# full steps in a revolution of the stepper motors
+STEPS_PER_REV = 200
+# set by the stepper control board
+MICROSTEPS = 8
+
+# speed and acceleration of the turret, as used before they were derived
+RPM = 14.4
+ACCEL = 82.0
+
+# ramp modes
+RAMP_MODE = 0b00
+SOFT_MODE = 0b01
+VELOCITY_MODE = 0b10
+HOLD_MODE = 0b11
+
+# start the next move as soon as the dart has left, while the trigger releases
+#   set False to wait for the whole shot before moving, for comparing shot rates
+PIPELINED = True
+# time to let the gun settle at a target before firing, in ms
+SETTLE_TIME = 50
+# shots of a sweep are crossed this much further apart than the gun needs between them
+#   a skipped shot is fired standing still later, so a small margin is faster overall
+SWEEP_MARGIN = 1.05
+
+
+def steps_per_degree(microsteps=MICROSTEPS, steps_per_rev=STEPS_PER_REV):
+    '''!@brief      Finds how many microsteps make a degree
+        @param      microsteps is the number of microsteps in a full step
+        @param      steps_per_rev is the number of full steps in a revolution
+        @return     microsteps per degree
+    '''
+    return steps_per_rev * microsteps / 360
+
+
+def velocity_register(rpm, pulse_div, microsteps=MICROSTEPS, steps_per_rev=STEPS_PER_REV, f_clk=F_CLK):
+    '''!@brief      Finds the velocity register value of a speed
+        @details    A velocity v makes f_clk * v / (2^PULSE_DIV * 2048 * 32) steps per second. 
+        @param      rpm is the speed in revolutions per minute
+        @param      pulse_div is the PULSE_DIV clock pre-divider
+        @param      microsteps is the number of microsteps in a full step
+        @param      steps_per_rev is the number of full steps in a revolution
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @return     velocity register value, not limited to its range
+    '''
+    step_rate = rpm * 6 * steps_per_degree(microsteps, steps_per_rev)
+    return round(step_rate * pow(2, pulse_div) * 2048 * 32 / f_clk)
+
+
+def acceleration_register(accel, pulse_div, ramp_div, microsteps=MICROSTEPS,
+                          steps_per_rev=STEPS_PER_REV, f_clk=F_CLK):
+    '''!@brief      Finds the acceleration register value of an angular acceleration
+        @details    An acceleration a makes f_clk^2 * a / 2^(PULSE_DIV + RAMP_DIV + 29) 
+                    steps per second squared. 
+        @param      accel is the acceleration in degrees per second squared
+        @param      pulse_div is the PULSE_DIV clock pre-divider
+        @param      ramp_div is the RAMP_DIV clock pre-divider
+        @param      microsteps is the number of microsteps in a full step
+        @param      steps_per_rev is the number of full steps in a revolution
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @return     acceleration register value, not limited to its range
+    '''
+    step_accel = accel * steps_per_degree(microsteps, steps_per_rev)
+    return round(step_accel * pow(2, pulse_div + ramp_div + 29) / (f_clk * f_clk))
+
+
+def achieved(pulse_div, ramp_div, v_max, a_max, microsteps=MICROSTEPS,
+             steps_per_rev=STEPS_PER_REV, f_clk=F_CLK):
+    '''!@brief      Finds the speed and acceleration that register values make
+        @param      pulse_div is the PULSE_DIV clock pre-divider
+        @param      ramp_div is the RAMP_DIV clock pre-divider
+        @param      v_max is the maximum velocity register value
+        @param      a_max is the maximum acceleration register value
+        @param      microsteps is the number of microsteps in a full step
+        @param      steps_per_rev is the number of full steps in a revolution
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @return     speed in revolutions per minute
+        @return     acceleration in degrees per second squared
+    '''
+    per_degree = steps_per_degree(microsteps, steps_per_rev)
+    step_rate = f_clk * v_max / (pow(2, pulse_div) * 2048 * 32)
+    step_accel = f_clk * f_clk * a_max / pow(2, pulse_div + ramp_div + 29)
+    return step_rate / per_degree / 6, step_accel / per_degree
+
+
+def derive(rpm=RPM, accel=ACCEL, microsteps=MICROSTEPS, steps_per_rev=STEPS_PER_REV, f_clk=F_CLK):
+    '''!@brief      Finds the register values closest to a speed and acceleration
+        @details    Every pair of clock pre-dividers is tried. The pair with the smallest 
+                    combined relative error, to 0.1%, wins. Ties go to the largest register 
+                    values, which leave the finest steps for scaling moves. 
+        @param      rpm is the speed in revolutions per minute
+        @param      accel is the acceleration in degrees per second squared
+        @param      microsteps is the number of microsteps in a full step
+        @param      steps_per_rev is the number of full steps in a revolution
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @return     PULSE_DIV, RAMP_DIV, V_MAX and A_MAX, None if nothing is in range
+    '''
+    best = None
+    best_key = None
+    for pulse_div in range(DIV_LIMIT + 1):
+        v_max = velocity_register(rpm, pulse_div, microsteps, steps_per_rev, f_clk)
+        if not 1 <= v_max <= V_LIMIT:
+            continue
+        for ramp_div in range(DIV_LIMIT + 1):
+            a_max = acceleration_register(accel, pulse_div, ramp_div, microsteps, steps_per_rev, f_clk)
+            # pmul_pdiv has a pair for every a_max, so the scaled ones of plan_move work too
+            if not 1 <= a_max <= A_LIMIT:
+                continue
+            got_rpm, got_accel = achieved(pulse_div, ramp_div, v_max, a_max, microsteps, steps_per_rev, f_clk)
+            error = abs(got_rpm - rpm) / rpm + abs(got_accel - accel) / accel
+            key = (round(error, 3), -v_max, -a_max)
+            if best_key is None or key < best_key:
+                best = pulse_div, ramp_div, v_max, a_max
+                best_key = key
+    return best
+
+
+def report(config, rpm=RPM, accel=ACCEL, microsteps=MICROSTEPS, steps_per_rev=STEPS_PER_REV, f_clk=F_CLK):
+    '''!@brief      Describes the achieved speed and acceleration of a configuration
+        @param      config is the PULSE_DIV, RAMP_DIV, V_MAX and A_MAX from derive
+        @param      rpm is the requested speed in revolutions per minute
+        @param      accel is the requested acceleration in degrees per second squared
+        @param      microsteps is the number of microsteps in a full step
+        @param      steps_per_rev is the number of full steps in a revolution
+        @param      f_clk is the clock of the TMC4210 in Hz
+        @return     the description
+    '''
+    got_rpm, got_accel = achieved(*config, microsteps, steps_per_rev, f_clk)
+    return ('pulse_div: ' + str(config[0]) + ' ramp_div: ' + str(config[1])
+            + ' v_max: ' + str(config[2]) + ' a_max: ' + str(config[3])
+            + ' pmul/pdiv: ' + str(pmul_pdiv(config[3], config[0], config[1]))
+            + ' rpm: ' + '{:.2f}'.format(got_rpm) + '/' + '{:.2f}'.format(rpm)
+            + ' accel: ' + '{:.1f}'.format(got_accel) + '/' + '{:.1f}'.format(accel) + ' deg/s^2')
+
+
+def pmul_pdiv(a_max, pulse_div, ramp_div):
+    '''!@brief      Finds the proportionality factor for an acceleration
+        @details    Optimized calculation of PMUL and PDIV from the TMC4210 data manual,
+                    with p reduced by 1% so the ramp doesn't overshoot. PMUL is rounded
+                    down, so every a_max has a pair. A p out of the range of the registers
+                    gets the nearest pair.
+        @param      a_max is the maximum acceleration register value
+        @param      pulse_div is the PULSE_DIV clock pre-divider
+        @param      ramp_div is the RAMP_DIV clock pre-divider
+        @return     PMUL and PDIV
+    '''
+    p = a_max / (128 * pow(2, ramp_div - pulse_div))
+    for pdiv in range(0, 14):
+        pmul = 0.99 * p * pow(2, 3) * pow(2, pdiv)
+        # below 256 rather than 255, or a pmul just under 128 doubles past the range
+        if 128 <= pmul < 256:
+            return int(pmul), pdiv
+        if pmul >= 256:
+            return 255, pdiv
+    return 128, 13
+
+
+def move_time(distance, v_max, a_max):
+    '''!@brief      Finds how long a trapezoidal move takes
+        @details    Units only need to match each other, for register values the result
+                    is in the time unit set by the clock pre-dividers.
+        @param      distance is how far the axis moves
+        @param      v_max is the maximum velocity
+        @param      a_max is the maximum acceleration
+        @return     time of the move
+    '''
+    distance = abs(distance)
+    # never reaches v_max
+    if distance * a_max < v_max * v_max:
+        return 2 * math.sqrt(distance / a_max)
+    return distance / v_max + v_max / a_max
+
+
+def plan_move(distances, limits):
+    '''!@brief      Scales the velocity and acceleration of each axis so all arrive together
+        @details    The axis with the longest move keeps its limits. Scaling the velocity
+                    and acceleration of the others by the ratio of their distance keeps the
+                    shape of the ramp, so they start and stop with it. The axes must share
+                    their clock pre-dividers.
+        @param      distances is how far each axis moves, in steps
+        @param      limits is the (v_max, a_max) of each axis
+        @return     list of (v_max, a_max) for each axis
+    '''
+    times = [move_time(d, v, a) for d, (v, a) in zip(distances, limits)]
+    lead = times.index(max(times))
+    lead_distance = abs(distances[lead])
+    if lead_distance == 0:
+        return list(limits)
+
+    v_lead, a_lead = limits[lead]
+    plan = []
+    for d, (v, a) in zip(distances, limits):
+        r = abs(d) / lead_distance
+        plan.append((max(1, min(v, round(v_lead * r))), max(1, min(a, round(a_lead * r)))))
+    return plan
+
+
+if __name__ == "__main__":
+    # on the PC: python Motion.py [rpm] [accel]
+    import sys
+    rpm = float(sys.argv[1]) if len(sys.argv) > 1 else RPM
+    accel = float(sys.argv[2]) if len(sys.argv) > 2 else ACCEL
+    config = derive(rpm, accel)
+    if config is None:
+        print('no configuration for ' + str(rpm) + ' rpm, ' + str(accel) + ' deg/s^2')
+    else:
+        print(report(config, rpm, accel))
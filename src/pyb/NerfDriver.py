@@ -34,12 +34,19 @@ class Nerf:
                     spooling and the trigger mechanisms. 
                     
     '''
-    def __init__(self, spool, trig, dart, num_darts=15):
+    def __init__(self, spool, trig, dart, num_darts=15, spool_time=5000, idle_time=3000,
+                 release_time=10, recover_time=200, flight_time=100):
         '''!@brief      Initializes the NERF pyb elements 
             @param      spool is the pin that is associated with the spool up motor
             @param      trig is the pin that is associated with the trigger motor
             @param      dart is the pin that is associated the IR sensor that detects if the dart has been fired
             @param      num_darts defaults to 15, is the number of darts in the gun. 
+            @param      spool_time is how long the spool motor needs to get up to speed, in ms
+            @param      idle_time is how long the spool motor is kept running without a shot, in ms
+            @param      release_time is how long the trigger is held after the dart has left, in ms
+            @param      recover_time is how long after a dart has left before the next can be fired, in ms
+            @param      flight_time is how long a dart takes to leave after the trigger, in ms, 
+                        until it is measured by the first shot
     
         '''
         self.spool = pyb.Pin(spool, pyb.Pin.OUT_PP, value=0)
@@ -51,6 +58,53 @@ class Nerf:
         self.dart_flag = 0
 
         self.num_darts = num_darts
+        # darts fired and shots skipped by pulse during a sweep
+        self.pulses = 0
+        self.missed = 0
+
+        self.spool_time = spool_time
+        self.idle_time = idle_time
+        self.release_time = release_time
+        self.recover_time = recover_time
+        self.flight_time = flight_time
+        # when the last dart left the barrel and when the trigger was last pressed
+        self.shot_time = pyb.millis() - recover_time
+        self.press_time = self.shot_time
+        # when the spool motor was turned on and when it was last used
+        self.spool_start = pyb.millis()
+        self.last_used = pyb.millis()
+
+    def spool_up(self):
+        '''!@brief      Starts the spool motor if it isn't already running
+            @details    Called as soon as a shot is coming, so spooling up happens while 
+                        the steppers are moving. This also restarts the idle time. 
+            
+        '''
+        if not self.spool.value():
+            self.spool.value(1)
+            self.spool_start = pyb.millis()
+        self.last_used = pyb.millis()
+
+    def spool_down(self):
+        '''!@brief      Stops the spool motor, letting go of the trigger if it is still held
+            
+        '''
+        self.trig.value(0)
+        self.spool.value(0)
+
+    def is_spooled(self):
+        '''!@brief      Checks if the spool motor is up to speed
+            @return     boolean of whether the spool motor has run for the spool time
+            
+        '''
+        return self.spool.value() and pyb.millis() - self.spool_start >= self.spool_time
+
+    def check_idle(self):
+        '''!@brief      Stops the spool motor once no shot has been made for the idle time
+            
+        '''
+        if self.spool.value() and pyb.millis() - self.last_used > self.idle_time:
+            self.spool_down()
 
     def dart_callback(self, line):
         '''!@brief      callback if the dark has been fired  
@@ -58,30 +112,41 @@ class Nerf:
             
         '''
         print("fired")
-        self.dart_flag = 1
+        self.dart_flag += 1
+        # the trigger is let go and the gun recovers from here
+        self.shot_time = pyb.millis()
+        self.flight_time = self.shot_time - self.press_time
 
     # todo: minimum and maximum timeout?
-    #   yielding - call normally with tuple(fire) or for _ in fire: pass
-    def fire(self, stopped):
-        '''!@brief      Controls the firing mechanism in the dart.       
+    #   yielding - call normally with tuple(trigger) or for _ in trigger: pass
+    def trigger(self, stopped):
+        '''!@brief      Fires a dart, returning as soon as it has left the barrel.       
+            @details    The spool motor is only waited on for whatever is left of its spool 
+                        time, so it is not waited on at all when it is already running from 
+                        the last shot or was started by spool_up during the move. It is left 
+                        running after the shot and stopped by check_idle. The trigger is 
+                        still held when this returns; it is let go by update, and is_ready 
+                        says when the gun can fire again, so the next move can start while 
+                        the trigger releases and the spool recovers. 
             @param      stopped is boolean that determines if firing mechanism needs to stop.     
+            @return     boolean of whether a dart was fired
             
         '''
         # are we out of ammo
         if self.num_darts <= 0:
             raise OutOfAmmo
 
-        # spool up for 5 seconds
-        self.spool.value(1)
-        m = pyb.millis()
-        while pyb.millis() - m < 5000:
+        # spool up if cold and wait for the last shot to finish
+        self.spool_up()
+        while not self.is_spooled() or not self.is_ready():
             if stopped.get():
-                self.spool.value(0)
-                return
+                self.spool_down()
+                return False
             yield
 
         # fire dart
         self.dart_flag = 0
+        self.press_time = pyb.millis()
         self.trig.value(1)
 
         # wait for dart callback or timeout
@@ -92,22 +157,115 @@ class Nerf:
                 self.dart.disable()
                 self.trig.value(0)
                 self.spool.value(0)
-                return
+                return False
             yield
         self.dart.disable()
-        # todo: needed?
-        pyb.delay(10)
-        # stop firing
-        self.trig.value(0)
-        self.spool.value(0)
+        self.shot_time = pyb.millis()
+        self.last_used = self.shot_time
 
         # check for jam
         print(self.dart_flag)
         if self.dart_flag == 0:
+            self.trig.value(0)
+            self.spool_down()
             raise BarrelJam
 
         # decrement ammo count
         self.num_darts -= 1
+        return True
+
+    def update(self):
+        '''!@brief      Lets go of the trigger once the dart has cleared it
+            @details    The release time is counted from the dart leaving, which sets 
+                        shot_time after the trigger was pressed. 
+            
+        '''
+        if self.trig.value() and self.shot_time - self.press_time >= 0 \
+                and pyb.millis() - self.shot_time >= self.release_time:
+            # stop firing, keeping spool running for the next shot
+            self.trig.value(0)
+
+    def is_ready(self):
+        '''!@brief      Checks if the last shot is over
+            @return     boolean of whether the trigger is released and the spool has recovered
+            
+        '''
+        self.update()
+        return not self.trig.value() and pyb.millis() - self.shot_time >= self.recover_time
+
+    def shot_interval(self):
+        '''!@brief      Gets the shortest time from one trigger pull to the next
+            @return     the time in ms, from the last measured flight time
+            
+        '''
+        return self.flight_time + self.recover_time
+
+    def fire(self, stopped):
+        '''!@brief      Controls the firing mechanism in the dart.       
+            @details    Fires a dart with trigger and waits for the shot to be over. 
+            @param      stopped is boolean that determines if firing mechanism needs to stop.     
+            
+        '''
+        yield from self.trigger(stopped)
+        while not self.is_ready():
+            yield
+
+    def start_sweep(self):
+        '''!@brief      Gets ready to fire from the position compare interrupt with pulse
+            
+        '''
+        self.spool_up()
+        self.pulses = 0
+        self.missed = 0
+        self.dart_flag = 0
+        self.dart.enable()
+
+    def pulse(self, line=None):
+        '''!@brief      Fires a dart from an interrupt without waiting for it
+            @details    The trigger is let go by update once the dart has left. Shots that 
+                        come before the gun is ready for them, or once the magazine is empty, 
+                        are skipped and counted in missed. 
+            @param      line IRQ for callback
+            
+        '''
+        now = pyb.millis()
+        if self.trig.value() or now - self.shot_time < self.recover_time or not self.spool.value() \
+                or now - self.spool_start < self.spool_time or self.pulses >= self.num_darts:
+            self.missed += 1
+            return
+        self.press_time = now
+        self.trig.value(1)
+        self.pulses += 1
+
+    def end_sweep(self, stopped):
+        '''!@brief      Waits for the darts of a sweep to leave and checks them off
+            @details    Raises BarrelJam if fewer darts left than were fired, and OutOfAmmo 
+                        if shots were skipped for an empty magazine. 
+            @param      stopped is boolean that determines if firing mechanism needs to stop.     
+            @return     number of darts fired
+            
+        '''
+        # wait for the last dart
+        m = pyb.millis()
+        while self.dart_flag < self.pulses and pyb.millis() - m < 3000:
+            self.update()
+            if stopped.get():
+                break
+            yield
+        self.dart.disable()
+        self.num_darts -= self.pulses
+        self.last_used = pyb.millis()
+        if self.missed:
+            print('missed: ' + str(self.missed))
+
+        # check for jam
+        if self.dart_flag < self.pulses and not stopped.get():
+            self.trig.value(0)
+            self.spool_down()
+            raise BarrelJam
+        if self.missed and self.num_darts <= 0:
+            raise OutOfAmmo
+        return self.pulses
 
     def reload(self, num_darts=15):
         '''!@brief      resets the ammo count once the mag has been reloaded     
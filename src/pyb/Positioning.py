@@ -13,59 +13,247 @@
     
 '''
 import pyb
-from StepperDriver import StepperDriver, TYPE_VERSION
+from task import cotask
+from StepperDriver import StepperDriver, TYPE_VERSION, home_all, move_all
 from NerfDriver import Nerf, OutOfAmmo, BarrelJam
+from ProcessesHPGL import FIRE, STEPS, RANGE_MIN, RANGE_MAX, SWEEP, SWEEP_AZIMUTHAL
+from Motion import PIPELINED, SETTLE_TIME, SWEEP_MARGIN
 
+# longest a move can take before the target is checked over spi, in ms
+#   crossing the whole polar range takes about 2 s
+MOVE_TIMEOUT = 5000
+# pins connected to nINT of each TMC4210, None to poll the target over spi
+#   each ExtInt needs its own line number, C0 (line 0) is taken by the dart sensor
+POLAR_NINT = 'C8'
+AZIMUTHAL_NINT = 'B9'
+# speed in rpm and acceleration in deg/s^2 of both axes, the controllers are configured from these
+RPM = 14.4
+ACCEL = 82.0
 
-def is_point(queues):
-    '''!@brief      This function checks if there is anything in the queue
-        @param      queues is the queue of data
-        @return     returns a boolean of whether or not the queues are all empty. 
+
+def target_steps(polar, azimuthal, p, a, f, plan_range):
+    '''!@brief      This function finds the step of both axes for a point
+        @param      polar is the polar StepperDriver
+        @param      azimuthal is the azimuthal StepperDriver
+        @param      p the polar position
+        @param      a the azimuthal position
+        @param      f the target flags
+        @param      plan_range minimum and maximum steps of the plan being run
+        @return     polar step and azimuthal step, within the switches
+    '''
+    # apply any drift latched on the last move first
+    polar.check_latch()
+    azimuthal.check_latch()
+    if f & STEPS:
+        steps = (polar.map_step(p, plan_range[0][0], plan_range[1][0]),
+                 azimuthal.map_step(a, plan_range[0][1], plan_range[1][1]))
+    else:
+        steps = polar.angle_to_step(p), azimuthal.angle_to_step(a)
+    # the position compare of a sweep has to be loaded with a step the axis gets to
+    return polar.clamp(int(steps[0])), azimuthal.clamp(int(steps[1]))
+
+
+def sweep_limit(axis, step, nerf):
+    '''!@brief      This function finds how fast a sweep can cross its shots
+        @details    The compare axis is slowed down so the shots are crossed no faster 
+                    than the gun can fire them, with SWEEP_MARGIN to spare. The rest 
+                    of the way to the last shot is covered at the new speed too, so 
+                    the shorter of the two gaps sets it. 
+        @param      axis is the StepperDriver of the compare axis
+        @param      step is the step of the next shot
+        @param      nerf is the Nerf to fire
+        @return     the highest velocity register value for the move to the shot
+    '''
+    target = axis.position()
+    distance = abs(step - target)
+    left = abs(target - axis.controller.get_actual_position())
+    if left:
+        distance = min(distance, left)
+    # steps per second
+    rate = distance * 1000 / (nerf.shot_interval() * SWEEP_MARGIN)
+    return axis.velocity(rate * 60 / axis.steps_per_rotation)
+
+
+def set_targets(polar, azimuthal, p, a, f, plan_range, nerf=None):
+    '''!@brief      This function starts a move of both axes to a point
+        @details    Compiled plans start by giving the step range they were compiled 
+                    for, those points only update plan_range and don't start a move. 
+        @param      polar is the polar StepperDriver
+        @param      azimuthal is the azimuthal StepperDriver
+        @param      p the polar position
+        @param      a the azimuthal position
+        @param      f the target flags
+        @param      plan_range minimum and maximum steps of the plan being run
+        @param      nerf is the Nerf that fires the shots of a sweep, to limit its speed
+        @return     polar step and azimuthal step of the move, None if no move was started
+    '''
+    if f & (RANGE_MIN | RANGE_MAX):
+        plan_range[0 if f & RANGE_MIN else 1] = [p, a]
+        return None
+    steps = target_steps(polar, azimuthal, p, a, f, plan_range)
+    v_limits = None
+    if f & SWEEP and nerf is not None:
+        if f & SWEEP_AZIMUTHAL:
+            v_limits = (None, sweep_limit(azimuthal, steps[1], nerf))
+        else:
+            v_limits = (sweep_limit(polar, steps[0], nerf), None)
+    # both axes arrive together
+    move_all(((polar, steps[0]), (azimuthal, steps[1])), v_limits)
+    return steps
+
+
+def standing(record):
+    '''!@brief      This function turns a shot of a line into one fired standing still
+        @param      record is the (polar, azimuthal, flags) target
+        @return     the target without its sweep flags
+    '''
+    p, a, f = record
+    return p, a, f & ~(SWEEP | SWEEP_AZIMUTHAL) | FIRE
+
+
+def sweep(polar, azimuthal, nerf, targets, shot, record, stopped, flush, plan_range, retry):
+    '''!@brief      This function fires the shots of a line on the fly
+        @details    The position compare of the TMC4210 of the axis given by the flags 
+                    is loaded with the step of the next shot, and its interrupt pulses 
+                    the trigger as the axis crosses it. The axes are sent on to the shot 
+                    after as soon as it is queued, so they don't stop at every shot. 
+                    The move to the first shot must already be started. Shots the gun 
+                    skips are put in retry to be fired standing still, and the line is 
+                    only taken as far as the magazine goes, the rest of it is swept 
+                    once reloaded. 
+        @param      polar is the polar StepperDriver
+        @param      azimuthal is the azimuthal StepperDriver
+        @param      nerf is the Nerf to fire
+        @param      targets is the queue the rest of the line is taken from
+        @param      shot the polar and azimuthal step of the first shot
+        @param      record the (polar, azimuthal, flags) target of the first shot
+        @param      stopped is the boolean determining whether the stopped command has been sent
+        @param      flush is the share counting how many times points were flushed
+        @param      plan_range minimum and maximum steps of the plan being run
+        @param      retry is the list of targets to run before the queue
+        @return     number of darts fired
+    '''
+    # reload first, the line starts again from this shot
+    if nerf.num_darts <= 0:
+        retry.insert(0, record)
+        raise OutOfAmmo
+    f = record[2]
+    compare = azimuthal if f & SWEEP_AZIMUTHAL else polar
+    index = 1 if f & SWEEP_AZIMUTHAL else 0
+    line = f & (SWEEP | SWEEP_AZIMUTHAL)
+    shots = [(shot, record)]
+    generation = flush.get()
+    # a shot crossed before the gun is ready would be skipped, so wait at the first
+    nerf.spool_up()
+    while not (nerf.is_spooled() and nerf.is_ready()) and not stopped.get() and flush.get() == generation:
+        yield
+    nerf.start_sweep()
+    pulses = nerf.pulses
+    compare.controller.start_compare(shot[index], nerf.pulse)
+    # already there, such as when the line is picked up again after a reload
+    if compare.controller.get_actual_position() == shot[index]:
+        nerf.pulse()
+        compare.controller.compare_flag = 1
+    crossed = pyb.millis()
+    while shots:
+        # let go of the trigger of the last shot
+        nerf.update()
+        if stopped.get() or flush.get() != generation:
+            break
+        # stopped short of the shot, such as on a drifted switch
+        if pyb.elapsed_millis(crossed) > MOVE_TIMEOUT:
+            print('sweep timed out')
+            break
+        # move on towards the next shot of the line once it is queued, while there are darts for it
+        if len(shots) < 2 and nerf.pulses + len(shots) < nerf.num_darts:
+            record = targets.peek()
+            if record is not None and record[2] & (SWEEP | SWEEP_AZIMUTHAL) == line:
+                p, a, f = targets.get()
+                step = set_targets(polar, azimuthal, p, a, f, plan_range, nerf)
+                # the compare axis only moves one way along a line
+                direction = 1 if step[index] >= shots[-1][0][index] else -1
+                shots.append((step, (p, a, f)))
+        # crossed the shot, compare with the next one
+        if compare.controller.compare_flag:
+            crossed = pyb.millis()
+            # the gun wasn't ready for it
+            if nerf.pulses == pulses:
+                retry.append(standing(shots[0][1]))
+            pulses = nerf.pulses
+            shots.pop(0)
+            if shots:
+                step = shots[0][0][index]
+                compare.controller.next_compare(step)
+                # crossed before the compare was loaded
+                if (compare.controller.get_actual_position() - step) * direction > 0:
+                    nerf.pulse()
+                    compare.controller.compare_flag = 1
+        yield
+    compare.controller.end_compare()
+    # not crossed before timing out
+    if not stopped.get() and flush.get() == generation:
+        retry.extend(standing(record) for shot, record in shots)
+    return (yield from nerf.end_sweep(stopped))
+
+
+def recover(nerf, axes, paused, stopped, num_darts):
+    '''!@brief      This function waits for the gun to be reloaded and checks the calibration
+        @param      nerf is the Nerf to reload
+        @param      axes is the list of (StepperDriver, a1, a2) for each axis
+        @param      paused is the boolean determining whether the paused command has been sent
+        @param      stopped is the boolean determining whether the stopped command has been sent
+        @param      num_darts is the number of darts once reloaded
     '''
-    p, a, f = queues
-    return p.any() and a.any() and f.any()
+    # todo: notify
+    #   once reloaded, re-calibrate
+    nerf.spool_down()
+    paused.put(1)
+    yield
+    yield from home_all(axes, stopped, True)
+    nerf.reload(num_darts)
 
 
-def unpack_point(queues):
-    '''!@brief      This function unpacks the points from the queues
-        @param      queues is the queue of data
-        @return     pp the polar position
-        @return     aa the azimuthal position
-        @return     ff the firing instructions
+def report_rate(shots, start, end):
+    '''!@brief      This function prints the shot rate of the last run of shots
+        @param      shots is the number of shots fired
+        @param      start is the time of the first shot, in ms
+        @param      end is the time of the last shot, in ms
     '''
-    # unpack tuple
-    p, a, f = queues
-    # get values from queues
-    pp, aa, ff = p.get(), a.get(), f.get()
-    # dummy value to block
-    p.put(0.0)
-    # return values
-    return pp, aa, ff
+    elapsed = end - start
+    if shots > 1 and elapsed > 0:
+        # the first shot starts the clock
+        rate = (shots - 1) * 60000 / elapsed
+        print('shots: ' + str(shots) + ' rate: ' + '{:.1f}'.format(rate) + '/min'
+              + (' (pipelined)' if PIPELINED else ' (sequential)'))
 
 
-def task_positioning(queues, paused, stopped):
+def task_positioning(targets, paused, stopped, flush):
     '''!@brief      This function is a task that controls the motors and the nerf gun. 
         @details    This function handles the SPI controlling of the stepper motors. 
                     It interfaces with the Stepper Driver to read and write commands to it. 
                     This allows it to control each motor independently. Additionally, it 
                     handles the firing of the nerf gun.                  
-        @param      queues is the queue of shared data for positioning
+        @param      targets is the queue of (polar, azimuthal, flags) targets for positioning
         @param     paused is the boolean determining whether the paused command has been sent
         @param      stopped is the boolean determining whether the stopped command has been sent
+        @param      flush is the share counting how many times points were flushed
     '''
     # SCK2, MISO2, MOSI2
     spi_bus = pyb.SPI(2, pyb.SPI.CONTROLLER, baudrate=1000000, polarity=1, phase=1, firstbit=pyb.SPI.MSB)
 
-    # Stepper driver instance for both DOF
-    polar = StepperDriver(spi_bus, 'C6', 'C7')
-    azimuthal = StepperDriver(spi_bus, 'B6', 'B7')
-
     # TIM1_CH2N -> PB0
     tmr = pyb.Timer(1, period=3, prescaler=0)
     clk = pyb.Pin('B0', pyb.Pin.OUT_PP)
-    # 20 MHz clock
+    # 20 MHz clock, started first as the constructors read the registers they shadow
     ch = tmr.channel(2, pin=clk, mode=pyb.Timer.PWM, pulse_width=2)
 
+    # wake up as soon as a target is reached
+    wake = cotask.running.go if cotask.running else None
+
+    # Stepper driver instance for both DOF
+    polar = StepperDriver(spi_bus, 'C6', 'C7', POLAR_NINT, wake, RPM, ACCEL)
+    azimuthal = StepperDriver(spi_bus, 'B6', 'B7', AZIMUTHAL_NINT, wake, RPM, ACCEL)
+
     # read the type version from each controller
     s1, d1 = polar.controller.rw_value(1, TYPE_VERSION, 0)
     s2, d2 = azimuthal.controller.rw_value(1, TYPE_VERSION, 0)
@@ -82,66 +270,136 @@ def task_positioning(queues, paused, stopped):
     # instantiate nerf
     nerf = Nerf('C2', 'C3', 'C0', 15)
 
-    # calibrate initially
+    # angles of the limit switches of each axis
+    axes = ((polar, -83, 83), (azimuthal, -28, 20))
+
+    # lines can only be fired on the fly with the interrupts of both controllers
+    sweep_ready = POLAR_NINT is not None and AZIMUTHAL_NINT is not None
+
+    # calibrate both axes at once initially, the controllers keep their position
+    #   through a soft reset so the saved calibration is checked first
     #   todo: calibrate on all draws?
-    polar.calibrate(-83, 83)
-    azimuthal.calibrate(-28, 20)
+    yield from home_all(axes, stopped, True)
+
+    # step ranges of the compiled plan being run
+    plan_range = [[0, 0], [0, 0]]
+
+    # shots fired since the queue last ran dry and when the first left
+    shots = 0
+    shots_start = 0
+
+    # targets to run before the queue, such as shots skipped by a sweep
+    retry = []
+    flushed = flush.get()
 
     # yield after setup
     yield
 
     # main task loop
     while 1:
+        # the retried targets go with the queue
+        if flush.get() != flushed:
+            flushed = flush.get()
+            retry.clear()
         # if stopped
         if stopped.get():
             polar.disable()
             azimuthal.disable()
+            nerf.spool_down()
+        # homing was cut short, or too much drift was latched on a move
+        elif not polar.calibrated or not azimuthal.calibrated:
+            polar.enable()
+            azimuthal.enable()
+            yield from home_all(axes, stopped)
         # if there is a point to move to
-        elif is_point(queues):
+        elif retry or targets.any():
             # get point from queue
-            p, a, f = unpack_point(queues)
+            p, a, f = retry.pop(0) if retry else targets.get()
             # enable drivers
             polar.enable()
             azimuthal.enable()
             # start move
-            polar.set_target_angle(p)
-            azimuthal.set_target_angle(a)
-            # wait for move to complete, updating point if needed
-            while not polar.is_target_reached() and not azimuthal.is_target_reached():
-                # e-stop
-                if stopped.get():
-                    polar.disable()
-                    azimuthal.disable()
-                    # ensure nerf doesn't fire
-                    f = 0
-                    break
-                # check if all three queues have a point
-                if is_point(queues):
-                    p, a, f = unpack_point(queues)
-                    polar.set_target_angle(p)
-                    azimuthal.set_target_angle(a)
+            steps = set_targets(polar, azimuthal, p, a, f, plan_range, nerf if sweep_ready else None)
+            if steps is None:
                 yield
-            # fire if set
-            if f:
-                try:
-                    yield from nerf.fire(stopped)
-                except OutOfAmmo:
-                    # todo: notify
-                    #   once reloaded, re-calibrate
-                    paused.put(1)
-                    yield
-                    polar.calibrate(-83, 83)
-                    azimuthal.calibrate(-28, 20)
-                    nerf.reload(15)
-                except BarrelJam:
-                    paused.put(1)
+                continue
+            fired = 0
+            try:
+                # fire the rest of a line on the fly
+                if f & SWEEP and sweep_ready:
+                    record, f = (p, a, f), 0
+                    fired = yield from sweep(polar, azimuthal, nerf, targets, steps, record,
+                                             stopped, flush, plan_range, retry)
+                # spool up while moving
+                if f & FIRE:
+                    nerf.spool_up()
+                generation = flush.get()
+                move_start = pyb.millis()
+                # wait for move to complete
+                while True:
+                    if polar.is_target_reached() and azimuthal.is_target_reached():
+                        # past a switch that was armed, go back to the target it corrected
+                        #   too much drift and the axis is homed again
+                        back = polar.end_latch()
+                        if not (azimuthal.end_latch() or back):
+                            if not (polar.calibrated and azimuthal.calibrated):
+                                f = 0
+                            break
+                    # let go of the trigger of the last shot
+                    nerf.update()
+                    # e-stop
+                    if stopped.get():
+                        polar.disable()
+                        azimuthal.disable()
+                        # ensure nerf doesn't fire
+                        f = 0
+                        break
+                    # pre-empted by a flush (home), go straight to the next point
+                    if flush.get() != generation:
+                        f = 0
+                        break
+                    # the interrupt was missed, or the axis is stuck
+                    if pyb.elapsed_millis(move_start) > MOVE_TIMEOUT:
+                        if not (polar.confirm_target() and azimuthal.confirm_target()):
+                            print('move timed out, homing')
+                            polar.calibrated = False
+                            azimuthal.calibrated = False
+                            f = 0
+                        break
                     yield
-                    polar.calibrate(-83, 83)
-                    azimuthal.calibrate(-28, 20)
-                    nerf.reload(10)
-                    # todo: notify
-                    pass
-            # unblock
-            #   todo: only unblock when no exception
-            queues[0].clear()
+                # let the gun settle at the target
+                if f & FIRE:
+                    settle_start = pyb.millis()
+                    while pyb.elapsed_millis(settle_start) < SETTLE_TIME:
+                        nerf.update()
+                        if stopped.get() or flush.get() != generation:
+                            f = 0
+                            break
+                        yield
+                # fire if set
+                if f & FIRE:
+                    # returns once the dart has left, the next move starts while the trigger releases
+                    if (yield from nerf.trigger(stopped)):
+                        fired = 1
+                    if not PIPELINED:
+                        while not nerf.is_ready():
+                            yield
+            except OutOfAmmo:
+                # fire the shot once reloaded
+                if f & FIRE:
+                    retry.insert(0, (p, a, f))
+                yield from recover(nerf, axes, paused, stopped, 15)
+            except BarrelJam:
+                yield from recover(nerf, axes, paused, stopped, 10)
+            if fired:
+                if shots == 0:
+                    shots_start = pyb.millis()
+                shots += fired
+        # nothing to do, stop spool once no shot has come for a while
+        else:
+            nerf.update()
+            nerf.check_idle()
+            if shots:
+                report_rate(shots, shots_start, nerf.shot_time)
+                shots = 0
         yield
@@ -18,20 +18,62 @@
 '''
 
 
-import micropython, pyb
-from pyb import UART
-
 try:
     from ulab import numpy as np
 except ImportError:
     import numpy as np
 import os
+import math
+import struct
+import array
 
 # constants
 #   todo: calibrate?
 d = 108
 l = 12
 h = 0
+# tables and plans store d, l and h as 32-bit floats, so they are compared within this
+GEOMETRY_TOLERANCE = 1e-4
+
+# number of characters read from flash at a time when parsing hpgl files
+CHUNK_SIZE = 256
+
+# inverse kinematics lookup table file
+IK_TABLE = 'ik.tbl'
+# magic, nx, ny, x0, y0, step, d, l, h, max error
+IK_HEADER = '<4sHHfffffff'
+IK_MAGIC = b'IKT1'
+# marks grid points that have no solution
+IK_INVALID = -32768
+
+# target record: polar, azimuthal, flags
+TARGET = '<ffB'
+
+# target flags
+FIRE = 0x01
+# target is in steps of a compiled plan instead of degrees
+STEPS = 0x02
+# target holds the first/last step of each axis's range in a compiled plan
+RANGE_MIN = 0x04
+RANGE_MAX = 0x08
+# target is fired on the fly as the compare axis crosses it, while sweeping along a line
+SWEEP = 0x10
+# the azimuthal axis is compared for a sweep instead of the polar axis
+SWEEP_AZIMUTHAL = 0x20
+
+# sweep along lines instead of stopping for every shot
+SWEEP_LINES = True
+# degrees the compare axis needs to move between shots for a line to be swept
+SWEEP_SPACING = 1.0
+
+# compiled plan file
+# magic, number of records, d, l, h, then min/max angle and min/max step for each axis
+PLAN_HEADER = '<4sIfffffiiffii'
+PLAN_MAGIC = b'PLN1'
+# polar step, azimuthal step, flags
+PLAN_RECORD = '<iiB'
+# number of records read from flash at a time
+PLAN_CHUNK = 32
 
 
 def sec(t):
@@ -88,7 +130,7 @@ def dg_theta(theta):
     return dgm
 
 
-def newton_raphson(fcn, jacobian, guess, thresh):
+def newton_raphson(fcn, jacobian, guess, thresh, max_iter=20):
     '''!@brief      This function does the Newton Raphson iterations
         @details    This function finds the roots of the equations using the Newton-Raphson 
                     method to find the desired angular coordinates.
@@ -96,43 +138,343 @@ def newton_raphson(fcn, jacobian, guess, thresh):
         @param      jacobian Jacobian matric derived from kinematics calculations
         @param      guess Guess from the previous iterations
         @param      thresh Determines how close to target coordinate is acceptable
+        @param      max_iter Maximum number of iterations before giving up
         @return     result The result of the iteration, also the angular data. 
     '''
     result = guess - np.dot(np.linalg.inv(jacobian(guess)), fcn(guess))
 
-    while any(abs(_) > thresh for _ in fcn(result)):
+    for _ in range(max_iter):
+        if not any(abs(_) > thresh for _ in fcn(result)):
+            break
         result = result - np.dot(np.linalg.inv(jacobian(result)), fcn(result))
 
     return result
 
 
-def compute_steps(xy_des, queues):
-    '''!@brief      This function utilizes the newton_raphson function. 
-        @details    This function utilizes the newton_raphson function to find 
+def solve_decoupled(x, y, thresh=1e-3, max_iter=20):
+    '''!@brief      This function finds the angles for one point using the structure of g.
+        @details    The y-dimension of g only depends on theta[1], which is why dg_theta 
+                    is triangular. theta[1] is found with a 1-D Newton iteration on the 
+                    y-dimension alone, starting from its exact value for h = 0, and theta[0] 
+                    then follows from the x-dimension in closed form. With h = 0 no 
+                    iterations are needed at all. 
+        @param      x is the x coordinate
+        @param      y is the y coordinate
+        @param      thresh Determines how close to target coordinate is acceptable
+        @param      max_iter Maximum number of iterations before giving up
+        @return     theta0 the polar angle in radians
+        @return     theta1 the azimuthal angle in radians
+        @return     iterations the number of Newton iterations used
+        @return     converged whether the solution met thresh
+    '''
+    theta1 = math.atan(y / d)
+    iterations = 0
+    if h:
+        last_step = None
+        while True:
+            r = d + h * math.sin(theta1)
+            gm = y - h * math.cos(theta1) - math.tan(theta1) * r
+            if abs(gm) <= thresh:
+                break
+            # diverging or out of iterations
+            if iterations >= max_iter:
+                return 0.0, 0.0, iterations, False
+            step = gm / (-r / pow(math.cos(theta1), 2))
+            if last_step is not None and abs(step) >= abs(last_step):
+                return 0.0, 0.0, iterations, False
+            theta1 -= step
+            if not -math.pi / 2 < theta1 < math.pi / 2:
+                return 0.0, 0.0, iterations, False
+            last_step = step
+            iterations += 1
+
+    theta0 = math.atan(-x / (d + h * math.sin(theta1)))
+    return theta0, theta1, iterations, True
+
+
+def newton_raphson_batch(xy_des, guess, thresh, max_iter=20):
+    '''!@brief      This function does the Newton Raphson iterations for many points at once
+        @details    This function solves the same equations as g and dg_theta, but for every 
+                    point in xy_des at the same time using array operations. Since the 
+                    Jacobian is upper triangular, each 2x2 system is solved by back substitution 
+                    instead of a matrix inverse. Points stop being updated once they converge, 
+                    so each point gets the same iterations as the scalar newton_raphson. 
+        @param      xy_des array of desired x,y coordinates, one point per row
+        @param      guess Initial guess, either one for every point or an array of 
+                    guesses per point for each angle
+        @param      thresh Determines how close to target coordinate is acceptable
+        @param      max_iter Maximum number of iterations before giving up on a point
+        @return     theta0 array of polar angles in radians
+        @return     theta1 array of azimuthal angles in radians
+        @return     converged array that is true for points which met thresh
+    '''
+    x = xy_des[:, 0]
+    y = xy_des[:, 1]
+    theta0 = np.zeros(len(x)) + guess[0]
+    theta1 = np.zeros(len(x)) + guess[1]
+
+    for i in range(max_iter + 1):
+        # evaluate g
+        r = d + h * np.sin(theta1)
+        tan0 = np.tan(theta0)
+        tan1 = np.tan(theta1)
+        g0 = x + r * tan0
+        g1 = y - h * np.cos(theta1) - tan1 * r
+
+        # always take the first step, like newton_raphson
+        converged = np.maximum(abs(g0), abs(g1)) <= thresh
+        if i == max_iter or (i > 0 and np.all(converged)):
+            break
+
+        # evaluate dg_theta and back substitute
+        cos0 = np.cos(theta0)
+        cos1 = np.cos(theta1)
+        dg00 = r / (cos0 * cos0)
+        dg01 = h * cos1 * tan0
+        dg11 = -r / (cos1 * cos1)
+        step1 = g1 / dg11
+        step0 = (g0 - dg01 * step1) / dg00
+
+        if i == 0:
+            theta0 = theta0 - step0
+            theta1 = theta1 - step1
+        else:
+            theta0 = np.where(converged, theta0, theta0 - step0)
+            theta1 = np.where(converged, theta1, theta1 - step1)
+
+    return theta0, theta1, converged
+
+
+def _solve_row(x, y, guess=(0, 0)):
+    '''!@brief      This function solves one row of the inverse kinematics table.
+        @details    Neighbouring rows have close solutions, so each row is started from 
+                    the solution of the row before it instead of from 0, 0. Points 
+                    without a solution in that row are started from 0, 0. 
+        @param      x array of x coordinates in the row
+        @param      y y coordinate of the row
+        @param      guess Initial polar and azimuthal angles, one for the row or arrays per point
+        @return     array of interleaved polar and azimuthal angles in hundredths of a degree
+        @return     guess to start the next row from
+    '''
+    xy = np.array([x, np.zeros(len(x)) + y]).transpose()
+    theta0, theta1, converged = newton_raphson_batch(xy, guess, 1e-3)
+    row = array.array('h', [IK_INVALID] * (2 * len(x)))
+    for i in range(len(x)):
+        p = round((18000 * theta0[i]) / np.pi)
+        a = round((18000 * theta1[i]) / np.pi)
+        # only keep solutions facing the board
+        if converged[i] and -9000 < p < 9000 and -9000 < a < 9000:
+            row[2 * i] = p
+            row[2 * i + 1] = a
+    return row, (np.where(converged, theta0, 0), np.where(converged, theta1, 0))
+
+
+def build_ik_table(path=IK_TABLE, x_range=(-150, 150), y_range=(-55, 35), step=2.5):
+    '''!@brief      This function precomputes the inverse kinematics over the workspace.
+        @details    The workspace is sampled on a square grid and solved one row at a time 
+                    with newton_raphson_batch. Angles are stored as 16-bit hundredths of a 
+                    degree after a header holding the grid layout and the d, l and h the 
+                    table was built for. The interpolation error is estimated by solving 
+                    the centre of every cell and is stored in the header as well. It is 
+                    only checked at the centres, so it is an estimate and not a bound. 
+        @param      path is the file the table is written to
+        @param      x_range minimum and maximum x coordinate of the grid
+        @param      y_range minimum and maximum y coordinate of the grid
+        @param      step spacing between grid points
+        @return     max_error the estimated maximum interpolation error in degrees, 
+                    measured at cell centres
+    '''
+    nx = int(round((x_range[1] - x_range[0]) / step)) + 1
+    ny = int(round((y_range[1] - y_range[0]) / step)) + 1
+    x = np.linspace(x_range[0], x_range[0] + (nx - 1) * step, num=nx)
+    x_centre = x[:-1] + step / 2
+
+    max_error = 0
+    with open(path, 'wb') as file:
+        file.write(struct.pack(IK_HEADER, IK_MAGIC, nx, ny, x_range[0], y_range[0], step, d, l, h, 0))
+        last = None
+        guess = (0, 0)
+        for j in range(ny):
+            y = y_range[0] + j * step
+            # the centres start from the previous row, half a step away
+            centre_guess = ((guess[0][:-1] + guess[0][1:]) / 2,
+                            (guess[1][:-1] + guess[1][1:]) / 2) if last is not None else None
+            row, guess = _solve_row(x, y, guess)
+            file.write(row)
+            # compare the middle of each cell in the previous band against the solver
+            if last is not None:
+                centre, _ = _solve_row(x_centre, y - step / 2, centre_guess)
+                for i in range(2 * (nx - 1)):
+                    corners = (last[i], last[i + 2], row[i], row[i + 2])
+                    if IK_INVALID in corners or centre[i] == IK_INVALID:
+                        continue
+                    error = abs(sum(corners) / 4 - centre[i]) / 100
+                    if error > max_error:
+                        max_error = error
+            last = row
+        # include rounding to hundredths of a degree
+        max_error += 0.005
+        # patch error into header
+        file.seek(struct.calcsize(IK_HEADER) - 4)
+        file.write(struct.pack('<f', max_error))
+    return max_error
+
+
+def same_geometry(td, tl, th):
+    '''!@brief      Checks whether a file was made for the current d, l and h
+        @param      td is the d stored in the file
+        @param      tl is the l stored in the file
+        @param      th is the h stored in the file
+        @return     True if all three match within GEOMETRY_TOLERANCE
+    '''
+    return abs(td - d) <= GEOMETRY_TOLERANCE and abs(tl - l) <= GEOMETRY_TOLERANCE \
+        and abs(th - h) <= GEOMETRY_TOLERANCE
+
+
+class IKTable:
+    '''!@brief      A precomputed inverse kinematics table stored on flash.
+        @details    Objects of this class look up angles from a table made by build_ik_table. 
+                    Only the four grid points around a coordinate are read from the file, and 
+                    the angles are bilinearly interpolated between them, so a lookup costs 
+                    the same no matter where the point is. 
+    '''
+    def __init__(self, path=IK_TABLE):
+        '''!@brief      Opens an inverse kinematics table
+            @details    Raises ValueError if the file is not a table or it was built for a 
+                        different d, l or h. 
+            @param      path is the file the table was written to
+        '''
+        self.file = open(path, 'rb')
+        header = self.file.read(struct.calcsize(IK_HEADER))
+        try:
+            magic, self.nx, self.ny, self.x0, self.y0, self.step, td, tl, th, self.max_error = \
+                struct.unpack(IK_HEADER, header)
+        except ValueError:
+            magic = None
+        if magic != IK_MAGIC or not same_geometry(td, tl, th):
+            self.file.close()
+            raise ValueError('stale ik table')
+        self.offset = len(header)
+        # two neighbouring grid points
+        self.buff = bytearray(8)
+
+    def read_pair(self, i, j):
+        '''!@brief      Reads grid points (i, j) and (i + 1, j)
+            @return     polar and azimuthal angles of both points in hundredths of a degree
+        '''
+        self.file.seek(self.offset + 4 * (j * self.nx + i))
+        self.file.readinto(self.buff)
+        return struct.unpack('<hhhh', self.buff)
+
+    def lookup(self, x, y):
+        '''!@brief      Interpolates the angles for an x,y coordinate
+            @details    Points in the outer cells of the grid, or next to grid points without 
+                        a solution, are not looked up so the solver can be used instead. 
+            @param      x is the x coordinate
+            @param      y is the y coordinate
+            @return     polar and azimuthal angles in degrees, or None if the point is not covered
+        '''
+        u = (x - self.x0) / self.step
+        v = (y - self.y0) / self.step
+        if not (1 <= u < self.nx - 2 and 1 <= v < self.ny - 2):
+            return None
+        i = int(u)
+        j = int(v)
+        p00, a00, p10, a10 = self.read_pair(i, j)
+        p01, a01, p11, a11 = self.read_pair(i, j + 1)
+        if IK_INVALID in (p00, p10, p01, p11, a00, a10, a01, a11):
+            return None
+        u -= i
+        v -= j
+        polar = ((p00 * (1 - u) + p10 * u) * (1 - v) + (p01 * (1 - u) + p11 * u) * v) / 100
+        azimuthal = ((a00 * (1 - u) + a10 * u) * (1 - v) + (a01 * (1 - u) + a11 * u) * v) / 100
+        return polar, azimuthal
+
+    def close(self):
+        '''!@brief      Closes the table file
+        '''
+        self.file.close()
+
+
+def solve_segment(xy_des, table=None):
+    '''!@brief      This function finds the angles for every point in a segment.
+        @details    Points are looked up in the table when one is given, and points 
+                    the table does not cover are solved with solve_decoupled. 
+        @param      xy_des desired x,y coordinates, one point per row
+        @param      table IKTable to look points up in, or None to always solve
+        @return     polar angles in degrees
+        @return     azimuthal angles in degrees
+        @return     converged whether each point has a valid solution
+    '''
+    polar = [0.0] * len(xy_des)
+    azimuthal = [0.0] * len(xy_des)
+    converged = [True] * len(xy_des)
+    for i in range(len(xy_des)):
+        x, y = xy_des[i][0], xy_des[i][1]
+        angles = table.lookup(x, y) if table is not None else None
+        if angles is None:
+            theta0, theta1, _, converged[i] = solve_decoupled(x, y)
+            angles = (180 * theta0) / math.pi, (180 * theta1) / math.pi
+        polar[i], azimuthal[i] = angles
+    return polar, azimuthal, converged
+
+
+def sweep_flags(polar, azimuthal, converged):
+    '''!@brief      This function precomputes the fire schedule of a line.
+        @details    The first shot of a line is fired standing still. The rest are 
+                    fired on the fly as the axis that moves the most along the line 
+                    crosses them, as long as that axis moves one way by at least 
+                    SWEEP_SPACING between shots. Otherwise every shot of the line is 
+                    fired standing still. 
+        @param      polar angles in degrees
+        @param      azimuthal angles in degrees
+        @param      converged whether each point has a valid solution
+        @return     target flags for each point
+    '''
+    flags = [FIRE] * len(polar)
+    points = [i for i in range(len(polar)) if converged[i]]
+    if len(points) < 2:
+        return flags
+
+    # compare the axis that moves the most
+    first, last = points[0], points[-1]
+    compare_azimuthal = abs(azimuthal[last] - azimuthal[first]) > abs(polar[last] - polar[first])
+    axis = azimuthal if compare_azimuthal else polar
+    direction = axis[last] - axis[first]
+    for i in range(1, len(points)):
+        spacing = axis[points[i]] - axis[points[i - 1]]
+        if spacing * direction <= 0 or abs(spacing) < SWEEP_SPACING:
+            return flags
+
+    sweep = FIRE | SWEEP | (SWEEP_AZIMUTHAL if compare_azimuthal else 0)
+    for i in points[1:]:
+        flags[i] = sweep
+    return flags
+
+
+def compute_steps(xy_des, targets, table=None, sweep=False):
+    '''!@brief      This function utilizes the solve_segment function. 
+        @details    This function utilizes the solve_segment function to find 
                     angular data corresponding the desired x,y coords. It then 
                     puts it into the Queue.
-        @param      xy_des desired x,y coordinates for newton_raphson to go through
-        @param      queues the shared queues that we put our data into. 
+        @param      xy_des desired x,y coordinates for solve_segment to go through
+        @param      targets the shared queue that we put our data into. 
+        @param      table IKTable used to look up angles, or None to always solve
+        @param      sweep whether the line is fired on the fly where possible
     '''
-    # unpack queues
-    p, a, f = queues
+    # compute desired positions for the whole segment
+    polar, azimuthal, converged = solve_segment(xy_des, table)
+    flags = sweep_flags(polar, azimuthal, converged) if sweep else [FIRE] * len(xy_des)
 
-    last_guess = [0, 0]
     for i in range(len(xy_des)):
-        # wait until positioning task un-blocks
-        while p.any() or a.any() or f.any():
-            yield
-        # compute desired position
-        last_guess = newton_raphson(lambda theta: g(xy_des[i], theta), dg_theta, last_guess, 1e-3)
-        print('moving to: [' + str((180 * last_guess[0]) / np.pi) + ', ' + str((180 * last_guess[1]) / np.pi) + ']')
+        if not converged[i]:
+            print('no solution for: ' + str(xy_des[i]))
+            continue
+        print('queued: [' + str(polar[i]) + ', ' + str(azimuthal[i]) + ']')
 
         # update target point
-        # todo: put without blocking
-        p.clear()
-        p.put((180 * last_guess[0]) / np.pi)
-        a.put((180 * last_guess[1]) / np.pi)
         # we only move to places we are going to fire
-        f.put(1)
+        yield from put_target(targets, polar[i], azimuthal[i], flags[i])
 
         yield
 
@@ -153,96 +495,223 @@ def coords(line, pen_type):
     return list(zip(pen, x_coords, y_coords))
 
 
+def read_commands(path, chunk_size=CHUNK_SIZE):
+    '''!@brief      This function reads the PU and PD commands out of an HPGL file.
+        @details    The file is read in fixed-size chunks rather than all at once, so 
+                    only the current chunk and a partially read command are ever held 
+                    in memory. Newlines and other whitespace between or inside commands 
+                    are ignored, and commands other than PU and PD are skipped. 
+        @param      path is the path to the hpgl file
+        @param      chunk_size is the number of characters read from the file at a time
+        @return     generator of PU and PD commands that carry coordinates
+    '''
+    tail = ''
+    with open(path, 'r') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            # the last piece may be an incomplete command, keep it for the next chunk
+            commands = (tail + chunk).split(';')
+            tail = commands.pop()
+            for command in commands:
+                command = ''.join(command.split())
+                if len(command) > 2 and command[:2] in ('PU', 'PD'):
+                    yield command
+    # file may not end with a terminator
+    tail = ''.join(tail.split())
+    if len(tail) > 2 and tail[:2] in ('PU', 'PD'):
+        yield tail
+
+
+def read_points(path, chunk_size=CHUNK_SIZE):
+    '''!@brief      This function reads the cartesian coordinates out of an HPGL file.
+        @details    Each command from read_commands is converted into its points as 
+                    soon as it is read, so the points come out one at a time in file order. 
+        @param      path is the path to the hpgl file
+        @param      chunk_size is the number of characters read from the file at a time
+        @return     generator of (pen, x, y) points
+    '''
+    for command in read_commands(path, chunk_size):
+        yield from coords(command, 1 if command[:2] == 'PD' else 0)
+
+
 def filter_hpgl(cart_coords):
     '''!@brief      This function removes excess noise from the HPGL files.
         @details    HPGL files inherintly come with a lot of noise, so this function 
-                    removes points that are too close together and also any unecessary instruction.,
-        @param      cart_coords is the list of unfiltered cartesian coordinates. 
-        @return     filterd_coords is the list of filterd cartesian coordinates
-    '''
-    filtered_coords = []
-    for i in range(0, (len(cart_coords) - 1)):
-        filtered_coords.append(cart_coords[i])
-        if i >= 1:
-            l = cart_coords[i - 1][0]
-            r = cart_coords[i + 1][0]
-            xdiff = abs(filtered_coords[-1][1] - filtered_coords[-2][1])
-            ydiff = abs(filtered_coords[-1][2] - filtered_coords[-2][2])
-            if filtered_coords[-2][0] == cart_coords[i][0] == 0:
-                filtered_coords = filtered_coords[:-2]
-                filtered_coords.append(cart_coords[i])
-            elif l == 0 and r == 0:
-                filtered_coords = filtered_coords[:-1]
-            elif cart_coords[i][0] == 1 and filtered_coords[-2][0] != 0:
-                if xdiff <= ((300 * 5) / 1000) and ydiff <= ((300 * 5) / 1000):
-                # if (xdiff * ydiff) <= ((300 * 5) / 1000):
-                    filtered_coords = filtered_coords[:-1]
-    return filtered_coords
-
-
-def draw(cart_coords, queues):
+                    removes points that are too close together and also any unecessary instruction.
+                    Points are filtered as they stream in, only looking back at the previous 
+                    input point and the last kept point and ahead at the next input point, so 
+                    it runs in linear time without copying the list of kept points. 
+        @param      cart_coords is the iterable of unfiltered cartesian coordinates. 
+        @return     generator of the filtered cartesian coordinates
+    '''
+    points = iter(cart_coords)
+    try:
+        current = next(points)
+    except StopIteration:
+        return
+
+    # 300 hpgl units
+    thresh = (300 * 5) / 1000
+
+    # previous input point and last kept point (may still be replaced or dropped)
+    previous = None
+    kept = None
+    for following in points:
+        if kept is None:
+            kept = current
+        # consecutive pen ups, only the latest one is needed
+        elif kept[0] == current[0] == 0:
+            kept = current
+        # lone point between two pen ups
+        elif previous[0] == 0 and following[0] == 0:
+            pass
+        # pen down too close to the last pen down
+        elif current[0] == 1 and kept[0] != 0 and \
+                abs(current[1] - kept[1]) <= thresh and abs(current[2] - kept[2]) <= thresh:
+            pass
+        else:
+            yield kept
+            kept = current
+        previous = current
+        current = following
+    if kept is not None:
+        yield kept
+
+
+def interpolate(cart_coords):
     '''!@brief      This function interpolates cartesian coordinates between points. 
         @details    This function find the number of steps necessary between two PD points. 
                     It has a set distance between points, and interpolates so that the 
                     distance between points is consistent. 
-        @param      cart_coords is the list of filtered cart_coords that needs to be interpolated.
-        @param      queues is the shared queues that we use. 
+        @param      cart_coords is the iterable of filtered cart_coords that needs to be interpolated.
+        @return     generator of xy_des arrays for each line, or None for points that don't end a line
     '''
-    print('in draw')
-    for i in range(0, (len(cart_coords) - 1)):
-        if cart_coords[i][0] == cart_coords[i + 1][0] == 1:
-            xy1 = (cart_coords[i][1], cart_coords[i][2])
-            xy2 = (cart_coords[i + 1][1], cart_coords[i + 1][2])
+    last = None
+    for point in cart_coords:
+        if last is not None and last[0] == point[0] == 1:
+            xy1 = (last[1], last[2])
+            xy2 = (point[1], point[2])
             NUM_STEPS = round(np.sqrt(pow(xy2[0] - xy1[0], 2) + pow(xy2[1] - xy1[1], 2)) / 2.5)
             print('found line: ' + str(NUM_STEPS) + ' from ' + str(xy1) + ' to ' + str(xy2))
             x_des = np.linspace(xy1[0], xy2[0], num=max(NUM_STEPS,2), endpoint=False)
             y_des = np.linspace(xy1[1] + 12, xy2[1] + 12, num=max(NUM_STEPS,2), endpoint=False)
             # xy_des = np.transpose([x_des,y_des])
-            xy_des = np.array([x_des, y_des]).transpose()
-
-            yield from compute_steps(xy_des, queues)
+            yield np.array([x_des, y_des]).transpose()
+        else:
+            yield None
+        last = point
+
+
+def draw(cart_coords, targets, table=None, sweep=False):
+    '''!@brief      This function sends the interpolated coordinates to positioning. 
+        @param      cart_coords is the iterable of filtered cart_coords that needs to be interpolated.
+        @param      targets is the shared queue that we use. 
+        @param      table IKTable used to look up angles, or None to always solve
+        @param      sweep whether lines are fired on the fly where possible
+    '''
+    print('in draw')
+    for xy_des in interpolate(cart_coords):
+        if xy_des is not None:
+            yield from compute_steps(xy_des, targets, table, sweep)
         yield
 
 
-def task_process_hpgl(fname, queues):
+def put_target(targets, p, a, f):
+    '''!@brief      This function sends one target to positioning once it is ready for it. 
+        @param      targets the shared queue that we put our data into. 
+        @param      p polar target
+        @param      a azimuthal target
+        @param      f target flags
+    '''
+    # wait for room in the lookahead buffer
+    yield from targets.put_wait((p, a, f))
+
+
+def stream_plan(path, targets):
+    '''!@brief      This function sends a plan compiled on the PC to positioning.
+        @details    Plans are made by pc/compile_hpgl.py and already hold the step 
+                    targets of every shot, so records are read from flash a chunk at 
+                    a time and passed on as they are. The step range each axis was 
+                    compiled for is sent first so positioning can adjust for its own 
+                    calibration. 
+        @param      path is the path to the plan file
+        @param      targets the shared queue that we put our data into. 
+    '''
+    size = struct.calcsize(PLAN_RECORD)
+    buff = bytearray(size * PLAN_CHUNK)
+    with open(path, 'rb') as file:
+        try:
+            magic, count, pd, pl, ph, pa1, pa2, ps1, ps2, aa1, aa2, as1, as2 = \
+                struct.unpack(PLAN_HEADER, file.read(struct.calcsize(PLAN_HEADER)))
+        except ValueError:
+            magic = None
+        if magic != PLAN_MAGIC:
+            print('not a plan: ' + path)
+            return
+        if not same_geometry(pd, pl, ph):
+            print('plan compiled for different geometry: ' + str((pd, pl, ph)))
+        print('streaming ' + str(count) + ' targets')
+
+        # step range of each axis
+        yield from put_target(targets, ps1, as1, RANGE_MIN)
+        yield from put_target(targets, ps2, as2, RANGE_MAX)
+
+        while True:
+            n = file.readinto(buff)
+            if not n:
+                break
+            for i in range(0, n - n % size, size):
+                p, a, f = struct.unpack_from(PLAN_RECORD, buff, i)
+                yield from put_target(targets, p, a, f | STEPS)
+                yield
+
+
+def task_process_hpgl(fname, targets, flush):
     '''!@brief      This is the task function that puts all the hpgl functions together.
         @details    This function goes through and does both the Newton-Raphson and the 
                     hpgl/coordinates stuff. 
         @param      fname is the name of the function associated with task_process_hpgl
-        @param      queues is the queue that is shared between tasks. 
+        @param      targets is the queue of targets that is shared between tasks. 
+        @param      flush is the share counting how many times points were flushed
     '''
-    while 1:
-        if fname.any():
-            # get filename from queue
-            filename = []
-            while fname.any():
-                filename.append(fname.get())
-            filename = bytearray(filename).decode()
-
-            # read hpgl from file
-            with open('hpgl/' + filename, 'r') as file:
-                line = file.readline()
-
-            # parse into commands
-            commands = line.strip().split(';')
-
-            # parse commands into points
-            cart_coords = []
-            for command in commands:
-                if len(command) > 2:
-                    if 'PU' in command:
-                        cart_coords.extend(coords(command, 0))
-                    elif 'PD' in command:
-                        cart_coords.extend(coords(command, 1))
+    # use precomputed inverse kinematics if available
+    try:
+        table = IKTable(IK_TABLE)
+        print('ik table max error: ' + str(table.max_error))
+    except (OSError, ValueError):
+        table = None
 
-            print(len(cart_coords))
+    while 1:
+        # wait for a filename, then get the rest of it from queue
+        filename = [(yield from fname.get_wait())]
+        while fname.any():
+            filename.append(fname.get())
+        filename = bytearray(filename).decode()
+
+        # compiled plans go straight to positioning
+        if filename.endswith('.plan'):
+            points = None
+            job = stream_plan('hpgl/' + filename, targets)
+        else:
+            # stream points from file
+            points = read_points('hpgl/' + filename)
 
             # filter coords
-            #   todo: yield
-            cart_coords = filter_hpgl(cart_coords)
-
-            print(len(cart_coords))
+            cart_coords = filter_hpgl(points)
 
             # generate positioning commands
-            yield from draw(cart_coords, queues)
-        yield
+            job = draw(cart_coords, targets, table, SWEEP_LINES)
+
+        # run job, dropping it if the buffered points get flushed
+        generation = flush.get()
+        for _ in job:
+            yield
+            if flush.get() != generation:
+                print('dropped ' + filename)
+                job.close()
+                # close file
+                if points is not None:
+                    points.close()
+                break
@@ -13,7 +13,11 @@
     @date       6/10/2022
     
 '''
+import json
+import micropython
 import pyb
+from Motion import pmul_pdiv, plan_move, derive, report, velocity_register, RPM, ACCEL
+from Motion import RAMP_MODE, SOFT_MODE, VELOCITY_MODE, HOLD_MODE
 
 # stepper motor registers
 X_TARGET = 0x00
@@ -41,11 +45,38 @@ TYPE_VERSION = 0x39
 REFERENCE_SWITCHES = 0x3E
 GLOBAL_PARAMETERS = 0x3F
 
-# ramp modes
-RAMP_MODE = 0b00
-SOFT_MODE = 0b01
-VELOCITY_MODE = 0b10
-HOLD_MODE = 0b11
+# registers changed by the chip itself, always read from the chip
+VOLATILE = (X_ACTUAL, V_ACTUAL, A_ACTUAL, X_LATCHED, USTEP_COUNT_4210, TYPE_VERSION, REFERENCE_SWITCHES)
+# bits of shadowed registers that are only set by the chip
+STATUS_BITS = {REFCONF_RAMPMODE: 0xFF0000, INTERRUPT_MASK_FLAGS: 0x0000FF}
+
+# limit switch positions of each axis, saved after every calibration
+CALIBRATION = 'calibration.json'
+# largest drift in steps corrected without a full calibration
+DRIFT_TOLERANCE = 16
+# steps short of a switch to move to quickly before touching it off
+TOUCH_MARGIN = 100
+# targets this many steps from a switch arm the latch to correct drift on the way
+REREF_WINDOW = 32
+# speed to home at
+HOME_RPM = 5.6
+
+# REF_CONF bits of REFCONF_RAMPMODE that let the axis run past a switch
+DISABLE_STOP_L = 0x100
+DISABLE_STOP_R = 0x200
+
+# interrupt flags, masked by the same bits shifted into the upper byte
+INT_POS_END = 0x01
+# position compare flag and mask in POS_COMP_INT_4210
+POS_COMP_FLAG = 0x01
+POS_COMP_MASK = 0x100
+
+# status bits returned with every datagram
+STATUS_XEQT = 0x01
+STATUS_RS = 0x02
+STATUS_INT = 0x80
+# how old a cached status can be and still be used, in us
+STATUS_MAX_AGE = 500
 
 
 class TMC2208:
@@ -85,59 +116,167 @@ def sign_extend(val, width):
     return val
 
 
+@micropython.viper
+def pack_datagram(buff: ptr8, head: int, data: int):
+    '''!@brief      Packs a datagram into a buffer
+        @param      buff is the 4 byte buffer
+        @param      head is the register address and read/write bit
+        @param      data is the 24 bit data
+     
+    '''
+    buff[0] = head
+    buff[1] = (data >> 16) & 0xFF
+    buff[2] = (data >> 8) & 0xFF
+    buff[3] = data & 0xFF
+
+
+@micropython.viper
+def unpack_datagram(buff: ptr8) -> int:
+    '''!@brief      Unpacks the data from a received datagram
+        @param      buff is the 4 byte buffer
+        @return     the 24 bit data
+     
+    '''
+    return (buff[1] << 16) | (buff[2] << 8) | buff[3]
+
+
 # todo: limit switches/calibration
 class TMC4210:
     '''!@brief      A TMC4210 class.
         @details    Objects of this class can be used to configure the TMC4210.
                     This involves reading and writing to its registries.  
     '''
-    def __init__(self, spi_bus, cs, v_max, a_max):
+    def __init__(self, spi_bus, cs, v_max, a_max, pulse_div=10, ramp_div=10):
         '''!@brief      Initializes the TMC4210 
             @param      spi_bus is the spi object created to interface with this peripheral
             @param      cs is the chip select unique to the peripheral
             @param      v_max is the maximum velocity used for stepper motor speed control, in steps per unit time
             @param      a_max is the a maximum acceleration used for stepper motor speed control, in steps per (unit time)^2
+            @param      pulse_div is the clock pre-divider of the velocity
+            @param      ramp_div is the clock pre-divider of the acceleration
          
         '''
         self.spi_bus = spi_bus
         self.cs = cs
         self.cs.value(1)
 
-        # todo: base dividers on 20MHz clock
-        #   velocity = steps / unit time <-> PULSE_DIV
-        #   accel = (steps / unit time ^ 2) / 256 <-> RAMP_DIV
-        #       range 0 - 2047
-        # todo: calculate programmatically from desired RPM
-        RAMP_DIV = 10
-        PULSE_DIV = 10
+        # reused for every datagram
+        self.buff = bytearray(4)
+        # last value written to each register
+        self.shadow = {}
+
+        # target reached interrupt, polled over spi until enable_interrupt
+        self.nint = None
+        self.handler = None
+        self.target_flag = 0
+        self.int_mask = INT_POS_END << 8
+        # called from the interrupt instead when the position compare is running
+        self.compare = None
+        self.compare_flag = 0
+        # last target written, None when unknown
+        self.target = None
+
+        # status from the last datagram and when it was received, None when stale
+        self.status = 0
+        self.status_time = None
+        # number of datagrams sent
+        self.transfers = 0
 
         # enable Step/Dir interface
         self.rw_value(0, IF_CONFIGURATION_4210, 0x20)
 
-        # configure clock pre-dividers
-        self.rw_value(0, PULSE_RAMP_DIV, (PULSE_DIV & 0x0F) << 12 | (RAMP_DIV & 0x0F) << 8)
-
         # set velocity range
         self.rw_value(0, V_MIN, 1)
-        self.rw_value(0, V_MAX, v_max)
-
-        # optimized calculation of PMUL and PDIV
-        p = a_max / (128 * pow(2, RAMP_DIV - PULSE_DIV))
-        for PDIV in range(0, 14):
-            PMUL = 0.99 * p * pow(2, 3) * pow(2, PDIV)
-            if 128 <= PMUL <= 255:
-                print('found val pmul: ' + str(PMUL) + 'pdiv: ' + str(PDIV))
-                break
-        # set acceleration and proportionality factor
-        self.rw_value(0, A_MAX, a_max)
-        self.rw_value(0, PMUL_PDIV, 0x8000 | (int(PMUL) & 0x7F) << 8 | (int(PDIV) & 0x0F))
+        # set clock pre-dividers, velocity and acceleration
+        self.configure(pulse_div, ramp_div, v_max, a_max)
 
         # defaults to ramp mode
         self.set_mode(RAMP_MODE)
         # setup both reference switches
-        s, d = self.rw_value(1, GLOBAL_PARAMETERS, 0)
-        d |= 0x200000
-        self.rw_value(0, GLOBAL_PARAMETERS, d)
+        self.update_bits(GLOBAL_PARAMETERS, 0x200000, 0x200000)
+
+    @micropython.native
+    def transfer(self, head, data):
+        '''!@brief      Sends a datagram without allocating
+            @param      head is the register address and read/write bit
+            @param      data is the data to be written to registry
+            @return     data is the data read from the registry
+         
+        '''
+        buff = self.buff
+        pack_datagram(buff, head, data)
+
+        # print(''.join('{:02x}'.format(x) for x in buff))
+
+        self.cs.low()
+        self.spi_bus.send_recv(buff, buff)
+        self.cs.high()
+
+        # print(''.join('{:02x}'.format(x) for x in buff))
+
+        # every datagram returns the status, keep it
+        self.status = buff[0]
+        self.status_time = pyb.micros()
+        self.transfers += 1
+
+        return unpack_datagram(buff)
+
+    def read(self, reg):
+        '''!@brief      Reads a registry
+            @param      reg is the registry to be read
+            @return     data is the data read from the registry
+         
+        '''
+        return self.transfer((reg & 0x3F) << 1 | 0x01, 0)
+
+    def write(self, reg, data):
+        '''!@brief      Writes a registry
+            @param      reg is the registry to be written
+            @param      data is the data to be written to registry
+         
+        '''
+        self.transfer((reg & 0x3F) << 1, data)
+        self.shadow[reg] = data & 0xFFFFFF
+
+    def get(self, reg):
+        '''!@brief      Gets the value of a registry, only reading volatile ones from the chip
+            @param      reg is the registry to be read
+            @return     data is the last value written, or the data read from the registry
+         
+        '''
+        if reg in VOLATILE:
+            return self.read(reg)
+        d = self.shadow.get(reg)
+        if d is None:
+            # never written, read it once
+            d = self.read(reg) & ~STATUS_BITS.get(reg, 0)
+            self.shadow[reg] = d
+        return d
+
+    def update_bits(self, reg, mask, value):
+        '''!@brief      Changes some bits of a registry from its shadow
+            @param      reg is the registry to be changed
+            @param      mask is the bits to be changed
+            @param      value is the new value of the bits
+         
+        '''
+        d = self.get(reg) & ~(mask | STATUS_BITS.get(reg, 0))
+        self.write(reg, d | (value & mask))
+
+    def verify_shadow(self):
+        '''!@brief      Compares the shadowed registers with the chip
+            @details    Meant as a diagnostic, it reads every shadowed registry back. 
+            @return     list of (registry, shadow, chip) for every registry that differs
+         
+        '''
+        mismatches = []
+        for reg, d in self.shadow.items():
+            if reg in VOLATILE:
+                continue
+            chip = self.read(reg)
+            if (chip ^ d) & 0xFFFFFF & ~STATUS_BITS.get(reg, 0):
+                mismatches.append((reg, d, chip))
+        return mismatches
 
     def rw_value(self, rw, reg, data):
         '''!@brief      Handles reading and writing to registries
@@ -151,53 +290,144 @@ class TMC4210:
         # data should always be zero for read (rw == 1)
         if rw:
             data = 0
+        if not rw:
+            self.shadow[reg] = data & 0xFFFFFF
+        data = self.transfer((reg & 0x3F) << 1 | rw & 0x01, data)
+        return self.status, data
 
-        buff = bytearray(4)
+    def configure(self, pulse_div, ramp_div, v_max, a_max):
+        '''!@brief     Sets the clock pre-dividers and the full velocity and acceleration
+            @details   Values can be found from a speed and acceleration with Motion.derive. 
+            @param     pulse_div is the clock pre-divider of the velocity
+            @param     ramp_div is the clock pre-divider of the acceleration
+            @param     v_max is the maximum velocity
+            @param     a_max is the maximum acceleration
+         
+        '''
+        self.pulse_div = pulse_div
+        self.ramp_div = ramp_div
+        # full limits, moves may use less
+        self.v_max = v_max
+        self.a_max = a_max
 
-        buff[0] = (reg & 0x3F) << 1 | rw & 0x01
-        buff[1] = (data & 0xFF0000) >> 16
-        buff[2] = (data & 0x00FF00) >> 8
-        buff[3] = data & 0x0000FF
+        # configure clock pre-dividers
+        self.write(PULSE_RAMP_DIV, (pulse_div & 0x0F) << 12 | (ramp_div & 0x0F) << 8)
+        # proportionality factor depends on the dividers too
+        self.shadow.pop(V_MAX, None)
+        self.shadow.pop(A_MAX, None)
+        self.set_limits(v_max, a_max)
 
-        # print(''.join('{:02x}'.format(x) for x in buff))
+    def set_limits(self, v_max, a_max):
+        '''!@brief     Sets the maximum velocity and acceleration of the following moves
+            @details   Only registers that change are written. 
+            @param     v_max is the maximum velocity
+            @param     a_max is the maximum acceleration
+         
+        '''
+        if self.shadow.get(V_MAX) != v_max:
+            self.write(V_MAX, v_max)
+        if self.shadow.get(A_MAX) != a_max:
+            pmul, pdiv = pmul_pdiv(a_max, self.pulse_div, self.ramp_div)
+            self.write(A_MAX, a_max)
+            self.write(PMUL_PDIV, 0x8000 | (pmul & 0x7F) << 8 | (pdiv & 0x0F))
 
-        self.cs.value(0)
-        self.spi_bus.send_recv(buff, buff)
-        self.cs.value(1)
+    def set_mode(self, mode):
+        '''!@brief     Changes the mode in which the stepper motors are operating in
+            @param     mode is the mode to be changed to. 
+         
+        '''
+        # set RAMP_MODE bits of shared register
+        self.update_bits(REFCONF_RAMPMODE, 0b11, mode)
+        # position is no longer held at the last target
+        self.target = None
+        self.status_time = None
 
-        # print(''.join('{:02x}'.format(x) for x in buff))
+    def enable_interrupt(self, nint, handler=None):
+        '''!@brief      Sets up the target reached interrupt
+            @details    The nINT output goes low once the target position is reached, 
+                        which sets target_flag so is_target_reached no longer needs the bus. 
+            @param      nint is the pin connected to the nINT output
+            @param      handler is called from the interrupt once the target is reached, 
+                        such as the go method of the task waiting on the move
+         
+        '''
+        self.handler = handler
+        self.target_flag = 0
+        # unmask position end and clear pending flags
+        self.rw_value(0, INTERRUPT_MASK_FLAGS, self.int_mask | 0xFF)
+        self.nint = pyb.ExtInt(nint, pyb.ExtInt.IRQ_FALLING, pyb.Pin.PULL_UP, self.target_callback)
 
-        status = buff[0]
-        data = (buff[1] << 16) | (buff[2] << 8) | buff[3]
+    def target_callback(self, line):
+        '''!@brief      callback once the target position has been reached, or the compare position crossed
+            @param      line IRQ for callback
+         
+        '''
+        if self.compare is not None:
+            self.compare_flag = 1
+            self.compare(line)
+        else:
+            self.target_flag = 1
+        if self.handler:
+            self.handler(line)
 
-        return status, data
+    def start_compare(self, pos, handler):
+        '''!@brief      Starts calling handler from the interrupt as the position crosses pos
+            @details    The target reached interrupt is masked until end_compare, so nINT 
+                        only signals the compare. Needs enable_interrupt. 
+            @param      pos is the first position to compare with
+            @param      handler is called from the interrupt as the position is crossed
+         
+        '''
+        self.compare = handler
+        # mask position end and clear pending flags
+        self.int_mask = 0
+        self.write(INTERRUPT_MASK_FLAGS, 0xFF)
+        self.next_compare(pos)
 
-    def set_mode(self, mode):
-        '''!@brief     Changes the mode in which the stepper motors are operating in
-            @param     mode is the mode to be changed to. 
+    def next_compare(self, pos):
+        '''!@brief      Moves the compare to the next position
+            @param      pos is the position to compare with
+         
+        '''
+        self.write(POS_COMP_4210, pos)
+        # clear flag to release nINT, it falls again at the new position
+        self.compare_flag = 0
+        self.write(POS_COMP_INT_4210, POS_COMP_MASK | POS_COMP_FLAG)
+
+    def end_compare(self):
+        '''!@brief      Stops the compare and goes back to the target reached interrupt
          
         '''
-        # read existing shared register
-        s, d = self.rw_value(1, REFCONF_RAMPMODE, 0)
-        # mask and set RAMP_MODE bits
-        d &= ~(0b11)
-        d |= (mode & 0b11)
-        # write back to shared register
-        self.rw_value(0, REFCONF_RAMPMODE, d)
+        self.write(POS_COMP_INT_4210, POS_COMP_FLAG)
+        self.compare = None
+        self.int_mask = INT_POS_END << 8
+        self.write(INTERRUPT_MASK_FLAGS, self.int_mask | 0xFF)
+        # the flag was masked, check for the target once
+        self.target_flag = 1 if self.get_status() & STATUS_XEQT else 0
 
     def set_target_position(self, pos):
         '''!@brief     Sets the target Position
             @param     pos the position to be set
          
         '''
-        self.rw_value(0, X_TARGET, pos)
+        if self.nint is not None:
+            # already there or on the way, keep the flag as it is
+            if pos == self.target:
+                return
+            # clear flags to release nINT, it falls again at the new target
+            self.write(INTERRUPT_MASK_FLAGS, self.int_mask | 0xFF)
+            self.target_flag = 0
+        self.write(X_TARGET, pos)
+        self.target = pos
+        # status was sampled before the new target
+        self.status_time = None
 
     def get_target_position(self):
         '''!@brief      Reads the target position
             @return     d returns the data at the target position
          
         '''
-        s, d = self.rw_value(1, X_TARGET, 0)
+        d = self.get(X_TARGET)
         return d
 
     def get_actual_position(self):
@@ -205,32 +435,55 @@ class TMC4210:
             @return     d returns what the actual position is
          
         '''
-        s, d = self.rw_value(1, X_ACTUAL, 0)
+        d = self.read(X_ACTUAL)
         return sign_extend(d, 24)
 
-    def is_target_reached(self):
+    def status_age(self):
+        '''!@brief      Gets the age of the cached status
+            @return     microseconds since the status was received, None when it is stale
+         
+        '''
+        if self.status_time is None:
+            return None
+        return pyb.elapsed_micros(self.status_time)
+
+    def get_status(self, max_age=0):
+        '''!@brief      Gets the status byte, only reading it when the cached one is too old
+            @param      max_age is how old the cached status can be, in us
+            @return     the status byte
+         
+        '''
+        age = self.status_age()
+        if age is None or age > max_age:
+            # read dummy register
+            self.read(TYPE_VERSION)
+        return self.status
+
+    def is_target_reached(self, max_age=STATUS_MAX_AGE):
         '''!@brief      checks to see if motor has reached the target position
+            @param      max_age is how old the status can be, in us
             @return     boolean of whether or not it has been met
          
         '''
-        # read dummy register
-        s, d = self.rw_value(1, TYPE_VERSION, 0)
+        # set by the interrupt
+        if self.nint is not None:
+            return self.target_flag
         # return xEQt1 bit
-        return s & 0x01
+        return self.get_status(max_age) & STATUS_XEQT
 
     def set_target_velocity(self, v_target):
         '''!@brief     Sets the target velocity
             @param     v_target the velocity to be set
          
         '''
-        self.rw_value(0, V_TARGET, v_target)
+        self.write(V_TARGET, v_target)
 
     def get_target_velocity(self):
         '''!@brief      Reads the target velocity
             @return     d returns the data at the target position
          
         '''
-        s, d = self.rw_value(1, V_TARGET, 0)
+        d = self.get(V_TARGET)
         return sign_extend(d, 12)
 
     def get_actual_velocity(self):
@@ -238,7 +491,7 @@ class TMC4210:
             @return     d returns what the actual velocity is
          
         '''
-        s, d = self.rw_value(1, V_ACTUAL, 0)
+        d = self.read(V_ACTUAL)
         return sign_extend(d, 12)
 
 
@@ -255,24 +508,34 @@ class StepperDriver:
         @details    This class creates objects that work with both TMC4210 and the TMC2208. 
                     This allows for separate objects that can control the motors independently.
     '''
-    def __init__(self, spi_bus, cs, en):
+    def __init__(self, spi_bus, cs, en, nint=None, handler=None, rpm=RPM, accel=ACCEL):
         '''!@brief      Initializes the StepperDriver
             @param      spi_bus is the spi object created to interface with this peripheral
             @param      cs is the chip select unique to the peripheral
             @param      en is the enable pin for the TMC2208
+            @param      nint is the pin connected to the nINT output of the TMC4210, 
+                        the target is polled over spi if not given
+            @param      handler is called from the interrupt once the target is reached
+            @param      rpm is the maximum speed in revolutions per minute
+            @param      accel is the maximum acceleration in degrees per second squared
          
         '''
-        
-        # configurable vmax and amax
-
-        self.controller = TMC4210(spi_bus, pyb.Pin(cs, pyb.Pin.OUT_PP), 1288, 512)
-
-        self.driver = TMC2208(pyb.Pin(en, pyb.Pin.OUT_PP))
-
         # set by the stepper motor
         self.degrees_per_step = 1.8
         # set by the stepper control board
         self.micro_steps = 8
+
+        # configurable vmax and amax
+        config = self.derive(rpm, accel)
+        self.controller = TMC4210(spi_bus, pyb.Pin(cs, pyb.Pin.OUT_PP), config[2], config[3],
+                                  config[0], config[1])
+        self.home_velocity = self.velocity(HOME_RPM)
+        # the calibration is saved under the chip select
+        self.name = cs
+        if nint is not None:
+            self.controller.enable_interrupt(nint, handler)
+
+        self.driver = TMC2208(pyb.Pin(en, pyb.Pin.OUT_PP))
         # how many steps in a single revolution
         self.steps_per_rotation = (360 * self.micro_steps) / self.degrees_per_step
 
@@ -283,6 +546,46 @@ class StepperDriver:
         # map over entire stepper range
         self.min_step = 0
         self.max_step = self.steps_per_rotation
+        # set once homed
+        self.calibrated = False
+        # switch the latch is armed for during a move, True for right, None if not armed
+        self.latch = None
+        # step an armed move goes back to once past the switch
+        self.latch_step = 0
+        # switch the axis was last corrected on and hasn't left, True for right
+        self.referenced = None
+
+    def derive(self, rpm, accel):
+        '''!@brief      Finds the controller configuration for a speed and acceleration
+            @param      rpm is the maximum speed in revolutions per minute
+            @param      accel is the maximum acceleration in degrees per second squared
+            @return     PULSE_DIV, RAMP_DIV, V_MAX and A_MAX
+         
+        '''
+        steps_per_rev = round(360 / self.degrees_per_step)
+        config = derive(rpm, accel, self.micro_steps, steps_per_rev)
+        if config is None:
+            raise ValueError('no TMC4210 configuration for ' + str(rpm) + ' rpm, ' + str(accel) + ' deg/s^2')
+        print(report(config, rpm, accel, self.micro_steps, steps_per_rev))
+        return config
+
+    def configure(self, rpm, accel):
+        '''!@brief      Changes the maximum speed and acceleration
+            @param      rpm is the maximum speed in revolutions per minute
+            @param      accel is the maximum acceleration in degrees per second squared
+         
+        '''
+        self.controller.configure(*self.derive(rpm, accel))
+        self.home_velocity = self.velocity(HOME_RPM)
+
+    def velocity(self, rpm):
+        '''!@brief      Finds the velocity register value of a speed with the current dividers
+            @param      rpm is the speed in revolutions per minute
+            @return     velocity register value
+         
+        '''
+        return velocity_register(rpm, self.controller.pulse_div, self.micro_steps,
+                                 round(360 / self.degrees_per_step))
 
     def set_range(self, a1, a2, s1, s2):
         '''!@brief      sets the range at which the stepper motor can operate
@@ -297,57 +600,185 @@ class StepperDriver:
         self.min_step = s1
         self.max_step = s2
 
-    # todo: yield while waiting for position to latch
-    def calibrate(self, a1, a2):
+    def find_switch(self, right, stopped=None):
+        '''!@brief      Moves towards a limit switch until its position is latched
+            @details    Yields while waiting for the position to latch. 
+            @param      right is whether to home on the right switch or the left switch
+            @param      stopped is the share that aborts homing when set, if given
+            @return     the latched position, None if stopped
+         
+        '''
+        # home at full acceleration
+        self.controller.set_limits(self.controller.v_max, self.controller.a_max)
+        # setup switch for homing, with both switches stopping the axis
+        self.controller.update_bits(REFCONF_RAMPMODE, 0x800 | DISABLE_STOP_L | DISABLE_STOP_R,
+                                    0x800 if right else 0)
+        self.latch = None
+        self.referenced = None
+        # init latching mechanism
+        self.controller.write(X_LATCHED, 0)
+        # move towards the switch until limit is hit
+        self.controller.set_target_velocity(self.home_velocity if right else -self.home_velocity)
+        print('homing ' + ('right' if right else 'left'))
+        while self.controller.read(REFCONF_RAMPMODE) & 0x10000:
+            if stopped is not None and stopped.get():
+                return None
+            yield
+        # read latched position
+        x = sign_extend(self.controller.read(X_LATCHED), 24)
+        print('found ' + ('right: ' if right else 'left: ') + str(x))
+        return x
+
+    def home(self, a1, a2, stopped=None):
         '''!@brief      Calibrates the stepper motors based on the calibration instruction in the TMC4210 data manual. 
+            @details    This is a generator, it yields between polls of the switches so other 
+                        tasks and the other axis keep running, and gives up if stopped is set. 
             @param      a1 angle associated with one of the limit switches
             @param      a2 angle associated with the other limit switch.
+            @param      stopped is the share that aborts homing when set, if given
+            @return     boolean of whether the axis was calibrated
          
         '''
+        self.calibrated = False
+        self.latch = None
         # set to velocity mode
         self.controller.set_mode(VELOCITY_MODE)
-        # read ramp mode
-        s, d = self.controller.rw_value(1, REFCONF_RAMPMODE, 0)
 
-        # setup right switch for homing
-        self.controller.rw_value(0, REFCONF_RAMPMODE, d | 0x800)
-        # init latching mechanism
-        self.controller.rw_value(0, X_LATCHED, 0)
-        # move in positive direction until limit is hit
-        self.controller.set_target_velocity(500)
-        print('homing right')
-        s, d = self.controller.rw_value(1, REFCONF_RAMPMODE, 0)
-        while d & 0x10000:
-            s, d = self.controller.rw_value(1, REFCONF_RAMPMODE, 0)
-        # read latched position
-        s, r = self.controller.rw_value(1, X_LATCHED, 0)
-        r = sign_extend(r, 24)
-        print('found right: ' + str(r))
+        r = yield from self.find_switch(True, stopped)
+        l = None
+        if r is not None:
+            l = yield from self.find_switch(False, stopped)
+        if l is None:
+            self.stop()
+            return False
 
-        # setup left switch for homing
-        self.controller.rw_value(0, REFCONF_RAMPMODE, d & ~0x800)
-        # init latching mechanism
-        self.controller.rw_value(0, X_LATCHED, 0)
-        # move in positive direction until limit is hit
-        self.controller.set_target_velocity(-500)
-        print('homing left')
-        s, d = self.controller.rw_value(1, REFCONF_RAMPMODE, 0)
-        while d & 0x10000:
-            s, d = self.controller.rw_value(1, REFCONF_RAMPMODE, 0)
-        # read latched position
-        s, l = self.controller.rw_value(1, X_LATCHED, 0)
-        l = sign_extend(l, 24)
-        print('found left: ' + str(l))
+        return (yield from self.center(a1, a2, l, r, stopped))
+
+    def rehome(self, a1, a2, stopped=None):
+        '''!@brief      Checks the saved calibration by touching off the right switch only. 
+            @details    If the switch is found within DRIFT_TOLERANCE of where it was saved, 
+                        both limits are shifted by the drift. Otherwise, or without a saved 
+                        calibration, the left switch is found as well like home does. This is 
+                        a generator like home. 
+            @param      a1 angle associated with one of the limit switches
+            @param      a2 angle associated with the other limit switch.
+            @param      stopped is the share that aborts homing when set, if given
+            @return     boolean of whether the axis was calibrated
+         
+        '''
+        saved = self.load_calibration()
+        if saved is None:
+            return (yield from self.home(a1, a2, stopped))
+        l, r = saved
+
+        # still calibrated, move most of the way quickly
+        if self.calibrated:
+            self.calibrated = False
+            self.set_target_step(r - TOUCH_MARGIN)
+            while not self.is_target_reached():
+                if stopped is not None and stopped.get():
+                    self.stop()
+                    return False
+                yield
+        self.calibrated = False
+        self.latch = None
+
+        # set to velocity mode
+        self.controller.set_mode(VELOCITY_MODE)
+        x = yield from self.find_switch(True, stopped)
+        if x is None:
+            self.stop()
+            return False
+
+        drift = x - r
+        if -DRIFT_TOLERANCE <= drift <= DRIFT_TOLERANCE:
+            print('drift: ' + str(drift))
+            l += drift
+        else:
+            # lost, find the other switch too
+            print('drift: ' + str(drift) + ', full calibration')
+            l = yield from self.find_switch(False, stopped)
+            if l is None:
+                self.stop()
+                return False
+
+        return (yield from self.center(a1, a2, l, x, stopped))
+
+    def center(self, a1, a2, l, r, stopped=None):
+        '''!@brief      Sets the limits found by homing and moves to 0
+            @param      a1 angle associated with one of the limit switches
+            @param      a2 angle associated with the other limit switch.
+            @param      l the step of the left switch
+            @param      r the step of the right switch
+            @param      stopped is the share that aborts homing when set, if given
+            @return     boolean of whether the axis was calibrated
+         
+        '''
         # back to ramp mode
         self.controller.set_mode(RAMP_MODE)
 
         # set limits
         self.set_range(a1, a2, l, r)
+        self.save_calibration(l, r)
         # move to 0
         self.set_target_angle(0)
         while not self.is_target_reached():
+            if stopped is not None and stopped.get():
+                self.stop()
+                return False
+            yield
+        self.calibrated = True
+        return True
+
+    def load_calibration(self, path=CALIBRATION):
+        '''!@brief      Reads the saved limits of this axis
+            @param      path is the file the calibration is saved in
+            @return     the left and right step, None if never saved
+         
+        '''
+        try:
+            with open(path) as file:
+                l, r = json.load(file)[self.name]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return l, r
+
+    def save_calibration(self, l, r, path=CALIBRATION):
+        '''!@brief      Saves the limits of this axis, keeping those of other axes
+            @param      l the step of the left switch
+            @param      r the step of the right switch
+            @param      path is the file the calibration is saved in
+         
+        '''
+        try:
+            with open(path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            saved = {}
+        saved[self.name] = [l, r]
+        try:
+            with open(path, 'w') as file:
+                json.dump(saved, file)
+        except OSError:
+            print('could not save calibration')
+
+    def calibrate(self, a1, a2):
+        '''!@brief      Calibrates the stepper motors, blocking until done. 
+            @param      a1 angle associated with one of the limit switches
+            @param      a2 angle associated with the other limit switch.
+         
+        '''
+        for _ in self.home(a1, a2):
             pass
 
+    def stop(self):
+        '''!@brief      Stops the motor where it is and goes back to ramp mode
+         
+        '''
+        self.controller.set_target_velocity(0)
+        self.controller.set_target_position(self.controller.get_actual_position())
+        self.controller.set_mode(RAMP_MODE)
+
     def enable(self):
         '''!@brief      Enables the stepper motor driver
          
@@ -365,8 +796,189 @@ class StepperDriver:
             @param      deg the degree that the target angle is to be set to
          
         '''
-        self.controller.set_target_position(map_range(deg, self.min_angle, self.max_angle,
-                                                      self.min_step, self.max_step))
+        self.check_latch()
+        self.move(self.angle_to_step(deg))
+
+    def angle_to_step(self, deg):
+        '''!@brief      Finds the step of an angle in this calibration
+            @param      deg the angle in degrees
+            @return     the step
+         
+        '''
+        return map_range(deg, self.min_angle, self.max_angle, self.min_step, self.max_step)
+
+    def set_target_step(self, step):
+        '''!@brief      Sets the target position directly in steps
+            @param      step the step that the target position is to be set to
+         
+        '''
+        self.check_latch()
+        self.move(int(step))
+
+    def position(self):
+        '''!@brief      Gets where the axis is headed, without a transfer when the target is known
+            @return     the target step, or the actual step if the target is unknown
+         
+        '''
+        if self.controller.target is not None:
+            return self.controller.target
+        return self.controller.get_actual_position()
+
+    def move(self, step, limits=None):
+        '''!@brief      Starts a move, arming the latch when the target is close to a switch
+            @details    An armed move is aimed DRIFT_TOLERANCE past the switch, with the 
+                        switch no longer stopping the axis, so the switch is always crossed 
+                        and latched. end_latch then corrects the limits from it and goes 
+                        back to the step. 
+            @param      step the step that the target position is to be set to
+            @param      limits is the (v_max, a_max) of the move, full limits if not given
+         
+        '''
+        if limits is None:
+            limits = self.controller.v_max, self.controller.a_max
+        step = self.clamp(step)
+        target = self.aim(step)
+        if target != step:
+            self.arm_latch(target > step, step)
+        elif self.near_switch(step) is None:
+            # moved away, the next time at a switch corrects again
+            self.referenced = None
+        self.controller.set_limits(*limits)
+        self.controller.set_target_position(target)
+
+    def near_switch(self, step):
+        '''!@brief      Finds the switch a step is within REREF_WINDOW of
+            @param      step the step
+            @return     True for the right switch, False for the left, None if neither
+         
+        '''
+        if not self.calibrated:
+            return None
+        if step >= self.max_step - REREF_WINDOW:
+            return True
+        if step <= self.min_step + REREF_WINDOW:
+            return False
+        return None
+
+    def aim(self, step):
+        '''!@brief      Finds where a move to a step is aimed
+            @details    Only the first move to a switch is aimed past it, the moves after 
+                        that stay near it are not corrected again. 
+            @param      step the step
+            @return     the step within the switches, or past the switch it is close to
+         
+        '''
+        step = self.clamp(step)
+        right = self.near_switch(step)
+        if right is None or right == self.referenced:
+            return step
+        if right:
+            return int(self.max_step) + DRIFT_TOLERANCE
+        return int(self.min_step) - DRIFT_TOLERANCE
+
+    def arm_latch(self, right, step):
+        '''!@brief      Sets up a switch to latch the position on the next move
+            @param      right is whether to latch the right switch or the left switch
+            @param      step the step the move is going to, once the latch is checked
+         
+        '''
+        # setup switch for latching, run past it instead of stopping
+        bits = 0x800 | DISABLE_STOP_R if right else DISABLE_STOP_L
+        mask = 0x800 | DISABLE_STOP_L | DISABLE_STOP_R
+        if self.controller.get(REFCONF_RAMPMODE) & mask != bits:
+            self.controller.update_bits(REFCONF_RAMPMODE, mask, bits)
+        # init latching mechanism
+        self.controller.write(X_LATCHED, 0)
+        self.latch = right
+        self.latch_step = step
+
+    def clamp(self, step):
+        '''!@brief      Limits a step to the span between the switches once calibrated
+            @details    The switches stop the axis, so a target past one is never reached. 
+            @param      step the step
+            @return     the step the axis can reach
+         
+        '''
+        if not self.calibrated:
+            return step
+        return max(int(self.min_step), min(int(self.max_step), step))
+
+    def check_latch(self):
+        '''!@brief      Corrects the limits if the last move touched the switch it was armed for
+            @details    The switch is latched at the same step as during homing, so the 
+                        difference is the drift since. Drift past DRIFT_TOLERANCE clears 
+                        calibrated so the axis gets homed again. 
+            @return     the drift in steps, None if the switch was not touched
+         
+        '''
+        if self.latch is None:
+            return None
+        right = self.latch
+        self.latch = None
+        # the switches stop the axis again
+        self.controller.update_bits(REFCONF_RAMPMODE, DISABLE_STOP_L | DISABLE_STOP_R, 0)
+        # still waiting for the switch
+        if self.controller.read(REFCONF_RAMPMODE) & 0x10000:
+            return None
+        x = sign_extend(self.controller.read(X_LATCHED), 24)
+        drift = x - (self.max_step if right else self.min_step)
+        if -DRIFT_TOLERANCE <= drift <= DRIFT_TOLERANCE:
+            if drift:
+                self.set_range(self.min_angle, self.max_angle, self.min_step + drift, self.max_step + drift)
+        else:
+            print('drift: ' + str(drift) + ', needs calibration')
+            self.calibrated = False
+        return drift
+
+    def end_latch(self):
+        '''!@brief      Corrects the limits once an armed move is past its switch
+            @details    Called once the target is reached, so the latch is read once per 
+                        move. The axis is sent back to the step it was moving to, shifted 
+                        by the drift. A switch that wasn't crossed is further off than 
+                        DRIFT_TOLERANCE, so the axis needs homing. 
+            @return     boolean of whether the axis was sent back
+         
+        '''
+        if self.latch is None:
+            return False
+        right = self.latch
+        drift = self.check_latch()
+        if drift is None:
+            print('switch not found, needs calibration')
+            self.calibrated = False
+        if not self.calibrated:
+            return False
+        self.referenced = right
+        self.controller.set_limits(self.controller.v_max, self.controller.a_max)
+        self.controller.set_target_position(self.clamp(self.latch_step + drift))
+        return True
+
+    def confirm_target(self):
+        '''!@brief      Checks the target over spi, in case its interrupt was missed
+            @return     boolean of whether the target has been reached
+         
+        '''
+        reached = 1 if self.controller.get_status() & STATUS_XEQT else 0
+        if self.controller.nint is not None and self.controller.compare is None:
+            self.controller.target_flag = reached
+        return bool(reached)
+
+    def map_step(self, step, s1, s2):
+        '''!@brief      Maps a step from another calibration onto this one
+            @details    Used for plans compiled on the PC for a step range of s1 to s2. 
+                        Only integer math is used, and steps are passed through as is 
+                        when the ranges already match. 
+            @param      step the step to be mapped
+            @param      s1 minimum step the step was computed for
+            @param      s2 maximum step the step was computed for
+            @return     the matching step in this calibration
+         
+        '''
+        step, s1, s2 = int(step), int(s1), int(s2)
+        min_step, max_step = int(self.min_step), int(self.max_step)
+        if s1 == min_step and s2 == max_step:
+            return step
+        return min_step + ((step - s1) * (max_step - min_step)) // (s2 - s1)
 
     def get_actual_angle(self):
         '''!@brief      Reads the actual angle
@@ -376,10 +988,50 @@ class StepperDriver:
                          self.min_angle, self.max_angle)
 
     # todo: implement and test
-    def is_target_reached(self):
+    def is_target_reached(self, max_age=STATUS_MAX_AGE):
         '''!@brief      checks to see if the target position is equal to the actual position
+            @param      max_age is how old the status can be, in us
             @return     boolean of whether target has been reached or not. 
          
         '''
         # todo: does this really work (TEST!)
-        return self.controller.is_target_reached()
+        return self.controller.is_target_reached(max_age)
+
+
+def home_all(axes, stopped=None, quick=False):
+    '''!@brief      Calibrates several axes at the same time
+        @details    This is a generator, the homing of every axis is stepped in turn 
+                    and it yields in between. 
+        @param      axes is a list of (StepperDriver, a1, a2) for each axis
+        @param      stopped is the share that aborts homing when set, if given
+        @param      quick is whether to only check the saved calibration with rehome
+        @return     boolean of whether every axis was calibrated
+     
+    '''
+    homing = [(axis.rehome if quick else axis.home)(a1, a2, stopped) for axis, a1, a2 in axes]
+    while homing:
+        for h in tuple(homing):
+            try:
+                next(h)
+            except StopIteration:
+                homing.remove(h)
+        yield
+    return all(axis.calibrated for axis, a1, a2 in axes)
+
+
+def move_all(moves, v_limits=None):
+    '''!@brief      Starts a move of several axes so they all arrive at the same time
+        @details    The velocity and acceleration of each axis are scaled by plan_move 
+                    from the distance left to its new target. 
+        @param      moves is a list of (StepperDriver, step) for each axis
+        @param      v_limits is a list of the highest velocity register value of each 
+                    axis, None for an axis or all axes to use their full velocity
+     
+    '''
+    distances = [axis.aim(step) - axis.position() for axis, step in moves]
+    limits = [(axis.controller.v_max, axis.controller.a_max) for axis, step in moves]
+    if v_limits is not None:
+        limits = [(v if cap is None else max(1, min(v, cap)), a) for (v, a), cap in zip(limits, v_limits)]
+    for (axis, step), limit in zip(moves, plan_move(distances, limits)):
+        axis.check_latch()
+        axis.move(int(step), limit)
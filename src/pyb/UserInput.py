@@ -14,21 +14,44 @@
 '''
 import pyb
 import os
+from task import cotask
+from ProcessesHPGL import FIRE
 
 MAX_FILENAME = 100
+# ms without a byte before an upload is given up
+UPLOAD_TIMEOUT = 1000
+# bytes written to the file at once while uploading
+UPLOAD_CHUNK = 64
 
 
-def task_user_input(queues, filename, paused, stopped):
+def flush_points(targets, flush):
+    '''!@brief      This function throws away all buffered points
+        @details    Bumping flush tells the hpgl task to drop the file it is working on 
+                    and the positioning task to drop the move it is making. 
+        @param      targets is the queue of positional data
+        @param      flush is the share counting how many times points were flushed
+    '''
+    targets.clear()
+    flush.put((flush.get() + 1) & 0xFFFF)
+
+
+def task_user_input(targets, filename, paused, stopped, flush):
     '''!@brief      This function reads the user input
         @details    This function reads the user input from uart and them provides necessary 
                     information to the other tasks. This includes direct commands, drawing commands, 
                     stopping, and resuming. 
-        @param      queues is the queue of positional data
+        @param      targets is the queue of positional data
         @param      filename is the name of the hpgl file to be drawn
         @param      paused is a boolean to check if the drawing task needs to pause
         @param      stopped is the boolean to check if the stepper motors need to stop.
+        @param      flush is the share counting how many times points were flushed
     '''
     uart = pyb.UART(2, 115200, bits=8, parity=None, stop=1)
+    # run as soon as a command has been received
+    try:
+        uart.irq(handler=cotask.running.go, trigger=pyb.UART.IRQ_RXIDLE)
+    except AttributeError:
+        pass
 
     while 1:
         if uart.any():
@@ -57,14 +80,13 @@ def task_user_input(queues, filename, paused, stopped):
                 except ValueError:
                     uart.write(bytearray('x: d - bad value of args'.encode()))
                     continue
-                # update queues if move is completed
-                pp, aa, ff = queues
-                if not pp.any() and not aa.any() and not ff.any():
-                    pp.put(p)
-                    aa.put(a)
-                    ff.put(f)
+                # only the fire flag is the user's, the rest are set by the hpgl task
+                f &= FIRE
+                # add to queue if there is room
+                if not targets.full():
+                    targets.put((p, a, f))
                 else:
-                    # todo: send error (position not reached)
+                    # todo: send error (too many points queued)
                     pass
 
             # draw file command (f:xyz.hpgl)
@@ -99,17 +121,37 @@ def task_user_input(queues, filename, paused, stopped):
                 if len(args[0]) > MAX_FILENAME:
                     uart.write(bytearray('x: u - filename too long'.encode()))
                     continue
-                # read bytes until newline
-                with open('hpgl/' + args[0], 'w') as file:
+                # read bytes until newline, one at a time so a command after it is kept
+                timed_out = False
+                with open('hpgl/' + args[0], 'wb') as file:
+                    buff = bytearray()
+                    last = pyb.millis()
                     c = uart.readchar()
-                    while c != '\n':
-                        # write to file
-                        file.write(chr(c))
+                    while c != ord('\n'):
+                        if c < 0:
+                            # the PC stopped sending before the newline
+                            if pyb.elapsed_millis(last) > UPLOAD_TIMEOUT:
+                                uart.write(bytearray('x: u - timed out'.encode()))
+                                timed_out = True
+                                break
+                            # let the other tasks run while the rest arrives
+                            yield
+                        else:
+                            last = pyb.millis()
+                            buff.append(c)
+                            if len(buff) >= UPLOAD_CHUNK:
+                                file.write(buff)
+                                buff = bytearray()
                         c = uart.readchar()
+                    file.write(buff)
+                # do not leave a partial file to be drawn
+                if timed_out:
+                    os.remove('hpgl/' + args[0])
 
             # pause command (p)
             elif command == 'p':
                 # pause scheduling of hpgl and positioning task
+                #   buffered points are kept and run on resume
                 paused.put(1)
             # resume command (r)
             elif command == 'r':
@@ -118,16 +160,14 @@ def task_user_input(queues, filename, paused, stopped):
             # stop command (e)
             elif command == 'e':
                 # clear all shares, triggering e-stop
-                #for queue in queues:
-                #    queue.clear()
-                #filename.clear()
+                filename.clear()
+                flush_points(targets, flush)
                 stopped.put(1)
-                pass
             # home command (h)
             elif command == 'h':
                 # goto 0.0,0.0,0, pre-empting
-                for queue in queues:
-                    queue.put(0)
+                flush_points(targets, flush)
+                targets.put((0.0, 0.0, 0))
             # calibrate command (c)
             #   todo: have positioning task re-calibrate
             elif command == 'c':
@@ -1,19 +1,72 @@
 from StepperDriver import *
+import gc
 import pyb
 
 from NerfDriver import Nerf, OutOfAmmo, BarrelJam
 
 
-def demo():
-    # SCK2, MISO2, MOSI2
-    spi_bus = pyb.SPI(2, pyb.SPI.CONTROLLER, baudrate=1000000, polarity=1, phase=1, firstbit=pyb.SPI.MSB)
-    print(spi_bus)
+def legacy_rw_value(controller, rw, reg, data):
+    # rw_value as it was, allocating a buffer for every datagram
+    if rw:
+        data = 0
+
+    buff = bytearray(4)
+
+    buff[0] = (reg & 0x3F) << 1 | rw & 0x01
+    buff[1] = (data & 0xFF0000) >> 16
+    buff[2] = (data & 0x00FF00) >> 8
+    buff[3] = data & 0x0000FF
 
+    controller.cs.value(0)
+    controller.spi_bus.send_recv(buff, buff)
+    controller.cs.value(1)
+
+    status = buff[0]
+    data = (buff[1] << 16) | (buff[2] << 8) | buff[3]
+
+    return status, data
+
+
+def start_clock():
     # TIM1_CH2N -> PB0
     tmr = pyb.Timer(1, period=3, prescaler=0)
     clk = pyb.Pin('B0', pyb.Pin.OUT_PP)
     # 20 MHz clock
-    ch = tmr.channel(2, pin=clk, mode=pyb.Timer.PWM, pulse_width=2)
+    return tmr.channel(2, pin=clk, mode=pyb.Timer.PWM, pulse_width=2)
+
+
+def benchmark(n=2000):
+    # SCK2, MISO2, MOSI2
+    spi_bus = pyb.SPI(2, pyb.SPI.CONTROLLER, baudrate=1000000, polarity=1, phase=1, firstbit=pyb.SPI.MSB)
+    # the TMC4210 doesn't answer without its clock, as in main.py
+    ch = start_clock()
+    controller = StepperDriver(spi_bus, 'C6', 'C7').controller
+
+    tests = (('legacy rw_value', lambda: legacy_rw_value(controller, 1, X_ACTUAL, 0)),
+             ('rw_value', lambda: controller.rw_value(1, X_ACTUAL, 0)),
+             ('read', lambda: controller.read(X_ACTUAL)),
+             ('get_actual_position', controller.get_actual_position))
+
+    # transactions per second and bytes allocated by each
+    for name, test in tests:
+        gc.collect()
+        gc.disable()
+        free = gc.mem_free()
+        start = pyb.micros()
+        for i in range(n):
+            test()
+        elapsed = pyb.elapsed_micros(start)
+        used = free - gc.mem_free()
+        gc.enable()
+        print(name + ': ' + str(n * 1000000 // elapsed) + ' transfers/s, ' + str(used // n) + ' bytes/transfer')
+
+
+def demo():
+    # SCK2, MISO2, MOSI2
+    spi_bus = pyb.SPI(2, pyb.SPI.CONTROLLER, baudrate=1000000, polarity=1, phase=1, firstbit=pyb.SPI.MSB)
+    print(spi_bus)
+
+    ch = start_clock()
 
     # Stepper driver instance for both DOF
     polar = StepperDriver(spi_bus, 'C6', 'C7')
@@ -62,7 +115,7 @@ def demo():
         azimuthal.set_target_angle(phi)
 
         # wait for target to be reached before prompting for new input
-        while not polar.is_target_reached() and not azimuthal.is_target_reached():
+        while not (polar.is_target_reached() and azimuthal.is_target_reached()):
             pass
 
         # fire if set
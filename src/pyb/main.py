@@ -16,7 +16,7 @@
 from task import task_share, cotask
 
 from UserInput import MAX_FILENAME, task_user_input
-from ProcessesHPGL import task_process_hpgl
+from ProcessesHPGL import TARGET, task_process_hpgl
 from Positioning import task_positioning
 
 import micropython, pyb
@@ -26,34 +26,45 @@ pyb.repl_uart(None)
 
 filename = task_share.Queue('B', MAX_FILENAME)
 
-# todo: overwrite True vs clear then write
-polar_angle = task_share.Queue('f', 1)
-azimuthal_angle = task_share.Queue('f', 1)
-fire = task_share.Queue('B', 1)
+# number of solved targets buffered ahead of positioning
+LOOKAHEAD = 16
+
+# (polar, azimuthal, flags) targets
+targets = task_share.RecordQueue(TARGET, LOOKAHEAD, name='Targets')
 
 paused = task_share.Share('B')
 stopped = task_share.Share('B')
 stopped.put(1)
+# incremented whenever buffered targets are thrown away
+flush = task_share.Share('H')
 
 
 def main(): 
     '''!@brief      This function uses cotask to link all the tasks together. 
     '''
-    user_input_task = cotask.Task(task_user_input((polar_angle, azimuthal_angle, fire), filename, paused, stopped), 'User Input Task', 1, 4, True, False)
-    process_hpgl_task = cotask.Task(task_process_hpgl(filename, (polar_angle, azimuthal_angle, fire)), 'Process HPGL Task', 1, 4, True, False)
-    positioning_task = cotask.Task(task_positioning((polar_angle, azimuthal_angle, fire), paused, stopped), 'Positioning Task', 1, 4, True, False)
+    user_input_task = cotask.Task(task_user_input(targets, filename, paused, stopped, flush), 'User Input Task', 1, 4, True, False)
+    process_hpgl_task = cotask.Task(task_process_hpgl(filename, targets, flush), 'Process HPGL Task', 1, 4, True, False)
+    positioning_task = cotask.Task(task_positioning(targets, paused, stopped, flush), 'Positioning Task', 1, 4, True, False)
 
     cotask.task_list.append(user_input_task)
     cotask.task_list.append(process_hpgl_task)
     cotask.task_list.append(positioning_task)
 
+    # wake tasks as soon as the data they are waiting on changes
+    filename.add_waiter(process_hpgl_task)
+    targets.add_waiter(process_hpgl_task)
+    targets.add_waiter(positioning_task)
+    stopped.add_waiter(positioning_task)
+    flush.add_waiter(positioning_task)
+
     while True:
         # if paused, only schedule user input task
         if paused.get():
-            user_input_task.schedule()
-        # otherwise, do priority scheduling
+            if not user_input_task.schedule():
+                pyb.wfi()
+        # otherwise, do priority scheduling, sleeping when nothing is ready
         else:
-            cotask.task_list.pri_sched()
+            cotask.task_list.sleep_sched()
 
 
 if __name__ == '__main__':
@@ -31,6 +31,13 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import gc                              # Memory allocation garbage collector
 import utime                           # Micropython version of time library
 import micropython                     # This shuts up incorrect warnings
+import pyb                             # Used to sleep until an interrupt
+
+
+## The task whose code is being run by the scheduler right now, or @c None
+#  between tasks. A task can use this to hand its own @c go() method to an 
+#  interrupt or a queue so that it is woken up when something happens.
+running = None
 
 
 class Task:
@@ -66,6 +73,17 @@ class Task:
           while True: 
               cotask.task_list.pri_sched ()
       @endcode
+
+    Tasks don't have to be run on a timer. A task which is waiting for data
+    from a queue or share, or for an interrupt, can instead be woken up by
+    it, and @c TaskList.sleep_sched() lets the processor sleep while no task
+    has anything to do:
+      @code
+          task2 = cotask.Task (task2_fun, name = 'Task 2', priority = 2)
+          my_queue.add_waiter (task2)
+          pyb.ExtInt ('C13', pyb.ExtInt.IRQ_FALLING, pyb.Pin.PULL_UP, 
+                      task2.go)
+      @endcode
       """
 
 
@@ -154,7 +172,13 @@ class Task:
                 stime = utime.ticks_us ()
 
             # Run the method belonging to the state which should be run next
-            curr_state = next (self._run_gen)
+            global running
+            running = self
+            try:
+                curr_state = next (self._run_gen)
+            finally:
+                # Clear it even if the task raised, so it is not blamed later
+                running = None
 
             # If profiling or tracing, save timing data
             if self._prof or self._trace:
@@ -266,11 +290,17 @@ class Task:
         return (tr_str)
 
 
-    def go (self):
+    def go (self, source = None):
         """!
         Method to set a flag so that this task indicates that it's ready to run.
         This method may be called from an interrupt service routine or from
         another task which has data that this task needs to process soon.
+        It can be given directly as the callback of an interrupt, such as
+        @c pyb.ExtInt or @c UART.irq(), to make the task wait on that
+        interrupt; queues and shares call it for tasks which were added with
+        their @c add_waiter() method.
+        @param source The object which triggered the interrupt, if any; it
+               is ignored
         """
         self.go_flag = True
 
@@ -382,6 +412,8 @@ class TaskList:
         This scheduler runs tasks in a priority based fashion. Each time it is
         called, it finds the highest priority task which is ready to run and
         calls that task's @c run() method.
+
+        @return @c True if a task was run or @c False if none was ready
         """
         # Go down the list of priorities, beginning with the highest
         for pri in self.pri_list:
@@ -397,7 +429,27 @@ class TaskList:
                 if pri[1] >= length:
                     pri[1] = 2
                 if ran:
-                    return
+                    return True
+        return False
+
+
+    def sleep_sched (self):
+        """!
+        Run tasks according to their priorities, sleeping when none is ready.
+
+        This scheduler works like @c pri_sched(), but if no task is ready to
+        run, the processor is put to sleep until the next interrupt rather
+        than checking every task again straight away. Interrupts include
+        the system tick, so tasks which run on a timer are still run on
+        time, and tasks woken by an interrupt or a queue run as soon as the
+        interrupt has been handled.
+
+        @return @c True if a task was run or @c False if none was ready
+        """
+        if self.pri_sched ():
+            return True
+        pyb.wfi ()
+        return False
 
 
     def __repr__ (self):
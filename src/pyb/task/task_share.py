@@ -24,7 +24,9 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import array
 import gc
+import struct
 import pyb
+import utime
 import micropython
 
 
@@ -71,10 +73,53 @@ class BaseShare:
         self._type_code = type_code
         self._thread_protect = thread_protect
 
+        # Tasks to be woken up whenever data is put in or taken out
+        self._waiters = []
+
+        ## Microseconds the last @c put_wait() or @c get_wait() spent waiting
+        self.last_wait = 0
+        ## Total microseconds spent waiting in @c put_wait() and @c get_wait()
+        self.total_wait = 0
+
         # Add this queue to the global share and queue list
         share_list.append (self)
 
 
+    def add_waiter (self, task):
+        """!
+        Wake up a task whenever data is put into or taken out of this queue
+        or share.
+
+        The task's @c go() method is called, so a task which blocks on this
+        queue or share gets to run as soon as there is something for it to
+        do rather than at its next period. This also happens when data is
+        put in from an interrupt service routine.
+        @param task The @c cotask.Task to be woken up
+        """
+        if task not in self._waiters:
+            self._waiters.append (task)
+
+
+    @micropython.native
+    def _notify (self):
+        """!
+        Wake up the tasks which were added with @c add_waiter().
+        """
+        for task in self._waiters:
+            task.go ()
+
+
+    def _waited (self, start):
+        """!
+        Record how long a task waited on this queue or share.
+        @param start The time in microseconds at which the wait started
+        @return The time in microseconds which was spent waiting
+        """
+        self.last_wait = utime.ticks_diff (utime.ticks_us (), start)
+        self.total_wait += self.last_wait
+        return self.last_wait
+
+
 # ============================================================================
 
 class Queue (BaseShare):
@@ -213,6 +258,9 @@ class Queue (BaseShare):
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (_irq_state)
 
+        # Wake any tasks which are waiting on this queue
+        self._notify ()
+
 
     @micropython.native
     def get (self, in_ISR = False):
@@ -258,6 +306,56 @@ class Queue (BaseShare):
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (irq_state)
 
+        # Wake any tasks which are waiting on this queue
+        self._notify ()
+
+        return (to_return)
+
+
+    def put_wait (self, item):
+        """!
+        Put an item into the queue, giving up the CPU while it's full.
+
+        This is a generator for use in cooperatively scheduled tasks. Rather
+        than spinning in @c put() while the queue is full, which would never
+        let the task which empties the queue run, it yields until there is
+        room (or straight away if the queue may overwrite old data):
+        @code
+        |   def some_task ():
+        |       while True:
+        |           waited = yield from my_queue.put_wait (create_something_to_put ())
+        |           yield 0
+        @endcode
+        @param item The item to be placed into the queue
+        @return The time in microseconds spent waiting for room
+        """
+        start = utime.ticks_us ()
+        while self.full () and not self._overwrite:
+            yield
+        self.put (item)
+        return self._waited (start)
+
+
+    def get_wait (self):
+        """!
+        Read an item from the queue, giving up the CPU while it's empty.
+
+        This is a generator for use in cooperatively scheduled tasks which
+        yields until there is something in the queue, then returns it:
+        @code
+        |   def some_task ():
+        |       while True:
+        |           something = yield from my_queue.get_wait ()
+        |           yield 0
+        @endcode
+        The time spent waiting is kept in @c last_wait.
+        @return The item read from the queue
+        """
+        start = utime.ticks_us ()
+        while self.empty ():
+            yield
+        to_return = self.get ()
+        self._waited (start)
         return (to_return)
 
 
@@ -318,6 +416,9 @@ class Queue (BaseShare):
         self._num_items = 0
         self._max_full = 0
 
+        # Wake any tasks which are waiting for room in this queue
+        self._notify ()
+
 
     def __repr__ (self):
         """!
@@ -330,6 +431,365 @@ class Queue (BaseShare):
                 type_code_strings[self._type_code], self._max_full, self._size))
 
 
+# ============================================================================
+
+class RecordQueue (BaseShare):
+    """!
+    A queue which transfers fixed-layout records from one task to another.
+
+    Where a @c Queue carries single numbers, each item in a record queue is a
+    whole record laid out by a @c struct format string, such as a position
+    and a flag which must always travel together. All records are stored in
+    one buffer which is allocated when the queue is created, so putting and
+    getting a record doesn't allocate memory for the queue, and each record
+    is transferred with a single interrupt disable/enable pair. 
+
+    An example of the creation and use of a record queue is as follows:
+
+    @code
+    import task_share
+
+    # This queue holds records of two floats and an unsigned byte
+    my_queue = task_share.RecordQueue ('<ffB', 16, name="My Records")
+
+    # Somewhere in one task, put a record into the queue
+    my_queue.put ((1.0, 2.0, 1))
+
+    # In another task, read the record from the queue
+    x, y, flag = my_queue.get ()
+    @endcode
+    """
+    ## A counter used to give serial numbers to queues for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, fmt, size, thread_protect = False, 
+                  overwrite = False, name = None):
+        """!
+        Initialize a record queue to carry and buffer records between tasks.
+
+        @param fmt The @c struct format string of each record
+        @param size The maximum number of records which the queue can hold
+        @param thread_protect @c True if mutual exclusion protection is used
+        @param overwrite If @c True, oldest records will be overwritten with
+               new records if the queue becomes full 
+        @param name A short name for the queue, default @c RecordQueueN where
+               @c N is a serial number for the queue
+        """
+        # First call the parent class initializer
+        super ().__init__ (fmt, thread_protect, name)
+
+        self._size = size
+        self._overwrite = overwrite
+        self._name = str (name) if name != None \
+            else 'RecordQueue' + str (RecordQueue.ser_num)
+        RecordQueue.ser_num += 1
+
+        ## The number of bytes taken up by each record
+        self.record_size = struct.calcsize (fmt)
+
+        # Allocate memory in which the queue's records will be stored
+        self._buffer = bytearray (self.record_size * size)
+        self._view = memoryview (self._buffer)
+
+        # Initialize pointers to be used for reading and writing data
+        self.clear ()
+
+        # Since we may have allocated a bunch of memory, call the garbage
+        # collector to neaten up what memory is left for future use
+        gc.collect ()
+
+
+    @micropython.native
+    def put (self, record, in_ISR = False):
+        """!
+        Put a record into the queue.
+
+        If there isn't room for the record, wait (blocking the calling 
+        process) until room becomes available, unless the @c overwrite 
+        constructor parameter was set to @c True to allow old data to be 
+        clobbered, the same as @c Queue.put().
+        @param record A tuple with one item for each field of the format
+        @param in_ISR Set this to @c True if calling from within an ISR
+        """
+        if self.full ():
+            if in_ISR:
+                return
+
+            # Wait (if needed) until there's room in the buffer for the data
+            if not self._overwrite:
+                while self.full ():
+                    pass
+
+        # Prevent data corruption by blocking interrupts during data transfer
+        if self._thread_protect and not in_ISR:
+            _irq_state = pyb.disable_irq ()
+
+        # Write the record and advance the counts and pointers
+        struct.pack_into (self._type_code, self._buffer,
+                          self._wr_idx * self.record_size, *record)
+        self._advance_write (1)
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (_irq_state)
+
+        # Wake any tasks which are waiting on this queue
+        self._notify ()
+
+
+    @micropython.native
+    def get (self, in_ISR = False):
+        """!
+        Read a record from the queue.
+
+        If there isn't anything in there, wait (blocking the calling process)
+        until something becomes available, the same as @c Queue.get().
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return A tuple with one item for each field of the format
+        """
+        # Wait until there's something in the queue to be returned
+        while self.empty ():
+            pass
+
+        # Prevent data corruption by blocking interrupts during data transfer
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        # Get the record to be returned from the queue
+        to_return = struct.unpack_from (self._type_code, self._buffer,
+                                        self._rd_idx * self.record_size)
+        self._advance_read (1)
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Wake any tasks which are waiting on this queue
+        self._notify ()
+
+        return (to_return)
+
+
+    def peek (self):
+        """!
+        Read the next record without removing it from the queue.
+
+        This lets a task look ahead at what's coming before deciding whether
+        to take it. It never waits.
+        @return A tuple with one item for each field of the format, or
+                @c None if the queue is empty
+        """
+        if self.empty ():
+            return None
+        return struct.unpack_from (self._type_code, self._buffer,
+                                   self._rd_idx * self.record_size)
+
+
+    def put_wait (self, record):
+        """!
+        Put a record into the queue, giving up the CPU while it's full.
+
+        This is a generator for use in cooperatively scheduled tasks. Rather
+        than spinning in @c put() while the queue is full, which would never
+        let the task which empties the queue run, it yields until there is
+        room (or straight away if the queue may overwrite old data):
+        @code
+        |   def some_task ():
+        |       while True:
+        |           waited = yield from my_queue.put_wait ((x, y, flag))
+        |           yield 0
+        @endcode
+        @param record The record to be placed into the queue
+        @return The time in microseconds spent waiting for room
+        """
+        start = utime.ticks_us ()
+        while self.full () and not self._overwrite:
+            yield
+        self.put (record)
+        return self._waited (start)
+
+
+    def get_wait (self):
+        """!
+        Read a record from the queue, giving up the CPU while it's empty.
+
+        This is a generator for use in cooperatively scheduled tasks which
+        yields until there is something in the queue, then returns it:
+        @code
+        |   def some_task ():
+        |       while True:
+        |           something = yield from my_queue.get_wait ()
+        |           yield 0
+        @endcode
+        The time spent waiting is kept in @c last_wait.
+        @return The record read from the queue
+        """
+        start = utime.ticks_us ()
+        while self.empty ():
+            yield
+        to_return = self.get ()
+        self._waited (start)
+        return (to_return)
+
+
+    def put_many (self, data, count, in_ISR = False):
+        """!
+        Copy records which are already packed into the queue.
+
+        The records are copied as raw bytes, so they must have been packed
+        with the same format as the queue. Only as many records as there is
+        room for are copied; nothing is overwritten and this never waits.
+        @param data A buffer or @c memoryview holding at least @c count
+               packed records
+        @param count The number of records in @c data
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of records which were copied
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        count = min (count, self._size - self._num_items)
+        self._copy (data, count, True)
+        self._advance_write (count)
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Wake any tasks which are waiting on this queue
+        self._notify ()
+
+        return count
+
+
+    def get_many (self, out, in_ISR = False):
+        """!
+        Copy as many packed records out of the queue as will fit in a buffer.
+
+        This never waits; if the queue is empty, nothing is copied.
+        @param out A writable buffer or @c memoryview for the records
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of records which were copied
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        count = min (len (out) // self.record_size, self._num_items)
+        self._copy (out, count, False)
+        self._advance_read (count)
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Wake any tasks which are waiting on this queue
+        self._notify ()
+
+        return count
+
+
+    def _copy (self, other, count, into):
+        """!
+        Copy records between the ring buffer and another buffer.
+
+        The copy is split in two where it wraps around the end of the ring.
+        @param other The buffer to copy from (@c into is @c True) or to
+        @param count The number of records to copy
+        @param into @c True to copy into the queue, @c False to copy out
+        """
+        idx = self._wr_idx if into else self._rd_idx
+        first = min (count, self._size - idx) * self.record_size
+        total = count * self.record_size
+        start = idx * self.record_size
+        other = memoryview (other)
+        if into:
+            self._view[start:start + first] = other[:first]
+            self._view[:total - first] = other[first:total]
+        else:
+            other[:first] = self._view[start:start + first]
+            other[first:total] = self._view[:total - first]
+
+
+    @micropython.native
+    def _advance_write (self, count):
+        """!
+        Advance the write pointer and the count after records were written.
+        @param count The number of records which were written
+        """
+        self._wr_idx = (self._wr_idx + count) % self._size
+        self._num_items += count
+        if self._num_items >= self._size:        # Can't be fuller than full
+            self._num_items = self._size
+            self._rd_idx = self._wr_idx
+        if self._num_items > self._max_full:     # Record maximum fillage
+            self._max_full = self._num_items
+
+
+    @micropython.native
+    def _advance_read (self, count):
+        """!
+        Advance the read pointer and the count after records were read.
+        @param count The number of records which were read
+        """
+        self._rd_idx = (self._rd_idx + count) % self._size
+        self._num_items -= count
+
+
+    @micropython.native
+    def any (self):
+        """!
+        Check if there are any records in the queue.
+        @return @c True if records are in the queue, @c False if not
+        """
+        return (self._num_items > 0)
+
+
+    @micropython.native
+    def empty (self):
+        """!
+        Check if the queue is empty.
+        @return @c True if queue is empty, @c False if it's not empty
+        """
+        return (self._num_items <= 0)
+
+
+    @micropython.native
+    def full (self):
+        """!
+        Check if the queue is full.
+        @return @c True if the queue is full
+        """
+        return (self._num_items >= self._size)
+
+
+    @micropython.native
+    def num_in (self):
+        """!
+        Check how many records are in the queue.
+        @return The number of records in the queue
+        """
+        return (self._num_items)
+
+
+    def clear (self):
+        """!
+        Remove all contents from the queue.
+        """
+        self._rd_idx = 0
+        self._wr_idx = 0
+        self._num_items = 0
+        self._max_full = 0
+
+        # Wake any tasks which are waiting for room in this queue
+        self._notify ()
+
+
+    def __repr__ (self):
+        """!
+        This method puts diagnostic information about the queue into a string.
+        """
+        return ('{:<12s} Queue<{:s}> Max Full {:d}/{:d}'.format (self._name,
+                self._type_code, self._max_full, self._size))
+
+
 # ============================================================================
 
 class Share (BaseShare):
@@ -416,6 +876,9 @@ class Share (BaseShare):
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (irq_state)
 
+        # Wake any tasks which are waiting on this share
+        self._notify ()
+
 
     @micropython.native
     def get (self, in_ISR = False):